@@ -3,6 +3,26 @@ Model for Algebraic Data Types (ADTs) and terms.
 """
 # Aurelien Coet, 2018.
 
+import heapq
+import time
+from collections import deque
+from contextlib import contextmanager
+from alpyne import profiling
+from alpyne.exceptions import ReductionException
+
+# Normal forms of the condition terms evaluated during the normalization in
+# progress, as a (rewrite rules, {term: normal form}) tuple, or None when no
+# term is being reduced.
+_condition_cache = None
+
+# Indexes of the rules of the last lists of rewrite rules reduced with the
+# strategies other than innermost, by tuple of the rules of the lists.
+_rule_indexes = {}
+
+# Innermost budget of rewrite steps and time of the reductions in progress,
+# or None if they aren't limited.
+_budget = None
+
 
 class Singleton(type):
     _instances = {}
@@ -27,6 +47,8 @@ class Sort(object):
         assert type(name) == str, "Name of a sort must be a string"
         self.name = name
         self.rewrite_rules = []
+        self.expand = None
+        self.printer = None
 
     def __str__(self):
         return self.name
@@ -86,6 +108,57 @@ class Sort(object):
                 "Conditions must contain terms"
         self.rewrite_rules.append(RewriteRule(lhs, rhs, conditions))
 
+    def native_rule(self, lhs, function, conditions=[]):
+        """
+        Create a new native rewrite rule for the sort, where the right hand
+        side is computed by a Python function.
+
+        Args:
+            lhs: The left hand side of the rule.
+            function: The function computing the right hand side of the rule
+                (see NativeRule).
+            conditions: The conditions of the rule.
+        """
+        self.rewrite_rules.append(NativeRule(lhs, function, conditions))
+
+    def literal_expansion(self, function):
+        """
+        Define how the literals of the sort are expanded into terms headed by
+        one of its operations, so that they can be matched against patterns
+        such as append(s, c) for strings.
+
+        Args:
+            function: A function taking the value of a literal and returning
+                an equivalent term with an operation as head (with literals
+                or other terms as arguments), or None if the literal cannot
+                be expanded.
+        """
+        assert callable(function), "Expansion function must be callable"
+        self.expand = function
+
+    def pretty_printer(self, function):
+        """
+        Define a compact representation of some terms of the sort, used by
+        Term.pretty (for example, decimal numbers for naturals).
+
+        Args:
+            function: A function taking a term of the sort and returning its
+                compact representation, or None if the term must be printed
+                normally. The function must not print the subterms of the
+                term it is given, to keep printing linear.
+        """
+        assert callable(function), "Printer function must be callable"
+        self.printer = function
+
+    def literal(self, value):
+        """
+        Create a ground term of the sort holding a Python value.
+
+        Args:
+            value: The (hashable) value of the literal.
+        """
+        return Term(Literal(value, self))
+
 
 class GenericSort(Sort, metaclass=Singleton):
     """
@@ -101,6 +174,74 @@ class GenericSort(Sort, metaclass=Singleton):
         super().__init__('anysort')
 
 
+class Signature(object):
+    """
+    Signature composing several sorts and their rewrite rules.
+
+    The rules of the sorts are gathered once, in the order of the sorts,
+    and rules shared by several sorts (like the rules of chars, which are
+    also rules of strings) are only kept once. A signature can be used
+    wherever a list of rewrite rules is expected: when it is used to reduce
+    a term with the innermost strategy, each rule is only tried on the
+    subterms of the sort of its left hand side, so that the rules of the
+    other sorts of the signature don't add to the cost of the reduction.
+
+    The rules added to the sorts after the creation of the signature are
+    not part of it.
+
+    Args:
+        sorts: The sorts of the signature.
+    """
+
+    def __init__(self, *sorts):
+        for sort in sorts:
+            assert isinstance(sort, Sort),\
+                "A signature must be composed of sorts"
+        self.sorts = list(sorts)
+        self.rewrite_rules = []
+        seen = set()
+        for sort in sorts:
+            for rule in sort.rewrite_rules:
+                if id(rule) not in seen:
+                    seen.add(id(rule))
+                    self.rewrite_rules.append(rule)
+
+        # Rules with the sort of the terms they can be applied on (None for
+        # any sort), the symbol (operation or sort) a term must contain for
+        # them to be applied on it (None if they can be applied on any
+        # term), and the symbols their right hand side can introduce (None
+        # if they can't be known in advance).
+        self._dispatch = []
+        for rule in self.rewrite_rules:
+            head = rule.lhs.head
+            sort = rule.lhs.sort
+            if type(sort) == GenericSort:
+                sort = key = None
+            elif type(head) == Operation and sort.expand is None:
+                key = head
+            else:
+                # Literals of the sort can be expanded into any operation.
+                key = sort
+            produced = None
+            if type(rule) == RewriteRule:
+                produced = _symbols(rule.rhs, True)
+            self._dispatch.append((rule, sort, key, produced))
+        self._index = None
+
+    def __str__(self):
+        return "signature({})".format(", ".join(str(sort)
+                                                for sort in self.sorts))
+
+    def __iter__(self):
+        return iter(self.rewrite_rules)
+
+    def __len__(self):
+        return len(self.rewrite_rules)
+
+    def __getitem__(self, index):
+        return self.rewrite_rules[index]
+
+
 class Operation(object):
     """
     Operation in an ADT.
@@ -109,6 +250,8 @@ class Operation(object):
     as input and returns a value of a given sort.
     """
 
+    __slots__ = ('name', 'signature', 'sort')
+
     def __init__(self, name, signature, sort):
         assert type(name) == str, "Name of an operation must be a string"
         assert type(signature) == tuple,\
@@ -126,12 +269,15 @@ class Operation(object):
         if type(other) != Operation:
             return False
 
-        for attr, value in self.__dict__.items():
-            if value != other.__dict__[attr]:
+        for attr in self.__slots__:
+            if getattr(self, attr) != getattr(other, attr):
                 return False
 
         return True
 
+    def __hash__(self):
+        return hash((self.name, self.signature, self.sort))
+
     def __str__(self):
         txt = "{}.{}(".format(self.sort, self.name)
         for s in self.signature:
@@ -154,6 +300,8 @@ class Variable(object):
     in a term.
     """
 
+    __slots__ = ('name', 'sort')
+
     def __init__(self, name, sort):
         assert type(name) == str, "Name of a variable must be a string"
         assert isinstance(sort,  Sort),\
@@ -171,14 +319,113 @@ class Variable(object):
         return Term(self)
 
 
+def _transform(term, function):
+    """
+    Rebuild a term bottom-up with an explicit stack, so that terms of
+    arbitrary depth can be traversed without hitting the recursion limit.
+
+    Args:
+        term: The term to transform.
+        function: A function taking a subterm and the tuple of its already
+            transformed arguments, and returning the transformed subterm.
+
+    Returns:
+        The result of the application of the function on the root of the
+        term.
+    """
+    results = []
+    stack = [(term, False)]
+    while stack:
+        t, visited = stack.pop()
+        if visited:
+            arity = len(t.args)
+            if arity:
+                args = tuple(results[-arity:])
+                del results[-arity:]
+            else:
+                args = ()
+            results.append(function(t, args))
+        else:
+            stack.append((t, True))
+            for arg in reversed(t.args):
+                stack.append((arg, False))
+    return results[0]
+
+
+def _expand(term, head):
+    """
+    Expand a literal term into a term with some operation as head, using the
+    expansion function of the literal's sort. Returns None if the literal
+    cannot be expanded into a term with that head.
+    """
+    if type(head) != Operation or term.sort.expand is None:
+        return None
+    expanded = term.sort.expand(term.head.value)
+    if expanded is None or expanded.head != head:
+        return None
+    return expanded
+
+
+def _rebuild(term, args):
+    """
+    Build a term with the same head as some other term and new arguments.
+    The original term is returned unchanged if all its arguments are the same
+    objects as the new ones, so that unmodified subterms are shared.
+    """
+    for arg, new_arg in zip(term.args, args):
+        if arg is not new_arg:
+            return Term(term.head, args)
+    return term
+
+
+class Literal(object):
+    """
+    Literal of a given sort in an ADT.
+
+    A literal holds a hashable Python value (a string, a persistent map, ...)
+    and can be used as the head of a ground term, so that sorts can store
+    their normal forms natively instead of as chains of operations. Two
+    literals are equal if they have the same sort and equal values.
+    """
+
+    __slots__ = ('value', 'sort')
+
+    def __init__(self, value, sort):
+        assert isinstance(sort, Sort),\
+            "Sort associated to a literal must be an instance of Sort"
+        self.value = value
+        self.sort = sort
+
+    def __eq__(self, other):
+        return type(other) == Literal and self.sort == other.sort\
+            and self.value == other.value
+
+    def __hash__(self):
+        return hash((self.value, self.sort))
+
+    def __str__(self):
+        return "{}.{!r}".format(str(self.sort), self.value)
+
+    def __repr__(self):
+        return str(self)
+
+
 class Term(object):
     """
     Term in an ADT.
+
+    Terms are stored as compact slot-based objects with only their head and
+    arguments: the sort of a term is always the sort of its head. Terms are
+    immutable, and their hash is computed once from their head and the hashes
+    of their arguments when they are created.
     """
 
+    __slots__ = ('head', 'args', '_hash', '_str')
+
     def __init__(self, head, args=()):
-        assert isinstance(head, Operation) or isinstance(head, Variable),\
-            "Head of a term must be a variable or an operation"
+        assert isinstance(head, Operation) or isinstance(head, Variable)\
+            or isinstance(head, Literal),\
+            "Head of a term must be a variable, an operation or a literal"
         if type(head) == Operation:
             assert type(args) == tuple,\
                 "Arguments of an operation in a term must be a tuple of terms"
@@ -189,38 +436,126 @@ class Term(object):
                     assert arg.sort == head.signature[i],\
                         "Arguments sorts must match the head's signature"
         else:
-            assert len(args) == 0, "A variable cannot have arguments"
+            assert len(args) == 0,\
+                "A variable or a literal cannot have arguments"
 
         self.head = head
-        self.sort = head.sort
         self.args = args
+        self._hash = hash((head, args))
+        self._str = None
+
+    @property
+    def sort(self):
+        return self.head.sort
+
+    def __hash__(self):
+        return self._hash
 
     def __eq__(self, other):
-        if type(other) != Term or other.head != self.head:
+        if self is other:
+            return True
+        if type(other) != Term or other._hash != self._hash:
             return False
 
-        for i, operand in enumerate(self.args):
-            if operand != other.args[i]:
+        stack = [(self, other)]
+        while stack:
+            lhs, rhs = stack.pop()
+            if lhs is rhs:
+                continue
+            if lhs._hash != rhs._hash or lhs.head != rhs.head:
                 return False
+            stack.extend(zip(lhs.args, rhs.args))
         return True
 
     def __neq__(self, other):
         return not self == other
 
     def __str__(self):
-        if type(self.head) == Operation:
-            txt = "{}.{}(".format(str(self.head.sort), self.head.name)
-            for i, arg in enumerate(self.args):
-                txt += "{}".format(str(arg))
-                if i < len(self.args)-1:
-                    txt += ", "
-            txt += ")"
-            return txt
-        return str(self.head)
+        if self._str is not None:
+            return self._str
+        parts = []
+        stack = [self]
+        while stack:
+            t = stack.pop()
+            if type(t) == str:
+                parts.append(t)
+            elif type(t.head) == Operation:
+                parts.append("{}.{}(".format(str(t.head.sort), t.head.name))
+                stack.append(")")
+                for i in range(len(t.args)-1, -1, -1):
+                    stack.append(t.args[i])
+                    if i > 0:
+                        stack.append(", ")
+            else:
+                parts.append(str(t.head))
+        self._str = "".join(parts)
+        return self._str
 
     def __repr__(self):
         return str(self)
 
+    def pretty(self, abbreviate=True, max_depth=None, max_length=None):
+        """
+        Get a compact string representation of the term, in time linear in
+        its size.
+
+        Args:
+            abbreviate: Whether the printers of the sorts (see
+                Sort.pretty_printer) must be used, and chains of
+                applications of a same unary operation written op^n(...).
+            max_depth: The depth from which subterms are replaced by "...",
+                or None to print all of them.
+            max_length: The length from which the representation is
+                truncated (and ended with "..."), or None.
+
+        Returns:
+            The representation of the term.
+        """
+        parts = []
+        length = 0
+        stack = [(self, 0)]
+        while stack:
+            item = stack.pop()
+            if type(item) == str:
+                parts.append(item)
+                length += len(item)
+                continue
+            if max_length is not None and length > max_length:
+                break
+            t, depth = item
+            if max_depth is not None and depth >= max_depth:
+                text = "..."
+            elif abbreviate and t.sort.printer is not None:
+                text = t.sort.printer(t)
+            else:
+                text = None
+            if text is None and not t.args:
+                text = str(t)
+            if text is not None:
+                parts.append(text)
+                length += len(text)
+                continue
+
+            count = 1
+            while abbreviate and len(t.args) == 1 and\
+                    t.args[0].head == t.head:
+                t = t.args[0]
+                count += 1
+            text = "{}.{}".format(t.head.sort, t.head.name)
+            if count > 1:
+                text += "^{}".format(count)
+            parts.append(text + "(")
+            length += len(text) + 1
+            stack.append(")")
+            for i in range(len(t.args)-1, -1, -1):
+                stack.append((t.args[i], depth + 1))
+                if i > 0:
+                    stack.append(", ")
+        text = "".join(parts)
+        if max_length is not None and (stack or len(text) > max_length):
+            text = text[:max_length] + "..."
+        return text
+
     def match(self, other):
         """
         Check if two terms match and compute the corresponding variable
@@ -253,44 +588,49 @@ class Term(object):
 
         bindings = {}
 
-        def compare(lhs, rhs):
+        # The pairs of subterms to compare are kept on an explicit stack
+        # and visited depth-first, from left to right.
+        stack = [(self, other)]
+        while stack:
+            lhs, rhs = stack.pop()
             if type(lhs.head) == Variable and type(rhs.head) == Variable:
                 if (lhs.head in bindings and bindings[lhs.head] != rhs)\
                    or (rhs.head in bindings and bindings[rhs.head] != lhs):
-                    return False
-                else:
-                    bindings[lhs.head] = rhs
-                    bindings[rhs.head] = lhs
-                    return True
+                    return (False, bindings)
+                bindings[lhs.head] = rhs
+                bindings[rhs.head] = lhs
 
-            elif type(lhs.head) == Variable and type(rhs.head) == Operation:
+            elif type(lhs.head) == Variable:
                 if lhs.head in bindings and bindings[lhs.head] != rhs:
-                    return False
-                else:
-                    bindings[lhs.head] = rhs
-                    return True
+                    return (False, bindings)
+                bindings[lhs.head] = rhs
 
-            elif type(lhs.head) == Operation and type(rhs.head) == Variable:
+            elif type(rhs.head) == Variable:
                 if rhs.head in bindings and bindings[rhs.head] != lhs:
-                    return False
-                else:
-                    bindings[rhs.head] = lhs
-                    return True
-
-            elif type(lhs.head) == Operation and type(rhs.head) == Operation:
-                if lhs.head == rhs.head:
-                    equivalent = True
-                    for i in range(len(lhs.args)):
-                        equivalent = equivalent and compare(lhs.args[i],
-                                                            rhs.args[i])
-                    return equivalent
-                else:
-                    return False
+                    return (False, bindings)
+                bindings[rhs.head] = lhs
+
+            elif lhs.head == rhs.head:
+                for i in range(len(lhs.args)-1, -1, -1):
+                    stack.append((lhs.args[i], rhs.args[i]))
 
             else:
-                return False
+                # A literal can still match an operation if its sort can
+                # expand it into a term headed by that operation.
+                if type(rhs.head) == Literal:
+                    expanded = _expand(rhs, lhs.head)
+                    if expanded is None:
+                        return (False, bindings)
+                    stack.append((lhs, expanded))
+                elif type(lhs.head) == Literal:
+                    expanded = _expand(lhs, rhs.head)
+                    if expanded is None:
+                        return (False, bindings)
+                    stack.append((expanded, rhs))
+                else:
+                    return (False, bindings)
 
-        return (compare(self, other), bindings)
+        return (True, bindings)
 
     def apply_binding(self, binding):
         """
@@ -309,46 +649,657 @@ class Term(object):
             assert isinstance(value, Term),\
                 "Variable bindings must be terms"
 
-        def rename(t):
+        def rename(t, args):
             if type(t.head) == Variable:
                 return binding[t.head] or t
-            else:
-                args = []
-                for arg in t.args:
-                    args.append(rename(arg))
-                return Term(t.head, tuple(args))
+            return _rebuild(t, args)
 
-        return rename(self)
+        return _transform(self, rename)
 
-    def reduce(self, rewrite_rules):
+    def variables(self):
+        """
+        Get the variables appearing in the term.
+
+        Returns:
+            A set with the variables of the term (empty if it is ground).
+        """
+        variables = set()
+        stack = [self]
+        while stack:
+            t = stack.pop()
+            if type(t.head) == Variable:
+                variables.add(t.head)
+            else:
+                stack.extend(t.args)
+        return variables
+
+    def reduce(self, rewrite_rules, max_steps=None, timeout=None,
+               strategy=None):
         """
         Reduce the term by applying a set of rewrite rules on it until a
         fixpoint is reached. The resulting term is in normal form
         (accordingly to the rewrite rules passed as argument).
 
         Args:
-            rewrite_rules: A list of rewrite rules to be applied on the term
-                in order to reduce it to its normal form.
+            rewrite_rules: A list of rewrite rules or a Signature to be
+                applied on the term in order to reduce it to its normal form.
+            max_steps: The maximum number of rule applications (with the
+                innermost strategy, a rule applied on several subterms of
+                the term in a single pass counts as one step, and each of
+                its applications on the subterms it built in the pass as
+                one more step), including the steps of the reductions of the
+                conditions of the rules, or None for no limit.
+            timeout: The maximum time the reduction can take, in seconds, or
+                None for no limit. The time is checked after each step, and
+                before each traversal of the term by a rule (innermost) or
+                each search of a subterm to rewrite (outermost and lazy),
+                even if no rule applies. A single traversal, search or step
+                (such as a native rule) cannot be interrupted, so the
+                reduction can exceed the timeout by the time it takes.
+            strategy: The order in which the subterms are rewritten:
+                'innermost' (the arguments of a term are reduced before the
+                term itself), 'outermost' (the outermost subterm that can be
+                rewritten is rewritten first), 'lazy' (the arguments of a
+                term are only reduced when a rule needs them, and equal
+                subterms are only reduced once), or a function taking the
+                term, the rewrite rules and a rewrite function (see
+                _rewriter) and returning the normal form of the term. The
+                conditions of the rules are reduced with the same strategy.
+                None uses innermost.
 
         Returns:
             A new term obtained after applying the rewrite rules on the term
             until a fixpoint (normal form) was reached.
+
+        Raises:
+            A ReductionException if the reduction exceeds max_steps or
+            timeout, or the budget of an enclosing reduction or budget
+            context.
         """
-        prev_term = None
-        new_term = Term(self.head, self.args)
-        while new_term != prev_term:
-            prev_term = new_term
-            for rule in rewrite_rules:
-                new_term = rule.apply(new_term, rewrite_rules)
+        profiler = profiling.active()
+        if profiler is not None:
+            profiler.reductions += 1
+
+        # The results of the conditions evaluated during the normalization
+        # are cached, and shared with the nested reductions of the
+        # conditions when they use the same rules.
+        global _condition_cache, _budget
+        outer_cache = _condition_cache
+        outer_budget = _budget
+        if outer_cache is None or outer_cache[0] is not rewrite_rules:
+            _condition_cache = (rewrite_rules, {})
+        if max_steps is not None or timeout is not None:
+            _budget = _Budget(max_steps, timeout, outer_budget)
+        if strategy is None:
+            strategy = 'innermost'
+        try:
+            if strategy == 'innermost' and type(rewrite_rules) == Signature:
+                new_term = _innermost_by_sort(self, rewrite_rules, _budget,
+                                              profiler)
+            elif strategy == 'innermost':
+                new_term = _innermost(self, rewrite_rules, _budget, profiler)
+            else:
+                function = _STRATEGIES.get(strategy, strategy)\
+                    if type(strategy) == str else strategy
+                assert callable(function),\
+                    "Unknown strategy {}".format(strategy)
+                new_term = function(self, rewrite_rules,
+                                    _rewriter(self, rewrite_rules, _budget,
+                                              profiler, strategy))
+        finally:
+            _condition_cache = outer_cache
+            _budget = outer_budget
 
         return new_term
 
 
+def _innermost(term, rewrite_rules, budget, profiler):
+    """
+    Reduce a term with the left-right innermost strategy: each rule is
+    applied bottom-up on the whole term, in turn, until a fixpoint is
+    reached.
+    """
+    prev_term = None
+    new_term = term
+    while new_term != prev_term:
+        if profiler is not None:
+            profiler.passes += 1
+        prev_term = new_term
+        for rule in rewrite_rules:
+            if budget is not None:
+                budget.check(term, new_term)
+            reduced = rule.apply(new_term, rewrite_rules)
+            if budget is not None and reduced is not new_term:
+                budget.spend(rule, term, new_term)
+            new_term = reduced
+    return new_term
+
+
+def _innermost_by_sort(term, signature, budget, profiler):
+    """
+    Reduce a term with the innermost strategy like _innermost, but only try
+    each rule of a signature on the subterms of the sort of its left hand
+    side (which are the only ones it can match), and skip the rules whose
+    left hand side cannot match any subterm of the term.
+    """
+    prev_term = None
+    new_term = term
+    symbols = _symbols(term)
+    while new_term != prev_term:
+        if profiler is not None:
+            profiler.passes += 1
+        prev_term = new_term
+        for rule, sort, key, produced in signature._dispatch:
+            if key is not None and symbols is not None and\
+               key not in symbols:
+                continue
+            if budget is not None:
+                budget.check(term, new_term)
+            stats = None if profiler is None else profiler.rule(rule)
+            reduced = _apply(rule, new_term, signature, sort, stats)
+            if reduced is not new_term:
+                if budget is not None:
+                    budget.spend(rule, term, new_term)
+                if symbols is not None:
+                    if produced is None:
+                        symbols = _symbols(reduced)
+                    else:
+                        symbols |= produced
+            new_term = reduced
+    return new_term
+
+
+def _apply(rule, term, rewrite_rules, sort, stats):
+    """
+    Apply a rule bottom-up on the subterms of a term that have some sort (or
+    on all its subterms if the sort is None), like RewriteRule.apply.
+
+    The subterms built by the rule below the root of the terms it rewrites
+    to are rewritten in the same pass: the subterms bound to the variables
+    of the rule were already visited, so only the other subterms of the new
+    terms are visited. A rule building a new redex of itself below its root,
+    like add(x, succ(y)) -> succ(add(x, y)), is thus applied in a single
+    pass instead of one pass per step. These applications are counted as
+    steps in the budget of the reduction. The roots of the new terms are
+    only rewritten in the next pass, like the other subterms, so that rules
+    such as commutativity rules don't rewrite them back and forth.
+    """
+    results = []
+    # Each entry holds a subterm, the identities of its subterms that were
+    # already visited (the bindings of the rule application that built it,
+    # or None for the subterms of the term), whether its arguments were
+    # visited and whether the rule must be tried on it.
+    stack = [(term, None, False, True)]
+    while stack:
+        t, visited, ready, tried = stack.pop()
+        if not ready:
+            if visited is not None and id(t) in visited:
+                results.append(t)
+                continue
+            stack.append((t, visited, True, tried))
+            for arg in reversed(t.args):
+                stack.append((arg, visited, False, True))
+            continue
+
+        arity = len(t.args)
+        if arity:
+            t = _rebuild(t, tuple(results[-arity:]))
+            del results[-arity:]
+        if not tried or (sort is not None and t.head.sort is not sort and
+                         type(t.head.sort) != GenericSort):
+            results.append(t)
+            continue
+        binding = rule._match(t, rewrite_rules, stats)
+        new = None if binding is None else rule._rhs(binding, rewrite_rules)
+        if new is None:
+            results.append(t)
+            continue
+        if stats is not None:
+            stats.fires += 1
+        if visited is not None and _budget is not None:
+            _budget.spend(rule, term, t)
+        stack.append((new, {id(value) for value in binding.values()},
+                      False, False))
+    return results[0]
+
+
+def _symbols(term, pattern=False):
+    """
+    Get the set of the operations and sorts of the subterms of a term, or
+    None if some of its subterms can match terms with any head (variables,
+    and terms of the generic sort).
+
+    Args:
+        term: The term.
+        pattern: Whether the term is the right hand side of a rule, where
+            the variables stand for subterms of the term being rewritten
+            and are ignored.
+    """
+    symbols = set()
+    stack = [term]
+    while stack:
+        t = stack.pop()
+        head = t.head
+        if type(head) == Variable:
+            if pattern:
+                continue
+            return None
+        if type(head.sort) == GenericSort:
+            return None
+        symbols.add(head.sort)
+        if type(head) == Operation:
+            symbols.add(head)
+        stack.extend(t.args)
+    return symbols
+
+
+def _rewriter(term, rewrite_rules, budget, profiler, strategy):
+    """
+    Build the function used by the strategies to rewrite subterms during the
+    reduction of a term. The function takes a rule and a subterm, and
+    returns the subterm rewritten by the rule at its root, or the subterm
+    itself if the rule cannot be applied on it. The rewrite steps are
+    counted in the budget of the reduction, and the conditions of the rules
+    are reduced with the strategy of the reduction.
+    """
+    def rewrite(rule, subterm):
+        stats = None if profiler is None else profiler.rule(rule)
+        new = rule._rewrite(subterm, rewrite_rules, stats, strategy)
+        if new is not subterm and new == subterm:
+            return subterm
+        if budget is not None and new is not subterm:
+            budget.spend(rule, term, subterm)
+        return new
+
+    return rewrite
+
+
+def _rule_index(rewrite_rules):
+    """
+    Index a list of rewrite rules by the head of their left hand side.
+
+    Returns:
+        A (rules by head, rules applicable to any term, all the rules,
+        strict variables) tuple, where the lists of rules keep the order of
+        the rules in the list, and the strict variables of each rule are the
+        variables bound to normal forms by the lazy strategy.
+    """
+    # Signatures keep their index, the lists of rules share a cache keyed
+    # by their rules (rules are compared by identity), so that lists
+    # modified in place get a new index.
+    signature = type(rewrite_rules) == Signature
+    if signature and rewrite_rules._index is not None:
+        return rewrite_rules._index
+    if not signature:
+        key = tuple(rewrite_rules)
+        index = _rule_indexes.get(key)
+        if index is not None:
+            return index
+
+    groups = {}
+    anywhere = []
+    strict = {}
+    for i, rule in enumerate(rewrite_rules):
+        head = rule.lhs.head
+        # Left hand sides with a variable at their root, or with a literal
+        # that can be expanded, can match terms with any head.
+        if type(head) == Variable or\
+           (type(head) == Literal and head.sort.expand is not None):
+            anywhere.append((i, rule))
+        else:
+            groups.setdefault(head, []).append((i, rule))
+
+        # Native rules need normal forms, and variables appearing several
+        # times in a left hand side must be compared on their normal forms.
+        if type(rule) != RewriteRule:
+            strict[rule] = rule.lhs.variables()
+        else:
+            seen = set()
+            strict[rule] = repeated = set()
+            stack = [rule.lhs]
+            while stack:
+                t = stack.pop()
+                if type(t.head) == Variable:
+                    if t.head in seen:
+                        repeated.add(t.head)
+                    seen.add(t.head)
+                stack.extend(t.args)
+
+    by_head = {head: [rule for _, rule in heapq.merge(group, anywhere)]
+               for head, group in groups.items()}
+    index = (by_head, [rule for _, rule in anywhere], list(rewrite_rules),
+             strict)
+    if signature:
+        rewrite_rules._index = index
+        return index
+    if len(_rule_indexes) >= 8:
+        del _rule_indexes[next(iter(_rule_indexes))]
+    _rule_indexes[key] = index
+    return index
+
+
+def _candidates(index, term):
+    """
+    Get the rules of an index that can be applied at the root of a term.
+    """
+    by_head, anywhere, rules, _ = index
+    head = term.head
+    if type(head) == Operation or\
+       (type(head) == Literal and head.sort.expand is None):
+        return by_head.get(head, anywhere)
+    # Variables match any left hand side, and literals can be expanded.
+    return rules
+
+
+def _outermost(term, rewrite_rules, rewrite):
+    """
+    Reduce a term with the left-right outermost strategy: at each step, the
+    subterms are visited from the root and from left to right, and the
+    first one a rule can rewrite is rewritten.
+    """
+    index = _rule_index(rewrite_rules)
+    original = term
+    while True:
+        if _budget is not None:
+            _budget.check(original, term)
+        # Each entry holds a subterm, the entry of its parent and its index
+        # in the arguments of the parent, to rebuild the term.
+        stack = [(term, None, 0)]
+        while stack:
+            entry = stack.pop()
+            t = entry[0]
+            for rule in _candidates(index, t):
+                new = rewrite(rule, t)
+                if new is not t:
+                    break
+            else:
+                for i in range(len(t.args) - 1, -1, -1):
+                    stack.append((t.args[i], entry, i))
+                continue
+
+            _, parent, i = entry
+            while parent is not None:
+                t = parent[0]
+                new = Term(t.head, t.args[:i] + (new,) + t.args[i + 1:])
+                _, parent, i = parent
+            term = new
+            break
+        else:
+            return term
+
+
+def _lazy(term, rewrite_rules, rewrite):
+    """
+    Reduce a term with a lazy (call-by-need) strategy: rules are tried from
+    the root of the term, and the arguments of a subterm are only reduced to
+    head normal form when the left hand side of a rule needs to compare
+    their heads. The reductions are shared: equal subterms are only reduced
+    once.
+    """
+    index = _rule_index(rewrite_rules)
+    strict = index[3]
+    # Head normal forms and normal forms of the subterms already reduced.
+    heads = {}
+    forms = {}
+
+    def whnf(t):
+        """
+        Reduce a term until no rule can be applied at its root.
+        """
+        reduced = forms.get(t)
+        if reduced is not None:
+            return reduced
+        reduced = heads.get(t)
+        if reduced is not None:
+            # Reusing a reduction counts as a step, so that budgets stop
+            # the expansion of infinite normal forms.
+            if reduced is not t and _budget is not None:
+                _budget.spend(None, term, t)
+            return reduced
+
+        original = t
+        rewritten = True
+        while rewritten:
+            if _budget is not None:
+                _budget.check(term, t)
+            rewritten = False
+            # The rules are first tried without reducing the subterms whose
+            # heads don't match their left hand side, and the subterms are
+            # only reduced if no rule can be applied otherwise.
+            blocked = True
+            for force in (False, True):
+                if not blocked:
+                    break
+                blocked = False
+                for rule in _candidates(index, t):
+                    if type(rule.lhs.head) == Operation and\
+                       rule.lhs.head == t.head:
+                        args = []
+                        for pattern, arg in zip(rule.lhs.args, t.args):
+                            arg, needed = demand(pattern, arg, strict[rule],
+                                                 force)
+                            args.append(arg)
+                            blocked = blocked or needed
+                        t = _rebuild(t, tuple(args))
+                    new = rewrite(rule, t)
+                    if new is not t:
+                        t = new
+                        rewritten = True
+                        break
+                if rewritten:
+                    break
+        heads[original] = t
+        return t
+
+    def demand(pattern, t, variables, force):
+        """
+        Reduce the subterms of a term needed to match it with a pattern.
+
+        Returns:
+            The term with the needed subterms reduced, and whether a subterm
+            whose head doesn't match the pattern wasn't reduced (if force is
+            False).
+        """
+        head = pattern.head
+        if type(head) == Variable:
+            return (normalize(t) if head in variables else t), False
+        if type(head) != Operation:
+            return t, False
+        if t.head != head:
+            if not force:
+                return t, t not in heads and t not in forms
+            t = whnf(t)
+            if t.head != head:
+                return t, False
+        if not t.args:
+            return t, False
+        args = []
+        blocked = False
+        for p, arg in zip(pattern.args, t.args):
+            arg, needed = demand(p, arg, variables, force)
+            args.append(arg)
+            blocked = blocked or needed
+        return _rebuild(t, tuple(args)), blocked
+
+    def normalize(t):
+        """
+        Reduce a term to its normal form, from its root to its leaves.
+        """
+        results = []
+        # Entries are (subterm, head normal form) tuples, with None as head
+        # normal form for subterms not visited yet, or (subterm, None, True)
+        # for subterms whose normal form is on top of the results.
+        stack = [(t, None)]
+        while stack:
+            entry = stack.pop()
+            if len(entry) == 3:
+                forms[entry[0]] = results[-1]
+                continue
+            subterm, head = entry
+            if head is None:
+                reduced = forms.get(subterm)
+                if reduced is not None:
+                    results.append(reduced)
+                    continue
+                head = whnf(subterm)
+                stack.append((subterm, head))
+                for arg in reversed(head.args):
+                    stack.append((arg, None))
+                continue
+
+            arity = len(head.args)
+            if arity:
+                args = tuple(results[-arity:])
+                del results[-arity:]
+                new = _rebuild(head, args)
+            else:
+                new = head
+            # A rule may apply at the root once the arguments are reduced.
+            if new is not head:
+                reduced = whnf(new)
+                if reduced != new:
+                    stack.append((subterm, None, True))
+                    stack.append((reduced, None))
+                    continue
+            forms[subterm] = forms[new] = new
+            results.append(new)
+        return results[0]
+
+    return normalize(term)
+
+
+_STRATEGIES = {'outermost': _outermost, 'lazy': _lazy}
+
+
+@contextmanager
+def budget(max_steps=None, timeout=None):
+    """
+    Limit the rewrite steps and the time of all the reductions run in a
+    context (nested budgets all apply):
+
+        with budget(max_steps=10000, timeout=0.5):
+            first.reduce(rules)
+            second.reduce(rules)
+
+    Args:
+        max_steps: The maximum number of rule applications of the reductions
+            in the context (see Term.reduce), or None for no limit.
+        timeout: The maximum time spent in the reductions of the context, in
+            seconds, or None for no limit.
+
+    Raises:
+        A ReductionException when a reduction exceeds the budget.
+    """
+    global _budget
+    outer_budget = _budget
+    _budget = _Budget(max_steps, timeout, outer_budget)
+    try:
+        yield
+    finally:
+        _budget = outer_budget
+
+
+class _Budget(object):
+    """
+    Budget of rewrite steps and time of reductions.
+    """
+
+    __slots__ = ('max_steps', 'start', 'deadline', 'steps', 'rules',
+                 'parent')
+
+    def __init__(self, max_steps, timeout, parent=None):
+        assert max_steps is None or max_steps >= 0,\
+            "Maximum number of steps must be positive"
+        assert timeout is None or timeout >= 0, "Timeout must be positive"
+        self.max_steps = max_steps
+        self.start = time.monotonic()
+        self.deadline = self.start + timeout if timeout is not None else None
+        self.steps = 0
+        # The last rules applied, reported when the budget is exceeded.
+        self.rules = deque(maxlen=5)
+        # The budget of the enclosing reduction or context, also charged.
+        self.parent = parent
+
+    def spend(self, rule, term, partial):
+        """
+        Count a rewrite step of the reduction of a term in the budget and in
+        the enclosing ones, and abort the reduction if one is exceeded.
+
+        Args:
+            rule: The rule applied, or None for a reused reduction.
+            term: The term being reduced.
+            partial: The term the rule was applied on.
+        """
+        budget = self
+        while budget is not None:
+            budget.steps += 1
+            if rule is not None:
+                budget.rules.append(rule)
+            exceeded = budget.max_steps is not None and\
+                budget.steps > budget.max_steps
+            if budget.deadline is not None or exceeded:
+                now = time.monotonic()
+                if exceeded or now > budget.deadline:
+                    raise ReductionException(term, partial, budget.steps - 1,
+                                             list(budget.rules),
+                                             now - budget.start)
+            budget = budget.parent
+
+    def check(self, term, partial):
+        """
+        Abort the reduction of a term if the time of the budget, or of an
+        enclosing one, is exceeded, without counting a step.
+        """
+        budget = self
+        now = None
+        while budget is not None:
+            if budget.deadline is not None:
+                if now is None:
+                    now = time.monotonic()
+                if now > budget.deadline:
+                    raise ReductionException(term, partial, budget.steps,
+                                             list(budget.rules),
+                                             now - budget.start)
+            budget = budget.parent
+
+
+def _size(term):
+    """
+    Count the number of nodes in a term.
+    """
+    size = 0
+    stack = [term]
+    while stack:
+        t = stack.pop()
+        size += 1
+        stack.extend(t.args)
+    return size
+
+
+def _normal_form(term, rewrite_rules, forms, profiler=None,
+                 strategy=None):
+    """
+    Reduce a term of a condition with a strategy, or get its normal form
+    from a dict of the normal forms already computed.
+    """
+    form = forms.get(term)
+    if form is not None:
+        if profiler is not None:
+            profiler.condition_hits += 1
+        return form
+    if profiler is not None:
+        profiler.condition_reductions += 1
+    form = forms[term] = term.reduce(rewrite_rules, strategy=strategy)
+    return form
+
+
 class RewriteRule(object):
     """
     Rewrite rule for terms in ADTs.
     """
 
+    __slots__ = ('lhs', 'rhs', 'conditions', '_ordered_conditions')
+
     def __init__(self, lhs, rhs, conditions=[]):
         assert isinstance(lhs, Term), "Left hand side must be a term"
         assert isinstance(rhs, Term), "Right hand side must be a term"
@@ -363,6 +1314,10 @@ class RewriteRule(object):
         self.lhs = lhs
         self.rhs = rhs
         self.conditions = conditions
+        # The conditions are evaluated from the cheapest to the most
+        # expensive, estimating their cost by the size of their terms.
+        self._ordered_conditions = sorted(
+            conditions, key=lambda c: _size(c[0]) + _size(c[1]))
 
     def __str__(self):
         txt = ""
@@ -389,23 +1344,125 @@ class RewriteRule(object):
         Returns:
             A new term with where the rewrite rule has been applied.
         """
-        # Recursive application of the rule on the arguments of the term
-        # -> left-right innermost strategy.
-        args = []
-        for arg in term.args:
-            args.append(self.apply(arg))
-
-        new_term = Term(term.head, tuple(args))
-
-        matching, binding = new_term.match(self.lhs)
-        if matching:
-            if self.conditions:
-                for condition in self.conditions:
-                    if condition[0].apply_binding(binding)\
-                                   .reduce(rewrite_rules) !=\
-                       condition[1].apply_binding(binding)\
-                                   .reduce(rewrite_rules):
-                        return new_term
-            return Term(self.rhs.head, self.rhs.args).apply_binding(binding)
+        profiler = profiling.active()
+        stats = None if profiler is None else profiler.rule(self)
+
+        # Application of the rule on the arguments of the term before the
+        # term itself -> left-right innermost strategy.
+        return _apply(self, term, rewrite_rules, None, stats)
+
+    def _rewrite(self, term, rewrite_rules, stats=None, strategy=None):
+        """
+        Apply the rewrite rule at the root of a term if it is possible.
+
+        Args:
+            term: The term to rewrite.
+            rewrite_rules: A list of rewrite rules to use to reduce the
+                conditions of the rule.
+            stats: The profiling statistics of the rule, or None if
+                profiling is disabled.
+            strategy: The strategy used to reduce the conditions of the
+                rule (see Term.reduce).
+
+        Returns:
+            The rewritten term, or the term itself if the rule cannot be
+            applied on it.
+        """
+        binding = self._match(term, rewrite_rules, stats, strategy)
+        if binding is None:
+            return term
+        rhs = self._rhs(binding, rewrite_rules)
+        if rhs is None:
+            return term
+        if stats is not None:
+            stats.fires += 1
+        return rhs
+
+    def _match(self, term, rewrite_rules, stats=None, strategy=None):
+        """
+        Match the left hand side of the rule with a term and check its
+        conditions (see _rewrite).
+
+        Returns:
+            The bindings of the variables of the rule, or None if the rule
+            cannot be applied on the term.
+        """
+        if stats is not None:
+            stats.attempts += 1
+        matching, binding = term.match(self.lhs)
+        if not matching:
+            return None
+
+        if stats is None:
+            satisfied = self._satisfied(binding, rewrite_rules, strategy)
         else:
-            return new_term
+            stats.matches += 1
+            start = profiling.timer()
+            satisfied = self._satisfied(binding, rewrite_rules, strategy)
+            stats.condition_time += profiling.timer() - start
+        if not satisfied:
+            return None
+        return binding
+
+    def _satisfied(self, binding, rewrite_rules, strategy=None):
+        """
+        Check if the conditions of the rule hold for some variable bindings.
+        """
+        cache = _condition_cache
+        if cache is not None and cache[0] is rewrite_rules:
+            forms = cache[1]
+        else:
+            forms = {}
+        profiler = profiling.active()
+
+        for condition in self._ordered_conditions:
+            if profiler is not None:
+                profiler.conditions += 1
+            lhs = condition[0].apply_binding(binding)
+            rhs = condition[1].apply_binding(binding)
+            if lhs == rhs:
+                continue
+            if _normal_form(lhs, rewrite_rules, forms, profiler,
+                            strategy) !=\
+               _normal_form(rhs, rewrite_rules, forms, profiler, strategy):
+                return False
+        return True
+
+    def _rhs(self, binding, rewrite_rules):
+        """
+        Compute the term a match of the rule's left hand side is rewritten
+        to, given the bindings of the match.
+        """
+        return self.rhs.apply_binding(binding)
+
+
+class NativeRule(RewriteRule):
+    """
+    Rewrite rule for terms in ADTs, where the right hand side is computed by
+    a Python function instead of being given as a term.
+
+    The function is called with the bindings of a match of the left hand
+    side and the list of rewrite rules in use, and returns the new term, or
+    None if the rule cannot be applied for these bindings.
+    """
+
+    __slots__ = ('function',)
+
+    def __init__(self, lhs, function, conditions=[]):
+        assert callable(function), "Function of the rule must be callable"
+        super().__init__(lhs, lhs, conditions)
+        self.rhs = None
+        self.function = function
+
+    def __str__(self):
+        txt = ""
+        if self.conditions:
+            for condition in self.conditions:
+                txt += "({} == {}), ".format(str(condition[0]),
+                                             str(condition[1]))
+            txt += "=> "
+        txt += "{} -> {}(...)".format(str(self.lhs), self.function.__name__)
+        return txt
+
+    def _rhs(self, binding, rewrite_rules):
+        return self.function(binding, rewrite_rules)
@@ -0,0 +1,142 @@
+"""
+Adt for the Hash Map Sort.
+
+Contrary to the maps of alpyne.adts.map, the normal forms of non-empty hash
+maps are literals holding a persistent hash map, and the operations on them
+are implemented with native rewrite rules: adding, getting or deleting a key
+takes O(log n) time instead of O(n) rewrites. Keys and values are reduced to
+their normal forms before being stored.
+"""
+
+from alpyne.adt import Sort, GenericSort, Literal
+from alpyne.adts.boolean import boolean
+from alpyne.persistent import PersistentMap
+
+
+# Sort Definition.
+hash_map = Sort('hashmap')
+generic = GenericSort()
+
+
+# ---------- Operations on hash maps ---------- #
+# Generators.
+hash_map.operation('empty', ())
+hash_map.operation('add', (hash_map, generic, generic))
+
+# Observers.
+hash_map.operation('get', (hash_map, generic))
+hash_map.operation('isempty', (hash_map,), boolean)
+hash_map.operation('equal', (hash_map, hash_map), boolean)
+
+# Modifiers.
+hash_map.operation('delete', (hash_map, generic))
+
+# Operations for the generic sort.
+generic.operation('equal', (generic, generic))
+
+
+# ---------- Variables ---------- #
+hash_map.variable('m')
+hash_map.variable('n')
+
+# Generic variables for keys and values.
+generic.variable('k')
+generic.variable('v')
+
+# The generic sort is shared by all the ADTs, and other ADTs (like
+# alpyne.adts.map) declare variables with the same names, replacing these
+# ones in its attributes. The native rules look up their bindings with the
+# variables of their left hand sides, kept here.
+_m = hash_map.m
+_n = hash_map.n
+_k = generic.k
+_v = generic.v
+
+
+# ---------- Native operations ---------- #
+def _entries(term):
+    """
+    Get the persistent map represented by a hash map term in normal form, or
+    None if the term isn't in normal form.
+    """
+    if term is None:
+        return None
+    if term.head == hash_map.empty:
+        return PersistentMap()
+    if type(term.head) == Literal and term.sort == hash_map:
+        return term.head.value
+    return None
+
+
+def _ground(term, rewrite_rules):
+    """
+    Reduce a term to its normal form if it is ground, or return None.
+    """
+    if term is None or term.variables():
+        return None
+    return term.reduce(rewrite_rules)
+
+
+def _from_entries(entries):
+    """
+    Get the normal form of the hash map holding some entries.
+    """
+    if entries:
+        return hash_map.literal(entries)
+    return hash_map.empty()
+
+
+def add(binding, rewrite_rules):
+    entries = _entries(binding.get(_m))
+    key = _ground(binding.get(_k), rewrite_rules)
+    value = _ground(binding.get(_v), rewrite_rules)
+    if entries is None or key is None or value is None:
+        return None
+    return _from_entries(entries.set(key, value))
+
+
+def get(binding, rewrite_rules):
+    entries = _entries(binding.get(_m))
+    key = _ground(binding.get(_k), rewrite_rules)
+    if entries is None or key is None:
+        return None
+    return entries.get(key)
+
+
+def delete(binding, rewrite_rules):
+    entries = _entries(binding.get(_m))
+    key = _ground(binding.get(_k), rewrite_rules)
+    if entries is None or key is None:
+        return None
+    return _from_entries(entries.delete(key))
+
+
+def isempty(binding, rewrite_rules):
+    entries = _entries(binding.get(_m))
+    if entries is None:
+        return None
+    return boolean.false() if entries else boolean.true()
+
+
+def equal(binding, rewrite_rules):
+    entries = _entries(binding.get(_m))
+    other = _entries(binding.get(_n))
+    if entries is None or other is None:
+        return None
+    return boolean.true() if entries == other else boolean.false()
+
+
+# ---------- Rewrite rules ---------- #
+hash_map.native_rule(hash_map.add(hash_map.m(), generic.k(), generic.v()),
+                     add)
+
+hash_map.native_rule(hash_map.get(hash_map.m(), generic.k()), get)
+
+hash_map.native_rule(hash_map.delete(hash_map.m(), generic.k()), delete)
+
+hash_map.native_rule(hash_map.isempty(hash_map.m()), isempty)
+
+hash_map.native_rule(hash_map.equal(hash_map.m(), hash_map.n()), equal)
+
+hash_map.rewrite_rule(generic.equal(hash_map.m(), hash_map.n()),
+                      hash_map.equal(hash_map.m(), hash_map.n()))
@@ -57,3 +57,20 @@ generic.operation('equal', (generic, generic))
 
 nat.rewrite_rule(generic.equal(nat.x(), nat.y()),
                  nat.equal(nat.x(), nat.y()))
+
+
+# ---------- Printing ---------- #
+def pretty(term):
+    """
+    Print the ground naturals succ^n(zero) as decimal numbers.
+    """
+    n = 0
+    while term.head == nat.succ:
+        term = term.args[0]
+        n += 1
+    if term.head == nat.zero:
+        return str(n)
+    return None
+
+
+nat.pretty_printer(pretty)
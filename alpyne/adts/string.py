@@ -1,9 +1,14 @@
 """
 Adt for the String Sort.
+
+Ground strings are reduced to literals holding a Python str (the empty string
+is represented by string.empty()), so that their equality and concatenation
+are computed natively. Literals can still be matched by patterns such as
+append(s, c), and can be created with the from_str function.
 """
 # Aurelien Coet, 2018.
 
-from alpyne.adt import Sort, GenericSort
+from alpyne.adt import Sort, GenericSort, Literal
 from alpyne.adts.boolean import boolean
 
 
@@ -105,7 +110,110 @@ string.variable('s')
 string.variable('t')
 
 
+# ---------- Native strings ---------- #
+def from_str(value):
+    """
+    Get the term in normal form representing a Python string.
+
+    Args:
+        value: A Python string.
+    """
+    assert type(value) == str, "Value must be a string"
+    if value:
+        return string.literal(value)
+    return string.empty()
+
+
+def _value(term):
+    """
+    Get the Python string represented by a ground string in normal form, or
+    None if the term isn't one.
+    """
+    if term is None:
+        return None
+    if term.head == string.empty:
+        return ''
+    if type(term.head) == Literal and term.sort == string:
+        return term.head.value
+    return None
+
+
+def _character(term):
+    """
+    Get the Python character represented by a character term, or None.
+    """
+    if term is None:
+        return None
+    if term.sort == char and not term.args and term.head.name in char_names:
+        return term.head.name
+    return None
+
+
+def expand(value):
+    """
+    Expand a string literal into an append (or empty) term.
+    """
+    if not value:
+        return string.empty()
+    if value[-1] not in char_names:
+        return None
+    return string.append(from_str(value[:-1]), char.__dict__[value[-1]]())
+
+
+def append(binding, rewrite_rules):
+    value = _value(binding.get(string.s))
+    c = _character(binding.get(char.c1))
+    if value is None or c is None:
+        return None
+    return string.literal(value + c)
+
+
+def concat(binding, rewrite_rules):
+    value = _value(binding.get(string.s))
+    other = _value(binding.get(string.t))
+    if value is None or other is None:
+        return None
+    return from_str(value + other)
+
+
+def equal(binding, rewrite_rules):
+    value = _value(binding.get(string.s))
+    other = _value(binding.get(string.t))
+    if value is None or other is None:
+        return None
+    return boolean.true() if value == other else boolean.false()
+
+
+def pretty(term):
+    """
+    Print ground strings (literals, or characters appended to a literal or
+    to the empty string) as quoted Python strings.
+    """
+    characters = []
+    while term.head == string.append:
+        c = _character(term.args[1])
+        if c is None:
+            return None
+        characters.append(c)
+        term = term.args[0]
+    value = _value(term)
+    if value is None:
+        return None
+    return repr(value + "".join(reversed(characters)))
+
+
+char_names = set(chars) | set(c.upper() for c in chars[:26])
+string.literal_expansion(expand)
+string.pretty_printer(pretty)
+
+
 # ---------- Rewrite rules on strings ---------- #
+string.native_rule(string.append(string.s(), char.c1()), append)
+
+string.native_rule(string.concat(string.s(), string.t()), concat)
+
+string.native_rule(string.equal(string.s(), string.t()), equal)
+
 string.rewrite_rules += char.rewrite_rules
 
 # equal(empty, empty) -> true.
@@ -139,4 +247,11 @@ generic.operation('equal', (generic, generic))
 string.rewrite_rule(generic.equal(string.s(), string.t()),
                     string.equal(string.s(), string.t()))
 
-# TODO: concat rewrite rules.
+# concat(s, empty) -> s.
+string.rewrite_rule(string.concat(string.s(), string.empty()), string.s())
+
+# concat(s, append(t, c)) -> append(concat(s, t), c).
+string.rewrite_rule(string.concat(string.s(),
+                                  string.append(string.t(), char.c1())),
+                    string.append(string.concat(string.s(), string.t()),
+                                  char.c1()))
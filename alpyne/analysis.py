@@ -0,0 +1,427 @@
+"""
+Static analysis of lists of rewrite rules.
+
+The analysis looks for the critical pairs of the rules (the terms on which
+two rules, or a rule and itself at another position, overlap and can rewrite
+the same term differently), which hint at non-confluent rule systems, and
+flags the rules that are not left-linear or that may not terminate:
+
+    analysis = Analysis(kv_map.rewrite_rules)
+    print(analysis.report())
+
+The hints are heuristics: a rule flagged as potentially non-terminating can
+be safe in practice (when its conditions prevent loops), and rules are not
+proven terminating when they aren't flagged. Reductions of terms with
+suspicious rules can be bounded with the max_steps argument of Term.reduce.
+"""
+
+from alpyne.adt import GenericSort, Operation, Term, Variable, Literal,\
+    _expand, _rebuild, _transform
+from alpyne.exceptions import ReductionException
+
+
+def _walk(term, bindings):
+    """
+    Follow the bindings of a variable term until an unbound variable or a
+    term that isn't a variable is reached.
+    """
+    while type(term.head) == Variable and term.head in bindings:
+        term = bindings[term.head]
+    return term
+
+
+def _substitute(term, bindings):
+    """
+    Apply the bindings computed by a unification on a term, replacing bound
+    variables until none remain.
+    """
+    def substitute(t, args):
+        if type(t.head) == Variable and t.head in bindings:
+            return _substitute(bindings[t.head], bindings)
+        return _rebuild(t, args)
+
+    return _transform(term, substitute)
+
+
+def _compatible(variable, term):
+    """
+    Check if a variable can be bound to a term, given their sorts.
+    """
+    return type(variable.sort) == GenericSort\
+        or type(term.sort) == GenericSort or variable.sort == term.sort
+
+
+def unify(term1, term2):
+    """
+    Compute the most general unifier of two terms, that is the most general
+    variable bindings that make the terms equal when applied on both. The
+    variables of the two terms are assumed to be distinct.
+
+    Args:
+        term1: The first term.
+        term2: The second term.
+
+    Returns:
+        A dict with the bound variables as keys and their (fully substituted)
+        bindings as values, or None if the terms cannot be unified.
+    """
+    assert isinstance(term1, Term), "Terms to unify must be terms"
+    assert isinstance(term2, Term), "Terms to unify must be terms"
+
+    bindings = {}
+    stack = [(term1, term2)]
+    while stack:
+        lhs, rhs = stack.pop()
+        lhs = _walk(lhs, bindings)
+        rhs = _walk(rhs, bindings)
+        if lhs == rhs:
+            continue
+
+        if type(lhs.head) != Variable and type(rhs.head) == Variable:
+            lhs, rhs = rhs, lhs
+        if type(lhs.head) == Variable:
+            if not _compatible(lhs.head, rhs):
+                return None
+            # Occurs check: a variable cannot be bound to a term containing
+            # it.
+            if lhs.head in _substitute(rhs, bindings).variables():
+                return None
+            bindings[lhs.head] = rhs
+
+        elif lhs.head == rhs.head:
+            stack.extend(zip(lhs.args, rhs.args))
+
+        else:
+            # Literals are unified with operations through the expansion
+            # function of their sort, like in Term.match.
+            if type(rhs.head) == Literal:
+                lhs, rhs = rhs, lhs
+            if type(lhs.head) != Literal:
+                return None
+            expanded = _expand(lhs, rhs.head)
+            if expanded is None:
+                return None
+            stack.append((expanded, rhs))
+
+    return {var: _substitute(term, bindings)
+            for var, term in bindings.items()}
+
+
+def _instance(pattern, term):
+    """
+    Check if a term is an instance of a pattern (the variables of the term
+    are considered as constants).
+    """
+    bindings = {}
+    stack = [(pattern, term)]
+    while stack:
+        lhs, rhs = stack.pop()
+        if type(lhs.head) == Variable:
+            if lhs.head in bindings:
+                if bindings[lhs.head] != rhs:
+                    return False
+            elif not _compatible(lhs.head, rhs):
+                return False
+            bindings[lhs.head] = rhs
+        elif lhs.head == rhs.head:
+            stack.extend(zip(lhs.args, rhs.args))
+        else:
+            return False
+    return True
+
+
+def _subterms(term):
+    """
+    Get the subterms of a term whose head isn't a variable.
+
+    Yields:
+        A (position, subterm) tuple for each subterm, where the position is
+        the tuple of the indices of the arguments leading to the subterm.
+    """
+    stack = [((), term)]
+    while stack:
+        position, t = stack.pop()
+        if type(t.head) == Variable:
+            continue
+        yield (position, t)
+        for i in range(len(t.args) - 1, -1, -1):
+            stack.append((position + (i,), t.args[i]))
+
+
+def _replace(term, position, subterm):
+    """
+    Replace the subterm of a term at some position.
+    """
+    if not position:
+        return subterm
+    args = list(term.args)
+    args[position[0]] = _replace(args[position[0]], position[1:], subterm)
+    return Term(term.head, tuple(args))
+
+
+def _freeze(terms):
+    """
+    Replace the variables of some terms with fresh constants of the same
+    sorts, so that they can be reduced like ground terms.
+    """
+    variables = set()
+    for term in terms:
+        variables |= term.variables()
+    constants = {var: Term(Operation("?" + var.name, (), var.sort))
+                 for var in variables}
+    return [term.apply_binding(constants) for term in terms]
+
+
+def _rename(rule):
+    """
+    Rename the variables of a rule with fresh variables.
+
+    Returns:
+        A (lhs, rhs, conditions) tuple with the renamed terms of the rule
+        (the rhs is None for native rules).
+    """
+    variables = rule.lhs.variables()
+    if rule.rhs is not None:
+        variables |= rule.rhs.variables()
+    for condition in rule.conditions:
+        variables |= condition[0].variables() | condition[1].variables()
+    renaming = {var: Term(Variable(var.name + "'", var.sort))
+                for var in variables}
+    rhs = rule.rhs.apply_binding(renaming) if rule.rhs is not None else None
+    return (rule.lhs.apply_binding(renaming), rhs,
+            [(c[0].apply_binding(renaming), c[1].apply_binding(renaming))
+             for c in rule.conditions])
+
+
+class CriticalPair(object):
+    """
+    Critical pair of two rewrite rules: the left hand side of the second
+    rule unifies with a subterm of the left hand side of the first one.
+
+    Attributes:
+        rule1: The rule whose left hand side contains the overlap.
+        rule2: The rule whose left hand side unifies with a subterm of the
+            left hand side of rule1.
+        position: The position of the subterm in the left hand side of
+            rule1, as a tuple of argument indices.
+        overlap: The most general term both rules can rewrite.
+        left: The term obtained by applying rule1 on the overlap (None if
+            rule1 is a native rule).
+        right: The term obtained by applying rule2 on the overlap (None if
+            rule2 is a native rule).
+        conditions: The conditions of both rules, for the overlap.
+        joinable: Whether left and right have the same normal form, or None
+            if it is unknown (for native or conditional rules, or when the
+            reduction of the terms was aborted).
+    """
+
+    def __init__(self, rule1, rule2, position, overlap, left, right,
+                 conditions):
+        self.rule1 = rule1
+        self.rule2 = rule2
+        self.position = position
+        self.overlap = overlap
+        self.left = left
+        self.right = right
+        self.conditions = conditions
+        self.joinable = None
+
+    def __str__(self):
+        return "{} <- {} -> {}".format(self.left, self.overlap, self.right)
+
+    def __repr__(self):
+        return str(self)
+
+
+def critical_pairs(rewrite_rules):
+    """
+    Compute the critical pairs of a list of rewrite rules (without checking
+    whether they are joinable).
+
+    Args:
+        rewrite_rules: A list of rewrite rules.
+
+    Returns:
+        A list of critical pairs.
+    """
+    # The rules are indexed by the head of their left hand side and the
+    # heads of its arguments, so that a subterm is only unified with the
+    # rules that can overlap with it.
+    renamed = {}
+    by_head = {}
+    by_arg = {}
+    anywhere = []
+    for i, rule in enumerate(rewrite_rules):
+        renamed[rule] = _rename(rule)
+        head = rule.lhs.head
+        if type(head) == Variable:
+            anywhere.append(i)
+            continue
+        by_head.setdefault(head, set()).add(i)
+        for j, arg in enumerate(rule.lhs.args):
+            # Variables and literals (through expansion) can unify with
+            # arguments of any head.
+            key = arg.head if type(arg.head) == Operation else None
+            by_arg.setdefault((head, j, key), set()).add(i)
+
+    def candidates(subterm):
+        indices = by_head.get(subterm.head, set())
+        for j, arg in enumerate(subterm.args):
+            if not indices:
+                break
+            if type(arg.head) == Operation:
+                indices = indices & (by_arg.get((subterm.head, j, arg.head),
+                                                set())
+                                     | by_arg.get((subterm.head, j, None),
+                                                  set()))
+        return [rewrite_rules[i] for i in sorted(indices) + anywhere]
+
+    pairs = []
+    for rule1 in rewrite_rules:
+        for position, subterm in _subterms(rule1.lhs):
+            for rule2 in candidates(subterm):
+                # A rule trivially overlaps with itself at the root.
+                if rule2 is rule1 and not position:
+                    continue
+                lhs2, rhs2, conditions2 = renamed[rule2]
+                bindings = unify(subterm, lhs2)
+                if bindings is None:
+                    continue
+
+                def instance(term):
+                    return _substitute(term, bindings)
+
+                overlap = instance(rule1.lhs)
+                left = instance(rule1.rhs) if rule1.rhs is not None\
+                    else None
+                right = None
+                if rhs2 is not None:
+                    right = instance(_replace(rule1.lhs, position, rhs2))
+                conditions = [(instance(c[0]), instance(c[1]))
+                              for c in rule1.conditions + conditions2]
+                pairs.append(CriticalPair(rule1, rule2, position, overlap,
+                                          left, right, conditions))
+    return pairs
+
+
+def non_left_linear(rewrite_rules):
+    """
+    Get the rules whose left hand side contains a variable several times
+    (their application needs the comparison of subterms).
+
+    Args:
+        rewrite_rules: A list of rewrite rules.
+
+    Returns:
+        A list of rules.
+    """
+    rules = []
+    for rule in rewrite_rules:
+        seen = set()
+        for _, subterm in _subterms(rule.lhs):
+            for arg in subterm.args:
+                if type(arg.head) != Variable:
+                    continue
+                if arg.head in seen:
+                    rules.append(rule)
+                    break
+                seen.add(arg.head)
+            else:
+                continue
+            break
+    return rules
+
+
+def non_terminating(rewrite_rules):
+    """
+    Get the rules that may make reductions loop forever.
+
+    Args:
+        rewrite_rules: A list of rewrite rules.
+
+    Returns:
+        A list of (rule, reason) tuples, where the reason is a string
+        describing why the rule is flagged.
+    """
+    rules = []
+    for rule in rewrite_rules:
+        if type(rule.lhs.head) == Variable:
+            rules.append((rule, "left hand side is a variable"))
+        elif rule.rhs is None:
+            continue
+        elif not rule.rhs.variables() <= rule.lhs.variables():
+            rules.append((rule, "right hand side has variables that aren't "
+                                "in the left hand side"))
+        elif any(_instance(rule.lhs, subterm)
+                 for _, subterm in _subterms(rule.rhs)):
+            rules.append((rule, "right hand side contains an instance of "
+                                "the left hand side"))
+    return rules
+
+
+class Analysis(object):
+    """
+    Analysis of a list of rewrite rules.
+
+    Args:
+        rewrite_rules: The list of rewrite rules to analyse.
+        max_steps: The maximum number of steps of the reductions used to
+            check whether critical pairs are joinable.
+
+    Attributes:
+        critical_pairs: The critical pairs of the rules.
+        non_left_linear: The rules that aren't left-linear.
+        non_terminating: The rules that may not terminate, as (rule, reason)
+            tuples.
+    """
+
+    def __init__(self, rewrite_rules, max_steps=1000):
+        self.rewrite_rules = rewrite_rules
+        self.critical_pairs = critical_pairs(rewrite_rules)
+        self.non_left_linear = non_left_linear(rewrite_rules)
+        self.non_terminating = non_terminating(rewrite_rules)
+
+        for pair in self.critical_pairs:
+            if pair.left is None or pair.right is None or pair.conditions:
+                continue
+            left, right = _freeze([pair.left, pair.right])
+            try:
+                pair.joinable = left.reduce(rewrite_rules, max_steps)\
+                    == right.reduce(rewrite_rules, max_steps)
+            except ReductionException:
+                pass
+
+    def unjoinable(self):
+        """
+        Get the critical pairs that aren't joinable, and thus show that the
+        rules aren't confluent.
+        """
+        return [pair for pair in self.critical_pairs
+                if pair.joinable is False]
+
+    def report(self, limit=10):
+        """
+        Build a textual report of the analysis.
+
+        Args:
+            limit: The maximum number of elements to list in each section.
+
+        Returns:
+            A string with the report.
+        """
+        unknown = [pair for pair in self.critical_pairs
+                   if pair.joinable is None]
+        lines = ["{} rules, {} critical pairs ({} not joinable, {} unknown)"
+                 .format(len(self.rewrite_rules), len(self.critical_pairs),
+                         len(self.unjoinable()), len(unknown))]
+        for pair in self.unjoinable()[:limit]:
+            lines.append("  not joinable: {}".format(pair))
+        lines.append("{} rules not left-linear"
+                     .format(len(self.non_left_linear)))
+        for rule in self.non_left_linear[:limit]:
+            lines.append("  {}".format(rule))
+        lines.append("{} rules possibly non-terminating"
+                     .format(len(self.non_terminating)))
+        for rule, reason in self.non_terminating[:limit]:
+            lines.append("  {} ({})".format(rule, reason))
+        return "\n".join(lines)
@@ -3,10 +3,17 @@ Model for Algebraic Petri Nets (APNs).
 """
 # Aurelien Coet, 2018.
 
+import heapq
 import random
+from bisect import bisect_left
+from itertools import islice
 import graphviz as gv
-from alpyne.adt import Sort, Term, RewriteRule
-from alpyne.exceptions import ConsumeException, FiringException
+from alpyne import profiling
+from alpyne.adt import Sort, Operation, Variable, Literal, Term,\
+    RewriteRule, budget
+from alpyne.exceptions import ConsumeException, FiringException,\
+    FiringBudgetException, ReductionException
+from alpyne.persistent import PersistentMap
 
 
 class Place(object):
@@ -17,17 +24,53 @@ class Place(object):
     def __init__(self, name, sort, marking=[]):
         assert type(name) == str, "Name of a place must be a string"
         assert isinstance(sort, Sort), "Sort of a place must be a sort"
-        assert type(marking) == list, "Initial marking must be a list"
+        assert isinstance(marking, list), "Initial marking must be a list"
         for token in marking:
             assert isinstance(token, Term), "Tokens in a place must be terms"
             assert token.sort == sort, "Tokens' sorts must match the place's"
         self.name = name
         self.sort = sort
+        # Set of the modified places of the APN the place belongs to, to
+        # which the place adds itself when its marking changes.
+        self._dirty = None
+        # Indexes of the tokens of the marking by head, and by subterm at
+        # some positions (see candidates). They are built lazily, and None
+        # when they must be rebuilt.
+        self._heads = None
+        self._positions = {}
+        self._values = None
         self.marking = marking
 
     def __str__(self):
         return "place {}".format(self.name)
 
+    @property
+    def marking(self):
+        """
+        The list of the tokens of the place. The list assigned to the
+        marking is copied, and the indexes of the place are rebuilt when the
+        marking is assigned or modified in place.
+        """
+        return self._marking
+
+    @marking.setter
+    def marking(self, marking):
+        self._replace(marking)
+        if self._dirty is not None:
+            self._dirty.add(self)
+
+    def _replace(self, marking):
+        """
+        Replace the marking of the place, invalidating its indexes.
+        """
+        if type(marking) != _Marking or marking._place is not self:
+            marking = _Marking(self, marking)
+        self._marking = marking
+        self._heads = None
+        self._values = None
+        for position in self._positions:
+            self._positions[position] = None
+
     def consume(self, tokens):
         """
         Consume tokens from the place.
@@ -35,14 +78,37 @@ class Place(object):
         Args:
             tokens: A list of tokens to consume from the place.
         """
-        assert type(tokens) == list, "Tokens must be a list of terms"
-        new_marking = self.marking.copy()
+        assert isinstance(tokens, list), "Tokens must be a list of terms"
+        counts = {}
         for token in tokens:
             assert isinstance(token, Term), "Tokens must be terms"
-            if token not in self.marking:
+            counts[token] = counts.get(token, 0) + 1
+        # The first occurrences of the tokens in the marking are removed.
+        removed = set()
+        for token, count in counts.items():
+            occurrences = self.occurrences(token)
+            if len(occurrences) < count:
                 raise ConsumeException
-            new_marking.remove(token)
-        self.marking = new_marking
+            removed.update(occurrences[:count])
+
+        # The indexes are updated instead of being rebuilt: the indices of
+        # the removed tokens are dropped, and the following ones shifted.
+        heads = self._heads
+        values = self._values
+        positions = dict(self._positions)
+        self.marking = [token for i, token in enumerate(self._marking)
+                        if i not in removed]
+        removed = sorted(removed)
+        if heads is not None:
+            _remove_indices(heads, removed)
+            self._heads = heads
+        if values is not None:
+            _remove_indices(values, removed)
+            self._values = values
+        for position, index in positions.items():
+            if index is not None:
+                _remove_indices(index, removed)
+                self._positions[position] = index
 
     def produce(self, tokens):
         """
@@ -51,13 +117,210 @@ class Place(object):
         Args:
             tokens: A list of tokens to produce in the place.
         """
-        assert type(tokens) == list, "Tokens must be a list of terms"
+        assert isinstance(tokens, list), "Tokens must be a list of terms"
         new_marking = self.marking.copy()
         for token in tokens:
             assert isinstance(token, Term), "Tokens must be terms"
             assert token.sort == self.sort, "Tokens must have the place's sort"
             new_marking.append(token)
+
+        # The tokens are appended to the marking, so the indexes can be
+        # updated instead of being rebuilt.
+        heads = self._heads
+        values = self._values
+        positions = dict(self._positions)
         self.marking = new_marking
+        start = len(new_marking) - len(tokens)
+        if heads is not None:
+            for i in range(start, len(new_marking)):
+                heads.setdefault(_head_key(new_marking[i]), []).append(i)
+            self._heads = heads
+        if values is not None:
+            for i in range(start, len(new_marking)):
+                values.setdefault(new_marking[i], []).append(i)
+            self._values = values
+        for position, index in positions.items():
+            if index is not None:
+                for i in range(start, len(new_marking)):
+                    index.setdefault(_position_key(new_marking[i], position),
+                                     []).append(i)
+                self._positions[position] = index
+
+    def occurrences(self, token):
+        """
+        Get the indices of the tokens equal to some token in the marking of
+        the place, in increasing order.
+        """
+        values = self._values
+        if values is None:
+            values = self._values = {}
+            for i, t in enumerate(self._marking):
+                values.setdefault(t, []).append(i)
+        return values.get(token, ())
+
+    def index(self, position):
+        """
+        Index the tokens of the place by their subterm at some position, to
+        speed up the search of the tokens matching terms that have a ground
+        subterm at that position (see candidates). For example, the tokens
+        of a place holding pairs of keys and values can be indexed by their
+        keys with the position (0,).
+
+        Args:
+            position: A tuple with the indices of the arguments leading to
+                the subterm, starting from the root of the tokens.
+        """
+        assert type(position) == tuple, "Position must be a tuple of indices"
+        self._positions.setdefault(position, None)
+
+    def candidates(self, term):
+        """
+        Get the indices of the tokens of the place that can match a term,
+        using the indexes of the place. The tokens whose head (or subterm at
+        an indexed position) differs from the term's can't match it, and
+        are skipped.
+
+        Args:
+            term: The term to match the tokens with.
+
+        Returns:
+            An iterable over the indices of the candidate tokens in the
+            marking of the place, in increasing order.
+        """
+        head = term.head
+        if type(head) == Variable:
+            return range(len(self._marking))
+
+        for position, index in self._positions.items():
+            key = _position_key(term, position)
+            if key is _OTHERS:
+                continue
+            if index is None:
+                index = self._positions[position] = {}
+                for i, token in enumerate(self._marking):
+                    index.setdefault(_position_key(token, position),
+                                     []).append(i)
+            return _merge(index.get(key, ()), index.get(_OTHERS, ()))
+
+        heads = self._heads
+        if heads is None:
+            heads = self._heads = {}
+            for i, token in enumerate(self._marking):
+                heads.setdefault(_head_key(token), []).append(i)
+        # Literals can be expanded to match operations, and the other way
+        # around, in sorts with an expansion function.
+        expandable = self.sort.expand is not None
+        if type(head) == Operation:
+            return _merge(heads.get(head, ()), heads.get(_VARIABLES, ()),
+                          heads.get(_LITERALS, ()) if expandable else ())
+        if expandable:
+            return range(len(self._marking))
+        return _merge(heads.get(_LITERALS, ()), heads.get(_VARIABLES, ()))
+
+
+class _Marking(list):
+    """
+    Marking of a place: a list of tokens that invalidates the indexes of the
+    place when it is modified in place.
+    """
+
+    __slots__ = ('_place',)
+
+    def __init__(self, place, tokens=()):
+        super().__init__(tokens)
+        self._place = place
+
+
+def _modifier(name):
+    """
+    Wrap a method of list modifying the list, to update the place of a
+    marking after the modification.
+    """
+    method = getattr(list, name)
+
+    def modify(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._place.marking = self
+        return result
+
+    modify.__name__ = name
+    return modify
+
+
+for _name in ('__setitem__', '__delitem__', '__iadd__', '__imul__',
+              'append', 'extend', 'insert', 'pop', 'remove', 'clear',
+              'sort', 'reverse'):
+    setattr(_Marking, _name, _modifier(_name))
+
+
+# Keys of the tokens with a variable or a literal as head in the indexes of
+# places, and of the tokens that aren't indexed by their subterm at some
+# position.
+_VARIABLES = 'variables'
+_LITERALS = 'literals'
+_OTHERS = 'others'
+
+
+def _head_key(token):
+    head = token.head
+    if type(head) == Operation:
+        return head
+    if type(head) == Literal:
+        return _LITERALS
+    return _VARIABLES
+
+
+def _position_key(term, position):
+    """
+    Get the key of a term in the index of the subterms at some position: the
+    subterm itself if it is ground and can only match equal terms (it has no
+    terms of sorts that expand literals), or _OTHERS.
+    """
+    for i in position:
+        if type(term.head) != Operation or i >= len(term.args):
+            return _OTHERS
+        term = term.args[i]
+    stack = [term]
+    while stack:
+        t = stack.pop()
+        if type(t.head) == Variable or t.sort.expand is not None:
+            return _OTHERS
+        stack.extend(t.args)
+    return term
+
+
+def _remove_indices(index, removed):
+    """
+    Update an index of the tokens of a place after the tokens at some
+    indices (a sorted list) were removed from its marking.
+    """
+    first = removed[0]
+    for key, indices in list(index.items()):
+        # The indices before the first removed token are unchanged.
+        start = bisect_left(indices, first)
+        if start == len(indices):
+            continue
+        kept = indices[:start]
+        for i in islice(indices, start, None):
+            shift = bisect_left(removed, i)
+            if shift == len(removed) or removed[shift] != i:
+                kept.append(i - shift)
+        if kept:
+            index[key] = kept
+        else:
+            del index[key]
+
+
+def _merge(*indices):
+    """
+    Merge sorted lists of indices.
+    """
+    indices = [i for i in indices if i]
+    if not indices:
+        return ()
+    if len(indices) == 1:
+        return indices[0]
+    return heapq.merge(*indices)
 
 
 class Transition(object):
@@ -85,7 +348,9 @@ class Transition(object):
         assert type(label) == list, "Label must be a list of terms"
         for term in label:
             assert isinstance(term, Term), "Elements in label must be terms"
-        self.inbound_arcs.append(Arc(source, self, label))
+        arc = Arc(source, self, label)
+        self.inbound_arcs.append(arc)
+        return arc
 
     def outbound_arc(self, target, label):
         """
@@ -98,51 +363,112 @@ class Transition(object):
         assert type(label) == list, "Label must be a list of terms"
         for term in label:
             assert isinstance(term, Term), "Elements in label must be terms"
-        self.outbound_arcs.append(Arc(self, target, label))
+        arc = Arc(self, target, label)
+        self.outbound_arcs.append(arc)
+        return arc
 
-    def fireable(self):
+    def fireable(self, claimed=None):
         """
         Check if the transition is fireable, and if so, compute the variable
         bindings that make it possible.
 
+        Args:
+            claimed: A dict with places as keys and sets of indices of tokens
+                in their markings as values, for tokens that cannot be
+                consumed by the transition (because they are claimed by
+                other transitions fired in the same step). If the transition
+                is fireable, the indices of the tokens it consumes are added
+                to the dict.
+
         Returns:
             A boolean indicating whether the transition can be fired,
             as well as the bindings for the variables in the labels
             of its inbound and outbound arcs if it can be fired.
         """
+        profiler = profiling.active()
+        if profiler is None:
+            return self._fireable(claimed)
+
+        stats = profiler.transition(self)
+        start = profiling.timer()
+        fireable, bindings = self._fireable(claimed)
+        stats.check_time += profiling.timer() - start
+        stats.checks += 1
+        if fireable:
+            stats.fireable += 1
+            stats.bindings += len(bindings)
+        return (fireable, bindings)
+
+    def _fireable(self, claimed=None):
+        """
+        Check if the transition is fireable (see fireable), without
+        profiling.
+        """
         bindings = {}
-        matched_tokens = []
+        # Indices of the tokens already matched in the marking of each place.
+        matched_tokens = {}
 
         for arc in self.inbound_arcs:
-            has_match = False
+            matched = matched_tokens.get(arc.source)
+            if matched is None:
+                matched = set(claimed.get(arc.source, ()))\
+                    if claimed is not None else set()
+                matched_tokens[arc.source] = matched
+
+            # The normal forms of ground labels (when computed) are looked up
+            # directly in the place instead of being matched.
+            cache = arc._normal_forms
+            if cache is not None:
+                if cache[1] != len(cache[0]):
+                    arc.normal_forms(cache[0], cache[4])
+                    cache = arc._normal_forms
+                for form, count in cache[3]:
+                    free = [i for i in arc.source.occurrences(form)
+                            if i not in matched]
+                    if len(free) < count:
+                        return (False, {})
+                    matched.update(free[:count])
+                continue
 
             for term in arc.label:
-                for token in arc.source.marking:
+                has_match = False
+
+                marking = arc.source.marking
+                for i in arc.source.candidates(term):
                     # If a token in a precondition is already being consumed by
                     # some other term on an inbound arc, it cannot be consumed
                     # a second time.
-                    if token in matched_tokens:
+                    if i in matched:
                         continue
 
+                    token = marking[i]
                     (matching, binding) = term.match(token)
-                    if matching:
-                        has_match = True
-                        for key, value in binding.items():
-                            # If there is some conflict in the variable
-                            # bindings, the transition cannot be fired.
-                            if key in bindings and bindings[key] != value:
-                                has_match = False
-                            else:
-                                bindings[key] = value
-                                matched_tokens.append(term)
-                        break
+                    if not matching:
+                        continue
+
+                    # If there is some conflict in the variable bindings, the
+                    # token cannot be consumed by the term.
+                    conflict = False
+                    for key, value in binding.items():
+                        if key in bindings and bindings[key] != value:
+                            conflict = True
+                            break
+                    if conflict:
+                        continue
+
+                    bindings.update(binding)
+                    matched.add(i)
+                    has_match = True
+                    break
 
                 if has_match is False:
                     return (False, {})
 
+        if claimed is not None:
+            claimed.update(matched_tokens)
         return (True, bindings)
 
-    def _consume_inbound(self, bindings, rewrite_rules):
+    def _consume_inbound(self, bindings, rewrite_rules, strategy=None):
         """
         Consume tokens from the places connected to the inbound arcs of the
         transition.
@@ -152,15 +478,19 @@ class Transition(object):
                 on the labels of the inbound arcs of the transition.
             rewrite_rules: A list of rewrite rules to be used to reduce the
                 terms on the labels of the inbound arcs of the transition.
+            strategy: The strategy of the reductions (see Term.reduce).
         """
         for arc in self.inbound_arcs:
-            tokens = []
-            for term in arc.label:
-                tokens.append(term.apply_binding(bindings)
-                                  .reduce(rewrite_rules))
-            arc.source.consume(tokens)
+            tokens = arc.normal_forms(rewrite_rules, strategy)
+            if tokens is None:
+                tokens = []
+                for term in arc.label:
+                    tokens.append(term.apply_binding(bindings)
+                                      .reduce(rewrite_rules,
+                                              strategy=strategy))
+            arc.source.consume(list(tokens))
 
-    def _produce_outbound(self, bindings, rewrite_rules):
+    def _produce_outbound(self, bindings, rewrite_rules, strategy=None):
         """
         Produce tokens in the places connected to the outbound arcs of the
         transition.
@@ -170,15 +500,20 @@ class Transition(object):
                 on the labels of the outbound arcs of the transition.
             rewrite_rules: A list of rewrite rules to be used to reduce the
                 terms on the labels of the outbound arcs of the transition.
+            strategy: The strategy of the reductions (see Term.reduce).
         """
         for arc in self.outbound_arcs:
-            tokens = []
-            for term in arc.label:
-                tokens.append(term.apply_binding(bindings)
-                                  .reduce(rewrite_rules))
-            arc.target.produce(tokens)
+            tokens = arc.normal_forms(rewrite_rules, strategy)
+            if tokens is None:
+                tokens = []
+                for term in arc.label:
+                    tokens.append(term.apply_binding(bindings)
+                                      .reduce(rewrite_rules,
+                                              strategy=strategy))
+            arc.target.produce(list(tokens))
 
-    def fire(self, rewrite_rules=[]):
+    def fire(self, rewrite_rules=[], max_steps=None, timeout=None,
+             strategy=None):
         """
         Fire the transition. Consumes tokens in the preconditions of the
         transition, and produces new ones in its postconditions. If there
@@ -189,17 +524,61 @@ class Transition(object):
         Args:
             rewrite_rules: A list of rewrite rules to use to reduce the
                 terms on the inbound and outbound arcs of the transition.
+            max_steps: The maximum number of rewrite steps of all the
+                reductions of the firing (see Term.reduce), or None for no
+                limit.
+            timeout: The maximum time spent in the reductions of the firing,
+                in seconds, or None for no limit.
+            strategy: The strategy of the reductions (see Term.reduce).
+
+        Returns:
+            The variable bindings with which the transition was fired.
 
         Raises:
-            A FiringException when the transition cannot be fired.
+            A FiringException when the transition cannot be fired, or a
+            FiringBudgetException when the firing exceeds max_steps or
+            timeout (the markings of the places are then restored).
         """
+        if max_steps is None and timeout is None:
+            return self._fire(rewrite_rules, strategy)
+
+        # Markings are replaced rather than modified in place when tokens
+        # are consumed and produced, so they can be restored on abort.
+        markings = {arc.source: arc.source.marking
+                    for arc in self.inbound_arcs}
+        markings.update((arc.target, arc.target.marking)
+                        for arc in self.outbound_arcs)
+        try:
+            with budget(max_steps, timeout):
+                return self._fire(rewrite_rules, strategy)
+        except ReductionException as error:
+            for place, marking in markings.items():
+                if place.marking is not marking:
+                    place.marking = marking
+            raise FiringBudgetException(self, error) from error
+
+    def _fire(self, rewrite_rules, strategy):
+        """
+        Fire the transition (see fire), without budget.
+        """
+        profiler = profiling.active()
+        if profiler is not None:
+            start = profiling.timer()
+
         fireable, bindings = self.fireable()
 
         if fireable is False:
             raise FiringException
 
-        self._consume_inbound(bindings, rewrite_rules)
-        self._produce_outbound(bindings, rewrite_rules)
+        self._consume_inbound(bindings, rewrite_rules, strategy)
+        self._produce_outbound(bindings, rewrite_rules, strategy)
+
+        if profiler is not None:
+            stats = profiler.transition(self)
+            stats.fires += 1
+            stats.fire_time += profiling.timer() - start
+
+        return bindings
 
 
 class Arc(object):
@@ -207,6 +586,8 @@ class Arc(object):
     Arc between places and transitions in an Algebraic Petri Net (APN).
     """
 
+    __slots__ = ('source', 'target', 'label', 'ground', '_normal_forms')
+
     def __init__(self, source, target, label):
         assert isinstance(source, Place) or isinstance(source, Transition),\
             "Source of an arc must be a place or transition"
@@ -218,6 +599,44 @@ class Arc(object):
         self.source = source
         self.target = target
         self.label = label
+        # Whether the label contains no variables.
+        self.ground = all(not term.variables() for term in label)
+        # The normal forms of the terms of a ground label, and the number of
+        # times each appears in the label, with the rewrite rules (and their
+        # number) and the strategy used to compute them.
+        self._normal_forms = None
+
+    def normal_forms(self, rewrite_rules, strategy=None):
+        """
+        Get the normal forms of the terms of the label if it is ground. They
+        are computed once for a list of rewrite rules and a strategy, and
+        then reused when the same list (compared by identity) with the same
+        length and the same strategy are used. Rules added to or removed
+        from the list are taken into account, but not rules replaced in
+        place: the list must then be passed as a new list (or reassigned to
+        the APN, see AlgebraicPetriNet.rewrite_rules).
+
+        Args:
+            rewrite_rules: The rewrite rules used to reduce the terms.
+            strategy: The strategy of the reductions (see Term.reduce).
+
+        Returns:
+            A list of terms, or None if the label isn't ground.
+        """
+        if not self.ground:
+            return None
+        cache = self._normal_forms
+        if cache is None or cache[0] is not rewrite_rules or\
+           cache[1] != len(rewrite_rules) or cache[4] != strategy:
+            forms = [term.reduce(rewrite_rules, strategy=strategy)
+                     for term in self.label]
+            counts = {}
+            for form in forms:
+                counts[form] = counts.get(form, 0) + 1
+            cache = (rewrite_rules, len(rewrite_rules), forms,
+                     list(counts.items()), strategy)
+            self._normal_forms = cache
+        return cache[2]
 
     def __str__(self):
         txt = "arc from {} to {}, with label [".format(self.source,
@@ -233,7 +652,14 @@ class AlgebraicPetriNet(object):
     Algebraic Petri Net (APN).
     """
 
-    def __init__(self, name, places=[], transitions=[], rewrite_rules=[]):
+    def __init__(self, name, places=None, transitions=None,
+                 rewrite_rules=None):
+        if places is None:
+            places = []
+        if transitions is None:
+            transitions = []
+        if rewrite_rules is None:
+            rewrite_rules = []
         assert type(name) == str, "Name of an APN must be a string"
         assert type(places) == list, "Places must be a list of Places"
         for place in places:
@@ -250,11 +676,64 @@ class AlgebraicPetriNet(object):
         self.name = name
         self.places = places
         self.transitions = transitions
-        self.rewrite_rules = rewrite_rules
+        # Strategy used to reduce the terms on the arcs (see Term.reduce).
+        self._strategy = 'innermost'
+        self._rewrite_rules = rewrite_rules
+        # Set of the places and transitions added to the APN, for fast
+        # membership checks when arcs are added.
+        self._nodes = set(places) | set(transitions)
+        # Markings of the places in the last snapshot of the APN, and places
+        # whose marking changed since then.
+        self._state = PersistentMap()
+        self._dirty = set(places)
+        for place in places:
+            place._dirty = self._dirty
+        # Recorder of the transitions fired in the APN (see alpyne.trace).
+        self.recorder = None
+        self._update_normal_forms()
 
     def __str__(self):
         return "Algebraic Petri Net {}".format(self.name)
 
+    @property
+    def rewrite_rules(self):
+        """
+        The rewrite rules of the APN. The normal forms of the ground labels
+        of its arcs are recomputed when the rules are assigned, or when
+        rules are added to or removed from their list. After rules are
+        replaced in place in the list, it must be reassigned (e.g.
+        apn.rewrite_rules = apn.rewrite_rules) so that the stale normal
+        forms aren't used.
+        """
+        return self._rewrite_rules
+
+    @rewrite_rules.setter
+    def rewrite_rules(self, rewrite_rules):
+        self._rewrite_rules = rewrite_rules
+        self._update_normal_forms()
+
+    @property
+    def strategy(self):
+        return self._strategy
+
+    @strategy.setter
+    def strategy(self, strategy):
+        self._strategy = strategy
+        self._update_normal_forms()
+
+    def _update_normal_forms(self):
+        """
+        Recompute the normal forms of the ground labels of the arcs with the
+        current rewrite rules and strategy of the APN, so that the
+        fireability checks don't use the ones of previous rules.
+        """
+        for transition in self.transitions:
+            for arc in transition.inbound_arcs + transition.outbound_arcs:
+                # The cache is dropped, since the rules may have been
+                # replaced in place in the same list.
+                arc._normal_forms = None
+                arc.normal_forms(self._rewrite_rules, self._strategy)
+
     def add_place(self, name, sort, marking=[]):
         """
         Add a place to the APN.
@@ -270,6 +749,9 @@ class AlgebraicPetriNet(object):
         """
         place = Place(name, sort, marking)
         self.places.append(place)
+        self._nodes.add(place)
+        place._dirty = self._dirty
+        self._dirty.add(place)
         return place
 
     def add_transition(self, name):
@@ -284,6 +766,7 @@ class AlgebraicPetriNet(object):
         """
         transition = Transition(name)
         self.transitions.append(transition)
+        self._nodes.add(transition)
         return transition
 
     def add_arc(self, source, target, label=[]):
@@ -302,13 +785,27 @@ class AlgebraicPetriNet(object):
         assert type(source) != type(target),\
             "Source and target of an arc cannot be both Places or Transitions"
         if isinstance(source, Place):
-            assert source in self.places, "Source must exist in the APN"
-            assert target in self.transitions, "Target must exist in the APN"
-            target.inbound_arc(source, label)
+            assert self._has(source, self.places),\
+                "Source must exist in the APN"
+            assert self._has(target, self.transitions),\
+                "Target must exist in the APN"
+            arc = target.inbound_arc(source, label)
         else:
-            assert source in self.transitions, "Source must exist in the APN"
-            assert target in self.places, "Target must exist in the APN"
-            source.outbound_arc(target, label)
+            assert self._has(source, self.transitions),\
+                "Source must exist in the APN"
+            assert self._has(target, self.places),\
+                "Target must exist in the APN"
+            arc = source.outbound_arc(target, label)
+        # The normal forms of ground labels are computed once, instead of
+        # every time the arc is used.
+        arc.normal_forms(self.rewrite_rules, self.strategy)
+
+    def _has(self, node, nodes):
+        """
+        Check if a place or transition belongs to the APN (nodes appended
+        directly to its lists of places and transitions are also found).
+        """
+        return node in self._nodes or node in nodes
 
     def marking(self):
         """
@@ -323,6 +820,43 @@ class AlgebraicPetriNet(object):
             markings[place] = place.marking
         return markings
 
+    def snapshot(self):
+        """
+        Take a snapshot of the marking of the APN.
+
+        Snapshots are persistent maps sharing their structure with the
+        previous snapshots of the APN: only the places whose marking changed
+        since the last snapshot are copied, so that taking a snapshot costs
+        O(changed places) rather than O(size of the APN).
+
+        Returns:
+            A PersistentMap with the places of the APN as keys and tuples of
+            their tokens as values.
+        """
+        state = self._state
+        for place in self._dirty:
+            state = state.set(place, tuple(place.marking))
+        self._dirty.clear()
+        self._state = state
+        return state
+
+    def restore(self, snapshot):
+        """
+        Restore the marking of the APN from one of its snapshots. Only the
+        places whose marking differs between the current state of the APN
+        and the snapshot are updated.
+
+        Args:
+            snapshot: A snapshot taken with the snapshot method of the APN.
+        """
+        assert type(snapshot) == PersistentMap,\
+            "Snapshots must be persistent maps"
+        for place, _, marking in self.snapshot().diff(snapshot):
+            assert self._has(place, self.places),\
+                "Snapshot must be of the APN"
+            place._replace(marking if marking is not None else [])
+        self._state = snapshot
+
     def fireables(self):
         """
         Get the list of transitions that are fireable in the APN given its
@@ -338,56 +872,219 @@ class AlgebraicPetriNet(object):
                 fireables.append(transition)
         return fireables
 
-    def fire(self, transition):
+    def fire(self, transition, max_steps=None, timeout=None):
         """
         Fire a transition in the APN.
 
         Args:
             transition: The transition to fire in the APN.
+            max_steps: The maximum number of rewrite steps of the firing, or
+                None for no limit (see Transition.fire).
+            timeout: The maximum time spent in the reductions of the firing,
+                in seconds, or None for no limit.
+
+        Returns:
+            The variable bindings with which the transition was fired.
+
+        Raises:
+            A FiringBudgetException when the firing exceeds its budget (the
+            marking of the APN is left unchanged).
         """
-        assert transition in self.transitions, "Transition must be in the APN"
-        transition.fire(self.rewrite_rules)
+        assert type(transition) == Transition and\
+            self._has(transition, self.transitions),\
+            "Transition must be in the APN"
+        bindings = transition.fire(self.rewrite_rules, max_steps, timeout,
+                                   self.strategy)
+        if self.recorder is not None:
+            self.recorder.record(transition, bindings)
+        return bindings
 
-    def fire_random(self):
+    def fire_random(self, max_steps=None, timeout=None):
         """
         Randomly fire one of the fireable transitions of the APN.
+
+        Args:
+            max_steps: The maximum number of rewrite steps of the firing, or
+                None for no limit (see Transition.fire).
+            timeout: The maximum time spent in the reductions of the firing,
+                in seconds, or None for no limit.
+
+        Returns:
+            The transition fired and the variable bindings with which it
+            was fired.
+
+        Raises:
+            A FiringBudgetException when the firing exceeds its budget (the
+            marking of the APN is left unchanged).
+        """
+        transition = random.choice(self.fireables())
+        bindings = transition.fire(self.rewrite_rules, max_steps, timeout,
+                                   self.strategy)
+        if self.recorder is not None:
+            self.recorder.record(transition, bindings)
+        return (transition, bindings)
+
+    def step(self, policy='random'):
         """
-        random.choice(self.fireables()).fire(self.rewrite_rules)
+        Fire a maximal set of transitions of the APN concurrently: the
+        transitions are fireable together, each consuming tokens not
+        consumed by the others, and no other transition is fireable with
+        the remaining tokens. All the transitions consume their tokens
+        before any of them produces new ones.
+
+        Args:
+            policy: The policy resolving the conflicts between transitions
+                needing the same tokens. 'random' gives the priority to the
+                transitions in a random order, 'ordered' in the order in
+                which they were added to the APN. A function taking the list
+                of transitions of the APN and returning it in the order of
+                priority can also be given.
+
+        Returns:
+            A list of (transition, bindings) tuples for the transitions
+            fired, empty if no transition is fireable.
+        """
+        if policy == 'random':
+            transitions = random.sample(self.transitions,
+                                        len(self.transitions))
+        elif policy == 'ordered':
+            transitions = self.transitions
+        else:
+            assert callable(policy),\
+                "Policy must be 'random', 'ordered' or a function"
+            transitions = policy(list(self.transitions))
 
-    def visualise(self, filepath, format='pdf'):
+        claimed = {}
+        fired = []
+        for transition in transitions:
+            fireable, bindings = transition.fireable(claimed)
+            if fireable:
+                fired.append((transition, bindings))
+
+        for transition, bindings in fired:
+            transition._consume_inbound(bindings, self.rewrite_rules,
+                                        self.strategy)
+        for transition, bindings in fired:
+            transition._produce_outbound(bindings, self.rewrite_rules,
+                                         self.strategy)
+            if self.recorder is not None:
+                self.recorder.record(transition, bindings)
+        return fired
+
+    def visualise(self, filepath, format='pdf', view=True, transitions=None,
+                  radius=1, max_tokens=10, max_length=80, stream=False):
         """
         Visualise the APN and its current marking graphically.
 
+        The tokens of each place are aggregated (identical tokens are shown
+        once with their count), and terms are printed with Term.pretty, so
+        that they are abbreviated and truncated to max_length characters.
+
         Args:
             filepath: The path to the file where the visualisation of the APN
                 must be saved.
             format: The format in which the visualisation must be saved.
+            view: Whether the rendered file must be opened in a viewer.
+            transitions: A list of transitions around which a subnet must be
+                visualised, or None to visualise the whole APN.
+            radius: The number of transitions separating the transitions of
+                the subnet from the chosen ones (1 only includes the chosen
+                transitions and their places).
+            max_tokens: The maximum number of distinct tokens shown for each
+                place, or None to show all of them.
+            max_length: The maximum length of the labels of the tokens and
+                arcs, or None to never truncate them.
+            stream: If True, the graph is written incrementally in the DOT
+                language to filepath, without being rendered by graphviz.
+                This is useful for big nets.
         """
+        places, transitions = self._subnet(transitions, radius)
+        lines = self._dot(places, transitions, max_tokens, max_length)
+        if stream:
+            with open(filepath, 'w') as output:
+                output.write('digraph {} {{\n'.format(_quote(self.name)))
+                for line in lines:
+                    output.write(line + '\n')
+                output.write('}\n')
+            return
         graph = gv.Digraph(name=self.name, format=format,
-                           graph_attr={'label': self.name})
+                           body=['\t' + line + '\n' for line in lines])
+        graph.render(filepath, view=view)
 
-        for place in self.places:
-            label = ""
+    def _subnet(self, transitions, radius):
+        """
+        Get the places and transitions in a subnet of the APN, made of some
+        transitions, the transitions separated from them by at most
+        radius - 1 places, and the places connected to all those
+        transitions.
+        """
+        if transitions is None:
+            return self.places, self.transitions
+        assert radius >= 1, "The radius of a subnet must be at least 1"
+        selected = set(transitions)
+        frontier = list(selected)
+        for i in range(radius - 1):
+            places = _adjacent_places(frontier)
+            frontier = [t for t in self.transitions if t not in selected and
+                        (any(a.source in places for a in t.inbound_arcs) or
+                         any(a.target in places for a in t.outbound_arcs))]
+            selected.update(frontier)
+        places = _adjacent_places(selected)
+        return ([p for p in self.places if p in places],
+                [t for t in self.transitions if t in selected])
+
+    def _dot(self, places, transitions, max_tokens, max_length):
+        """
+        Generate the statements of the DOT description of a part of the APN.
+        """
+        yield 'label={}'.format(_quote(self.name))
+        ids = {}
+        for i, place in enumerate(places):
+            ids[place] = 'p{}'.format(i)
+            counts = {}
             for token in place.marking:
-                label += str(token) + '\n'
-            graph.node(place.name, label=label,
-                       _attributes={'forcelabels': 'true',
-                                    'xlabel': place.name})
+                counts[token] = counts.get(token, 0) + 1
+            lines = []
+            for token, count in counts.items():
+                if max_tokens is not None and len(lines) == max_tokens:
+                    lines.append("... ({} more)".format(len(counts) -
+                                                         max_tokens))
+                    break
+                label = token.pretty(max_length=max_length)
+                lines.append(label if count == 1
+                             else "{} x {}".format(count, label))
+            yield '{} [label={} xlabel={} forcelabels=true]'\
+                .format(ids[place], _quote("\n".join(lines)),
+                        _quote(place.name))
 
-        for transition in self.transitions:
-            graph.node(transition.name, label=transition.name,
-                       _attributes={'shape': 'box'})
+        for i, transition in enumerate(transitions):
+            ids[transition] = 't{}'.format(i)
+            yield '{} [label={} shape=box]'.format(ids[transition],
+                                                   _quote(transition.name))
+            for arc in transition.inbound_arcs + transition.outbound_arcs:
+                label = "\n".join(term.pretty(max_length=max_length)
+                                   for term in arc.label)
+                yield '{} -> {} [label={}]'.format(ids[arc.source],
+                                                   ids[arc.target],
+                                                   _quote(label))
 
-            for arc in transition.inbound_arcs:
-                label = ""
-                for term in arc.label:
-                    label += str(term) + '\n'
-                graph.edge(arc.source.name, arc.target.name, label=label)
 
-            for arc in transition.outbound_arcs:
-                label = ""
-                for term in arc.label:
-                    label += str(term) + '\n'
-                graph.edge(arc.source.name, arc.target.name, label=label)
+def _adjacent_places(transitions):
+    """
+    Get the set of places connected to some transitions.
+    """
+    places = set()
+    for transition in transitions:
+        for arc in transition.inbound_arcs:
+            places.add(arc.source)
+        for arc in transition.outbound_arcs:
+            places.add(arc.target)
+    return places
+
 
-        graph.render(filepath, view=True)
+def _quote(text):
+    """
+    Quote a string in the DOT language.
+    """
+    return '"{}"'.format(text.replace('\\', '\\\\').replace('"', '\\"')
+                         .replace('\n', '\\n'))
@@ -17,3 +17,103 @@ class FiringException(Exception):
     Exception raised when an attempt to fire a transition that is not fireable
     is made.
     """
+
+
+# Budget exceptions.
+
+
+class BudgetException(Exception):
+    """
+    Exception raised when a computation exceeds its budget of rewrite steps
+    or time.
+
+    Attributes:
+        steps: The number of rewrite steps applied before the computation was
+            aborted.
+        elapsed: The time spent in the computation, in seconds.
+    """
+
+    def __init__(self, message, steps, elapsed):
+        super().__init__(message)
+        self.steps = steps
+        self.elapsed = elapsed
+
+
+class ReductionException(BudgetException):
+    """
+    Exception raised when the reduction of a term exceeds its maximum number
+    of rewrite steps or its timeout.
+
+    Attributes:
+        term: The term whose reduction was aborted.
+        partial: The term obtained when the reduction was aborted.
+        steps: The number of rewrite steps applied.
+        rules: The last rewrite rules applied (the most recent last).
+        elapsed: The time spent in the reduction, in seconds.
+    """
+
+    def __init__(self, term, partial, steps, rules, elapsed=0.0):
+        super().__init__("Reduction of {} aborted after {} steps ({:.3f}s), "
+                         "last rules applied: {}"
+                         .format(term, steps, elapsed,
+                                 "; ".join(str(rule) for rule in rules)),
+                         steps, elapsed)
+        self.term = term
+        self.partial = partial
+        self.rules = rules
+
+
+class FiringBudgetException(BudgetException):
+    """
+    Exception raised when the firing of a transition exceeds its maximum
+    number of rewrite steps or its timeout. The marking of the APN is left
+    as it was before the firing.
+
+    Attributes:
+        transition: The transition whose firing was aborted.
+        reduction: The ReductionException raised by the reduction aborted
+            in the firing (with the term being reduced).
+        steps: The number of rewrite steps applied during the firing.
+        elapsed: The time spent in the firing, in seconds.
+    """
+
+    def __init__(self, transition, reduction):
+        super().__init__("Firing of transition {} aborted: {}"
+                         .format(transition.name, reduction),
+                         reduction.steps, reduction.elapsed)
+        self.transition = transition
+        self.reduction = reduction
+
+
+# Unfolding exceptions.
+
+
+class UnfoldingException(Exception):
+    """
+    Exception raised when an APN cannot be unfolded into a place/transition
+    net with the given domains.
+    """
+
+
+# Serialization exceptions.
+
+
+class SerializationException(Exception):
+    """
+    Exception raised when serialized data cannot be loaded.
+    """
+
+
+class PNMLException(Exception):
+    """
+    Exception raised when a PNML file cannot be imported.
+    """
+
+
+# Service exceptions.
+
+
+class ServiceException(Exception):
+    """
+    Exception raised when a request to a simulation service fails.
+    """
@@ -0,0 +1,203 @@
+"""
+Generators of parameterized Algebraic Petri Nets (APNs), used to build large
+models for benchmarks and for load or state space exploration tests.
+
+Unless specified otherwise, the nets use nat.zero() as black tokens, and the
+rewrite rules of the natural sort.
+"""
+
+from alpyne.adt import Signature, Variable
+from alpyne.adts.hashmap import hash_map
+from alpyne.adts.natural import nat
+from alpyne.adts.string import from_str
+from alpyne.apn import AlgebraicPetriNet
+
+
+def dining_philosophers(n):
+    """
+    Build an APN modelling n philosophers sitting around a table, each
+    needing the fork on their left and the one on their right to eat.
+
+    The net has 3n places (fork_i, thinking_i and eating_i) and 2n
+    transitions (take_i and release_i).
+
+    Args:
+        n: The number of philosophers (at least 2).
+    """
+    assert n >= 2, "There must be at least two philosophers"
+    token = nat.zero()
+    net = AlgebraicPetriNet('dining_philosophers', [], [], nat.rewrite_rules)
+    forks = [net.add_place('fork_{}'.format(i), nat, [token])
+             for i in range(n)]
+    for i in range(n):
+        thinking = net.add_place('thinking_{}'.format(i), nat, [token])
+        eating = net.add_place('eating_{}'.format(i), nat, [])
+        take = net.add_transition('take_{}'.format(i))
+        release = net.add_transition('release_{}'.format(i))
+        for place in (thinking, forks[i], forks[(i + 1) % n]):
+            net.add_arc(place, take, [token])
+            net.add_arc(release, place, [token])
+        net.add_arc(take, eating, [token])
+        net.add_arc(eating, release, [token])
+    return net
+
+
+def token_ring(n, tokens=1):
+    """
+    Build an APN where tokens circulate in a ring of n places. Each token is
+    a natural number counting the number of hops it made.
+
+    The net has n places (node_i) and n transitions (pass_i).
+
+    Args:
+        n: The number of places in the ring.
+        tokens: The number of tokens initially in the first place.
+    """
+    assert n >= 1, "There must be at least one place in the ring"
+    x = Variable('x', nat)
+    net = AlgebraicPetriNet('token_ring', [], [], nat.rewrite_rules)
+    nodes = [net.add_place('node_{}'.format(i), nat,
+                           [nat.zero()] * tokens if i == 0 else [])
+             for i in range(n)]
+    for i in range(n):
+        t = net.add_transition('pass_{}'.format(i))
+        net.add_arc(nodes[i], t, [x()])
+        net.add_arc(t, nodes[(i + 1) % n], [nat.succ(x())])
+    return net
+
+
+def readers_writers(readers, writers):
+    """
+    Build an APN where some readers and writers share a resource: any number
+    of readers can access it at the same time, but writers need an exclusive
+    access. A lock place holds one token per reader; a reader takes a single
+    one to read, and a writer takes all of them to write.
+
+    The net has 2 * (readers + writers) + 1 places and as many transitions
+    as places minus one.
+
+    Args:
+        readers: The number of readers.
+        writers: The number of writers.
+    """
+    assert readers >= 1, "There must be at least one reader"
+    token = nat.zero()
+    net = AlgebraicPetriNet('readers_writers', [], [], nat.rewrite_rules)
+    lock = net.add_place('lock', nat, [token] * readers)
+    for kind, count, needed in (('reader', readers, 1),
+                                ('writer', writers, readers)):
+        for i in range(count):
+            idle = net.add_place('{}_idle_{}'.format(kind, i), nat, [token])
+            busy = net.add_place('{}_busy_{}'.format(kind, i), nat, [])
+            start = net.add_transition('{}_start_{}'.format(kind, i))
+            end = net.add_transition('{}_end_{}'.format(kind, i))
+            net.add_arc(idle, start, [token])
+            net.add_arc(lock, start, [token] * needed)
+            net.add_arc(start, busy, [token])
+            net.add_arc(busy, end, [token])
+            net.add_arc(end, idle, [token])
+            net.add_arc(end, lock, [token] * needed)
+    return net
+
+
+def producer_consumer(producers, consumers=None):
+    """
+    Build an APN where some producers put natural numbers in a shared buffer
+    and some consumers take them out of it.
+
+    The net has producers + consumers + 1 places (buffer, producer_i and
+    consumed_i) and producers + consumers transitions (produce_i and
+    consume_i).
+
+    Args:
+        producers: The number of producers.
+        consumers: The number of consumers (defaults to the number of
+            producers).
+    """
+    if consumers is None:
+        consumers = producers
+    x = Variable('x', nat)
+    net = AlgebraicPetriNet('producer_consumer', [], [], nat.rewrite_rules)
+    buffer = net.add_place('buffer', nat, [])
+    for i in range(producers):
+        producer = net.add_place('producer_{}'.format(i), nat, [nat.zero()])
+        produce = net.add_transition('produce_{}'.format(i))
+        net.add_arc(producer, produce, [x()])
+        net.add_arc(produce, producer, [nat.succ(x())])
+        net.add_arc(produce, buffer, [x()])
+    for i in range(consumers):
+        consumed = net.add_place('consumed_{}'.format(i), nat, [])
+        consume = net.add_transition('consume_{}'.format(i))
+        net.add_arc(buffer, consume, [x()])
+        net.add_arc(consume, consumed, [x()])
+    return net
+
+
+def pipeline(stages, items=1):
+    """
+    Build an APN modelling a pipeline where items (natural numbers) go
+    through a number of stages, each incrementing them.
+
+    The net has stages + 1 places (buffer_i) and stages transitions
+    (stage_i).
+
+    Args:
+        stages: The number of stages of the pipeline.
+        items: The number of items initially in the first buffer.
+    """
+    assert stages >= 1, "There must be at least one stage in the pipeline"
+    x = Variable('x', nat)
+    net = AlgebraicPetriNet('pipeline', [], [], nat.rewrite_rules)
+    buffers = [net.add_place('buffer_{}'.format(i), nat,
+                             [nat.zero()] * items if i == 0 else [])
+               for i in range(stages + 1)]
+    for i in range(stages):
+        t = net.add_transition('stage_{}'.format(i))
+        net.add_arc(buffers[i], t, [x()])
+        net.add_arc(t, buffers[i + 1], [nat.succ(x())])
+    return net
+
+
+def database(clients):
+    """
+    Build an APN where some clients write and read values in a database
+    represented by a hash map token (see alpyne.adts.hashmap). Each client
+    has its own key and a counter, which it increments and stores in the
+    database when it writes. When it reads, the value associated to its key
+    is copied to its result place.
+
+    The net has 3 * clients + 1 places (db, idle_i, written_i and result_i)
+    and 2 * clients transitions (write_i and read_i).
+
+    Args:
+        clients: The number of clients of the database.
+    """
+    assert clients >= 1, "There must be at least one client"
+    x = Variable('x', nat)
+    rules = Signature(hash_map, nat)
+    net = AlgebraicPetriNet('database', [], [], rules)
+    entries = hash_map.empty()
+    for i in range(clients):
+        entries = hash_map.add(entries, from_str('key_{}'.format(i)),
+                               nat.zero())
+    db = net.add_place('db', hash_map, [entries.reduce(rules)])
+    for i in range(clients):
+        key = from_str('key_{}'.format(i))
+        idle = net.add_place('idle_{}'.format(i), nat, [nat.zero()])
+        written = net.add_place('written_{}'.format(i), nat, [])
+        result = net.add_place('result_{}'.format(i), nat, [])
+
+        write = net.add_transition('write_{}'.format(i))
+        net.add_arc(db, write, [hash_map.m()])
+        net.add_arc(idle, write, [x()])
+        net.add_arc(write, db, [hash_map.add(hash_map.m(), key,
+                                             nat.succ(x()))])
+        net.add_arc(write, written, [nat.succ(x())])
+
+        read = net.add_transition('read_{}'.format(i))
+        net.add_arc(db, read, [hash_map.m()])
+        net.add_arc(written, read, [x()])
+        net.add_arc(read, db, [hash_map.m()])
+        net.add_arc(read, idle, [x()])
+        net.add_arc(read, result, [hash_map.get(hash_map.m(), key)])
+    return net
@@ -0,0 +1,354 @@
+"""
+Persistent (immutable, structurally shared) data structures.
+"""
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+
+
+def _hash(key):
+    return hash(key) & ((1 << _HASH_BITS) - 1)
+
+
+def _index(bitmap, bit):
+    return bin(bitmap & (bit - 1)).count('1')
+
+
+def _merge(entry1, hash1, entry2, hash2, shift):
+    """
+    Create the node holding two entries whose keys collide at some level
+    of the trie.
+    """
+    if shift >= _HASH_BITS:
+        return _CollisionNode(hash1, (entry1, entry2))
+    bit1 = 1 << ((hash1 >> shift) & _MASK)
+    bit2 = 1 << ((hash2 >> shift) & _MASK)
+    if bit1 == bit2:
+        return _BitmapNode(bit1, (_merge(entry1, hash1, entry2, hash2,
+                                         shift + _BITS),))
+    if bit1 < bit2:
+        return _BitmapNode(bit1 | bit2, (entry1, entry2))
+    return _BitmapNode(bit1 | bit2, (entry2, entry1))
+
+
+class _BitmapNode(object):
+    """
+    Node of a hash array mapped trie. The entries of a node are either
+    (key, value) tuples or child nodes.
+    """
+
+    __slots__ = ('bitmap', 'array')
+
+    def __init__(self, bitmap, array):
+        self.bitmap = bitmap
+        self.array = array
+
+    def get(self, key, h, shift, default):
+        bit = 1 << ((h >> shift) & _MASK)
+        if not self.bitmap & bit:
+            return default
+        entry = self.array[_index(self.bitmap, bit)]
+        if type(entry) == tuple:
+            return entry[1] if entry[0] == key else default
+        return entry.get(key, h, shift + _BITS, default)
+
+    def set(self, key, value, h, shift):
+        """
+        Returns:
+            The new node, and the previous entry for the key (or None).
+        """
+        bit = 1 << ((h >> shift) & _MASK)
+        i = _index(self.bitmap, bit)
+        if not self.bitmap & bit:
+            array = self.array[:i] + ((key, value),) + self.array[i:]
+            return _BitmapNode(self.bitmap | bit, array), None
+
+        entry = self.array[i]
+        if type(entry) == tuple:
+            if entry[0] == key:
+                if entry[1] is value:
+                    return self, entry
+                new_entry = (key, value)
+            else:
+                new_entry = _merge(entry, _hash(entry[0]), (key, value), h,
+                                   shift + _BITS)
+                entry = None
+        else:
+            new_entry, entry = entry.set(key, value, h, shift + _BITS)
+            if new_entry is self.array[i]:
+                return self, entry
+
+        array = self.array[:i] + (new_entry,) + self.array[i+1:]
+        return _BitmapNode(self.bitmap, array), entry
+
+    def delete(self, key, h, shift):
+        """
+        Returns:
+            The new node (None if it is empty, or a (key, value) tuple if it
+            only contains a single entry), and the deleted entry (or None).
+        """
+        bit = 1 << ((h >> shift) & _MASK)
+        if not self.bitmap & bit:
+            return self, None
+
+        i = _index(self.bitmap, bit)
+        entry = self.array[i]
+        if type(entry) == tuple:
+            if entry[0] != key:
+                return self, None
+            new_entry, removed = None, entry
+        else:
+            new_entry, removed = entry.delete(key, h, shift + _BITS)
+            if removed is None:
+                return self, None
+
+        if new_entry is None:
+            array = self.array[:i] + self.array[i+1:]
+            if not array:
+                return None, removed
+            if len(array) == 1 and type(array[0]) == tuple and shift > 0:
+                return array[0], removed
+            return _BitmapNode(self.bitmap ^ bit, array), removed
+
+        if type(new_entry) == tuple and len(self.array) == 1 and shift > 0:
+            return new_entry, removed
+        array = self.array[:i] + (new_entry,) + self.array[i+1:]
+        return _BitmapNode(self.bitmap, array), removed
+
+    def entries(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if type(node) == _CollisionNode:
+                yield from node.array
+                continue
+            for entry in node.array:
+                if type(entry) == tuple:
+                    yield entry
+                else:
+                    stack.append(entry)
+
+
+class _CollisionNode(object):
+    """
+    Leaf node of a hash array mapped trie holding entries whose keys have the
+    same hash.
+    """
+
+    __slots__ = ('hash', 'array')
+
+    def __init__(self, h, array):
+        self.hash = h
+        self.array = array
+
+    def _find(self, key):
+        for i, entry in enumerate(self.array):
+            if entry[0] == key:
+                return i
+        return -1
+
+    def get(self, key, h, shift, default):
+        i = self._find(key)
+        return self.array[i][1] if i >= 0 else default
+
+    def set(self, key, value, h, shift):
+        i = self._find(key)
+        if i < 0:
+            return _CollisionNode(self.hash, self.array + ((key, value),)),\
+                None
+        entry = self.array[i]
+        if entry[1] is value:
+            return self, entry
+        array = self.array[:i] + ((key, value),) + self.array[i+1:]
+        return _CollisionNode(self.hash, array), entry
+
+    def delete(self, key, h, shift):
+        i = self._find(key)
+        if i < 0:
+            return self, None
+        array = self.array[:i] + self.array[i+1:]
+        if len(array) == 1:
+            return array[0], self.array[i]
+        return _CollisionNode(self.hash, array), self.array[i]
+
+
+_EMPTY = _BitmapNode(0, ())
+
+
+def _entries(entry):
+    """
+    Iterate over the (key, value) pairs in an entry of a node of a trie.
+    """
+    if entry is None:
+        return ()
+    if type(entry) == tuple:
+        return (entry,)
+    if type(entry) == _CollisionNode:
+        return entry.array
+    return entry.entries()
+
+
+class PersistentMap(object):
+    """
+    Persistent map implemented with a hash array mapped trie (HAMT).
+
+    A persistent map is immutable: adding or removing an entry returns a new
+    map sharing most of its structure with the original one, in O(log n).
+    Keys must be hashable. The hash of a map only depends on its entries and
+    is maintained incrementally, so that maps can themselves be used as keys
+    or inside of terms.
+    """
+
+    __slots__ = ('_root', '_size', '_hash')
+
+    def __init__(self, items=()):
+        self._root = _EMPTY
+        self._size = 0
+        self._hash = 0
+        if isinstance(items, dict):
+            items = items.items()
+        for key, value in items:
+            self._insert(key, value)
+
+    @classmethod
+    def _make(cls, root, size, h):
+        new_map = cls.__new__(cls)
+        new_map._root = root
+        new_map._size = size
+        new_map._hash = h
+        return new_map
+
+    def _insert(self, key, value):
+        self._root, previous = self._root.set(key, value, _hash(key), 0)
+        if previous is None:
+            self._size += 1
+        else:
+            self._hash ^= hash(previous)
+        self._hash ^= hash((key, value))
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __contains__(self, key):
+        return self._root.get(key, _hash(key), 0, _EMPTY) is not _EMPTY
+
+    def __getitem__(self, key):
+        value = self._root.get(key, _hash(key), 0, _EMPTY)
+        if value is _EMPTY:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for key, _ in self._root.entries():
+            yield key
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(other) != PersistentMap or self._size != other._size\
+           or self._hash != other._hash:
+            return False
+        for key, value in self.items():
+            if other._root.get(key, _hash(key), 0, _EMPTY) != value:
+                return False
+        return True
+
+    def __str__(self):
+        return "{" + ", ".join("{}: {}".format(key, value)
+                               for key, value in self.items()) + "}"
+
+    def __repr__(self):
+        return str(self)
+
+    def get(self, key, default=None):
+        """
+        Get the value associated to a key in the map.
+
+        Args:
+            key: The key to look for.
+            default: The value to return if the key is not in the map.
+        """
+        return self._root.get(key, _hash(key), 0, default)
+
+    def items(self):
+        """
+        Iterate over the (key, value) pairs of the map.
+        """
+        return self._root.entries()
+
+    def set(self, key, value):
+        """
+        Associate a value to a key.
+
+        Returns:
+            A new map where the key is associated to the value.
+        """
+        root, previous = self._root.set(key, value, _hash(key), 0)
+        if root is self._root:
+            return self
+        h = self._hash ^ hash((key, value))
+        if previous is None:
+            return self._make(root, self._size + 1, h)
+        return self._make(root, self._size, h ^ hash(previous))
+
+    def delete(self, key):
+        """
+        Remove a key from the map.
+
+        Returns:
+            A new map without the key (the map itself if the key was absent).
+        """
+        root, removed = self._root.delete(key, _hash(key), 0)
+        if removed is None:
+            return self
+        if root is None:
+            root = _EMPTY
+        return self._make(root, self._size - 1, self._hash ^ hash(removed))
+
+    def diff(self, other):
+        """
+        Iterate over the keys associated to different values in the map and
+        in another one. The parts of the tries shared by the two maps are
+        skipped, so that comparing a map with a modified version of it takes
+        time proportional to the number of modifications.
+
+        Args:
+            other: The persistent map to compare to.
+
+        Yields:
+            (key, value, other_value) tuples, where value and other_value are
+            the values associated to the key in the map and in the other map
+            (or None if the key is absent from one of them).
+        """
+        stack = [(self._root, other._root)]
+        while stack:
+            node, other_node = stack.pop()
+            if node is other_node:
+                continue
+            if type(node) == _BitmapNode and type(other_node) == _BitmapNode:
+                for k in range(1 << _BITS):
+                    bit = 1 << k
+                    entry = other_entry = None
+                    if node.bitmap & bit:
+                        entry = node.array[_index(node.bitmap, bit)]
+                    if other_node.bitmap & bit:
+                        i = _index(other_node.bitmap, bit)
+                        other_entry = other_node.array[i]
+                    if entry is not other_entry:
+                        stack.append((entry, other_entry))
+                continue
+
+            entries = dict(_entries(node))
+            for key, other_value in _entries(other_node):
+                value = entries.pop(key, None)
+                if value is not other_value and value != other_value:
+                    yield (key, value, other_value)
+            for key, value in entries.items():
+                yield (key, value, None)
@@ -0,0 +1,504 @@
+"""
+Import and export of APNs in the Petri Net Markup Language (PNML).
+
+APNs are exported as high-level Petri nets (HLPN): the sorts, operations and
+variables they use are declared in the declaration of the net, and the terms
+of markings and arc inscriptions are written in the <text> element of their
+annotations, in the same format as Term.__str__ (e.g. nat.succ(nat.x)).
+
+Files are imported with an incremental XML parser, so that large nets can be
+read without building their whole document tree in memory. Both high-level
+nets and place/transition nets (where markings and inscriptions are integers,
+converted to black tokens) can be imported. Rewrite rules cannot be stored in
+PNML: the existing sorts of the net should be passed to load, so that the
+imported terms can be reduced with their rules.
+"""
+
+import re
+import ast
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+from alpyne.adt import Sort, GenericSort, Operation, Variable, Term
+from alpyne.apn import AlgebraicPetriNet
+from alpyne.exceptions import PNMLException
+from alpyne.persistent import PersistentMap
+
+NAMESPACE = 'http://www.pnml.org/version-2009/grammar/pnml'
+HLPN = 'http://www.pnml.org/version-2009/grammar/highlevelnet'
+
+_TOKEN = re.compile(r"""\s*(?:('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")"""
+                    r"""|([A-Za-z0-9_\-]+)|(\S))""")
+
+
+class PNMLSignature(object):
+    """
+    The sorts, operations and variables known when importing terms.
+    """
+
+    def __init__(self, sorts=()):
+        self.sorts = {}
+        # Names of the sorts created by the signature (the other ones are
+        # bound to existing sorts).
+        self.created = set()
+        # Operations by sort of their result and name.
+        self.operations = {}
+        # Variables declared for bound sorts that don't have them, by sort
+        # and name.
+        self.variables = {}
+        for sort in sorts:
+            self.add_sort(sort)
+        self.add_sort(GenericSort())
+
+    def add_sort(self, sort):
+        """
+        Add a sort to the signature, with its operations and the sorts they
+        use.
+        """
+        stack = [sort]
+        while stack:
+            sort = stack.pop()
+            if self.sorts.setdefault(sort.name, sort) != sort:
+                continue
+            for attr in list(sort.__dict__.values()):
+                if type(attr) == Operation and\
+                   attr not in self.operations.get((attr.sort.name,
+                                                    attr.name), []):
+                    self.add_operation(attr)
+                    stack.extend(s for s in attr.signature + (attr.sort,)
+                                 if s.name not in self.sorts)
+
+    def add_operation(self, op):
+        ops = self.operations.setdefault((op.sort.name, op.name), [])
+        if op not in ops:
+            ops.append(op)
+
+    def sort(self, name):
+        """
+        Get a sort by name, creating it if it is unknown.
+        """
+        if name not in self.sorts:
+            self.sorts[name] = Sort(name)
+            self.created.add(name)
+        return self.sorts[name]
+
+    def operation(self, sort, name, args):
+        """
+        Find the operation with some name and result sort that can be
+        applied on a tuple of arguments.
+        """
+        for op in self.operations.get((sort, name), []):
+            if len(op.signature) != len(args):
+                continue
+            if all(type(s) == GenericSort or s == arg.sort
+                   for s, arg in zip(op.signature, args)):
+                return op
+        raise PNMLException("Unknown operation {}.{} for arguments ({})"
+                            .format(sort, name,
+                                    ", ".join(str(a.sort) for a in args)))
+
+    def declare_variable(self, sort, name):
+        """
+        Declare a variable of a sort, unless the sort already has it. The
+        variables of bound sorts are only known by the signature, so that
+        importing a net doesn't change the existing sorts.
+        """
+        owner = self.sort(sort)
+        if type(owner.__dict__.get(name)) == Variable:
+            return
+        if sort in self.created:
+            owner.variable(name)
+        else:
+            self.variables.setdefault((sort, name), Variable(name, owner))
+
+    def variable(self, sort, name):
+        var = self.variables.get((sort, name))
+        if var is None:
+            var = self.sort(sort).__dict__.get(name)
+        if type(var) != Variable:
+            raise PNMLException("Unknown variable {}.{}".format(sort, name))
+        return var
+
+
+def parse_term(text, signature):
+    """
+    Parse a term written in the format of Term.__str__.
+
+    The parser doesn't use recursion, so that terms of any depth can be
+    parsed.
+
+    Args:
+        text: The text of the term.
+        signature: The PNMLSignature used to resolve sorts, operations and
+            variables.
+
+    Returns:
+        The parsed term.
+
+    Raises:
+        A PNMLException if the text isn't a valid term.
+    """
+    tokens = [m.group(m.lastindex) for m in _TOKEN.finditer(text)
+              if m.lastindex]
+    pos = 0
+
+    def next_token(expected=None):
+        nonlocal pos
+        if pos >= len(tokens):
+            raise PNMLException("Unexpected end of term: {}".format(text))
+        token = tokens[pos]
+        pos += 1
+        if expected is not None and token != expected:
+            raise PNMLException("Expected '{}' instead of '{}' in {}"
+                                .format(expected, token, text))
+        return token
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    # Stack of the operations and map literals being parsed, as lists
+    # [kind, sort, name, elements].
+    stack = []
+    while True:
+        sort = next_token()
+        next_token('.')
+        token = next_token()
+        term = None
+        if token[0] in '\'"':
+            term = signature.sort(sort).literal(ast.literal_eval(token))
+        elif token == '{':
+            stack.append(['map', sort, None, []])
+            if peek() == '}':
+                next_token()
+                stack.pop()
+                term = signature.sort(sort).literal(PersistentMap())
+        elif peek() == '(':
+            next_token()
+            stack.append(['op', sort, token, []])
+            if peek() == ')':
+                next_token()
+                stack.pop()
+                term = Term(signature.operation(sort, token, ()))
+        elif re.match(r'-?\d+$', token) and\
+                token not in signature.sort(sort).__dict__:
+            term = signature.sort(sort).literal(int(token))
+        else:
+            term = Term(signature.variable(sort, token))
+
+        # Add the completed terms to the operations or maps they belong to,
+        # and complete these in turn if they are closed.
+        while term is not None:
+            if not stack:
+                if pos != len(tokens):
+                    raise PNMLException("Unexpected text after term: {}"
+                                        .format(text))
+                return term
+            frame = stack[-1]
+            frame[3].append(term)
+            term = None
+            separator = next_token()
+            if frame[0] == 'op':
+                if separator == ')':
+                    stack.pop()
+                    args = tuple(frame[3])
+                    term = Term(signature.operation(frame[1], frame[2], args),
+                                args)
+                elif separator != ',':
+                    raise PNMLException("Unexpected '{}' in {}"
+                                        .format(separator, text))
+            else:
+                expected = ':' if len(frame[3]) % 2 else (',', '}')
+                if separator not in expected:
+                    raise PNMLException("Unexpected '{}' in {}"
+                                        .format(separator, text))
+                if separator == '}':
+                    stack.pop()
+                    items = frame[3]
+                    entries = PersistentMap(zip(items[::2], items[1::2]))
+                    term = signature.sort(frame[1]).literal(entries)
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child(element, *path):
+    for tag in path:
+        if element is None:
+            return None
+        found = None
+        for child in element:
+            if _local(child.tag) == tag:
+                found = child
+                break
+        element = found
+    return element
+
+
+def _text(element, *path):
+    element = _child(element, *path)
+    if element is None or element.text is None:
+        return None
+    return element.text.strip()
+
+
+def _terms(element, tag, signature, black_token):
+    """
+    Get the terms of an annotation of a place or arc: the terms of a
+    high-level annotation (one term per line), or a number of black tokens
+    for place/transition nets.
+    """
+    text = _text(element, 'hl' + tag, 'text')
+    if text is not None:
+        return [parse_term(line, signature)
+                for line in text.splitlines() if line.strip()]
+    text = _text(element, tag, 'text')
+    if text is None:
+        return []
+    try:
+        count = int(text)
+    except ValueError:
+        raise PNMLException("Invalid {}: {}".format(tag, text))
+    return [black_token] * count
+
+
+def load(source, sorts=(), rewrite_rules=None, black_token=None):
+    """
+    Import an APN from a PNML file. If the file contains several nets, only
+    the first one is imported.
+
+    Args:
+        source: The path of the file, or a file object.
+        sorts: A list of existing sorts to which the sorts of the net are
+            bound by name. Operations declared in the file but missing from
+            these sorts are created. Variables missing from them are only
+            created for the imported terms.
+        rewrite_rules: The rewrite rules of the imported APN.
+        black_token: The term used for the tokens of place/transition nets
+            (defaults to nat.zero()).
+
+    Returns:
+        The imported APN.
+
+    Raises:
+        A PNMLException if the file is invalid.
+    """
+    if black_token is None:
+        from alpyne.adts.natural import nat
+        black_token = nat.zero()
+    signature = PNMLSignature(sorts)
+    net = None
+    nodes = {}
+    pending_arcs = []
+    path = []
+    # Elements whose end wasn't reached yet, from the root.
+    parents = []
+
+    try:
+        for event, element in ET.iterparse(source, events=('start', 'end')):
+            tag = _local(element.tag)
+            if event == 'start':
+                path.append(tag)
+                parents.append(element)
+                if tag == 'net' and net is None:
+                    net = AlgebraicPetriNet(element.get('id', 'net'), [], [],
+                                            rewrite_rules)
+                continue
+
+            path.pop()
+            parents.pop()
+            if net is None:
+                continue
+            if tag == 'net':
+                break
+
+            if tag == 'name' and path and path[-1] == 'net':
+                name = _text(element, 'text')
+                if name:
+                    net.name = name
+            elif tag == 'namedsort':
+                signature.sort(element.get('name') or element.get('id'))
+            elif tag == 'namedoperator':
+                _declare_operation(element, signature)
+            elif tag == 'variabledecl' and 'parameter' not in path:
+                sort_name = _child(element, 'usersort').get('declaration')
+                name = element.get('name') or element.get('id')
+                signature.declare_variable(sort_name, name)
+            elif tag == 'place':
+                _import_place(element, net, nodes, signature, black_token)
+            elif tag == 'transition':
+                name = _text(element, 'name', 'text') or element.get('id')
+                nodes[element.get('id')] = net.add_transition(name)
+            elif tag == 'arc':
+                label = _terms(element, 'inscription', signature,
+                               black_token)
+                if not label and _child(element, 'inscription') is None and\
+                   _child(element, 'hlinscription') is None:
+                    label = [black_token]
+                pending_arcs.append((element.get('source'),
+                                     element.get('target'), label))
+            else:
+                continue
+            # Processed elements are removed from the tree, so that the
+            # memory used by the parser doesn't grow with the file.
+            element.clear()
+            if parents:
+                parents[-1].remove(element)
+    except ET.ParseError as error:
+        raise PNMLException("Invalid PNML file: {}".format(error))
+
+    if net is None:
+        raise PNMLException("No net found in the PNML file")
+    for source_id, target_id, label in pending_arcs:
+        if source_id not in nodes or target_id not in nodes:
+            raise PNMLException("Arc between unknown nodes {} and {}"
+                                .format(source_id, target_id))
+        net.add_arc(nodes[source_id], nodes[target_id], label)
+    return net
+
+
+def _declare_operation(element, signature):
+    op_id = element.get('id')
+    name = element.get('name') or op_id.rsplit('.', 1)[-1]
+    owner = signature.sort(op_id.rsplit('.', 1)[0] if '.' in op_id
+                           else element.get('sort'))
+    parameter = _child(element, 'parameter')
+    sorts = []
+    if parameter is not None:
+        for child in parameter.iter():
+            if _local(child.tag) == 'usersort':
+                sorts.append(signature.sort(child.get('declaration')))
+    result = signature.sort(element.get('sort') or owner.name)
+    if type(owner.__dict__.get(name)) != Operation:
+        owner.operation(name, tuple(sorts), result)
+        signature.add_operation(owner.__dict__[name])
+
+
+def _import_place(element, net, nodes, signature, black_token):
+    name = _text(element, 'name', 'text') or element.get('id')
+    sort_element = _child(element, 'type', 'structure', 'usersort')
+    if sort_element is not None:
+        sort = signature.sort(sort_element.get('declaration'))
+    elif _text(element, 'type', 'text'):
+        sort = signature.sort(_text(element, 'type', 'text'))
+    else:
+        sort = black_token.sort
+    marking = _terms(element, 'initialMarking', signature, black_token)
+    nodes[element.get('id')] = net.add_place(name, sort, marking)
+
+
+def _label_variables(net):
+    """
+    Get the variables of the arc labels of an APN, in the order of their
+    first occurrence.
+    """
+    variables = {}
+    for transition in net.transitions:
+        for arc in transition.inbound_arcs + transition.outbound_arcs:
+            for term in arc.label:
+                for var in sorted(term.variables(), key=str):
+                    variables.setdefault(var, None)
+    return list(variables)
+
+
+def _declared_sorts(net, sorts, variables=()):
+    """
+    Get the sorts to declare when exporting an APN (the sorts of its places
+    and of the variables of its labels), with the ones their operations
+    use.
+    """
+    declared = []
+    stack = [place.sort for place in net.places] +\
+        [var.sort for var in variables] + list(sorts)
+    while stack:
+        sort = stack.pop()
+        if sort in declared:
+            continue
+        declared.append(sort)
+        for attr in list(sort.__dict__.values()):
+            if type(attr) == Operation:
+                stack.extend(attr.signature)
+                stack.append(attr.sort)
+    return declared
+
+
+def _write_variable(write, sort, name):
+    write('<variabledecl id={} name={}><usersort declaration={}/>'
+          '</variabledecl>\n'.format(quoteattr(sort + '.' + name),
+                                     quoteattr(name), quoteattr(sort)))
+
+
+def dump(filepath, net, sorts=()):
+    """
+    Export an APN to a PNML file, as a high-level Petri net. The file is
+    written incrementally.
+
+    Args:
+        filepath: The path of the file.
+        net: The APN to export.
+        sorts: Additional sorts to declare in the file (the sorts of the
+            places of the net, and the ones they depend on, are always
+            declared).
+    """
+    with open(filepath, 'w', encoding='utf-8') as output:
+        write = output.write
+        write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        write('<pnml xmlns={}>\n'.format(quoteattr(NAMESPACE)))
+        write('<net id={} type={}>\n'.format(quoteattr(net.name),
+                                            quoteattr(HLPN)))
+        write('<name><text>{}</text></name>\n'.format(escape(net.name)))
+
+        write('<declaration><structure><declarations>\n')
+        variables = _label_variables(net)
+        declared = set()
+        for sort in _declared_sorts(net, sorts, variables):
+            write('<namedsort id={0} name={0}/>\n'
+                  .format(quoteattr(sort.name)))
+            for name, attr in list(sort.__dict__.items()):
+                if type(attr) == Operation:
+                    write('<namedoperator id={} name={} sort={}><parameter>'
+                          .format(quoteattr(sort.name + '.' + name),
+                                  quoteattr(name), quoteattr(attr.sort.name)))
+                    for s in attr.signature:
+                        write('<usersort declaration={}/>'
+                              .format(quoteattr(s.name)))
+                    write('</parameter></namedoperator>\n')
+                elif type(attr) == Variable:
+                    declared.add((sort.name, name))
+                    _write_variable(write, sort.name, name)
+        # Variables of the labels that aren't attributes of their sort.
+        for var in variables:
+            if (var.sort.name, var.name) not in declared:
+                declared.add((var.sort.name, var.name))
+                _write_variable(write, var.sort.name, var.name)
+        write('</declarations></structure></declaration>\n')
+
+        write('<page id="page">\n')
+        ids = {}
+        for i, place in enumerate(net.places):
+            ids[place] = 'p{}'.format(i)
+            write('<place id="p{}"><name><text>{}</text></name>'
+                  .format(i, escape(place.name)))
+            write('<type><text>{0}</text><structure><usersort '
+                  'declaration={1}/></structure></type>'
+                  .format(escape(place.sort.name), quoteattr(place.sort.name)))
+            if place.marking:
+                write('<hlinitialMarking><text>')
+                for token in place.marking:
+                    write(escape(str(token)) + '\n')
+                write('</text></hlinitialMarking>')
+            write('</place>\n')
+
+        arcs = 0
+        for i, transition in enumerate(net.transitions):
+            ids[transition] = 't{}'.format(i)
+            write('<transition id="t{}"><name><text>{}</text></name>'
+                  '</transition>\n'.format(i, escape(transition.name)))
+            for arc in transition.inbound_arcs + transition.outbound_arcs:
+                write('<arc id="a{}" source="{}" target="{}">'
+                      .format(arcs, ids[arc.source], ids[arc.target]))
+                write('<hlinscription><text>')
+                for term in arc.label:
+                    write(escape(str(term)) + '\n')
+                write('</text></hlinscription></arc>\n')
+                arcs += 1
+        write('</page>\n</net>\n</pnml>\n')
@@ -0,0 +1,214 @@
+"""
+Opt-in instrumentation of term rewriting and of the firing of transitions.
+
+Profiling is disabled by default, and the instrumented functions only check
+whether a profiler is active before running as usual. A profiler is enabled
+by using it as a context manager:
+
+    with Profiler() as profiler:
+        apn.fire_random()
+    print(profiler.report())
+"""
+
+import time
+
+# The profiler currently in use, or None if profiling is disabled.
+_profiler = None
+
+
+def active():
+    """
+    Get the profiler currently in use, or None if profiling is disabled.
+    """
+    return _profiler
+
+
+class RuleStats(object):
+    """
+    Statistics on the applications of a rewrite rule.
+
+    Attributes:
+        attempts: The number of subterms the rule was tried on.
+        matches: The number of subterms matching the lhs of the rule.
+        fires: The number of subterms actually rewritten by the rule.
+        condition_time: The time spent evaluating the conditions of the
+            rule, in seconds.
+    """
+
+    __slots__ = ('attempts', 'matches', 'fires', 'condition_time')
+
+    def __init__(self):
+        self.attempts = 0
+        self.matches = 0
+        self.fires = 0
+        self.condition_time = 0.0
+
+
+class TransitionStats(object):
+    """
+    Statistics on a transition.
+
+    Attributes:
+        checks: The number of times the fireability of the transition was
+            checked.
+        fireable: The number of checks where the transition was fireable.
+        check_time: The time spent checking the fireability of the
+            transition, in seconds.
+        bindings: The total number of variable bindings computed by the
+            checks.
+        fires: The number of times the transition was fired.
+        fire_time: The time spent firing the transition (including the
+            fireability check and the reduction of the labels), in seconds.
+    """
+
+    __slots__ = ('checks', 'fireable', 'check_time', 'bindings', 'fires',
+                 'fire_time')
+
+    def __init__(self):
+        self.checks = 0
+        self.fireable = 0
+        self.check_time = 0.0
+        self.bindings = 0
+        self.fires = 0
+        self.fire_time = 0.0
+
+
+class Profiler(object):
+    """
+    Profiler collecting statistics on the rewrite rules applied and the
+    transitions checked and fired while it is enabled.
+
+    Attributes:
+        reductions: The number of terms reduced.
+        passes: The number of passes over the rewrite rules.
+        conditions: The number of conditions of rules evaluated.
+        condition_reductions: The number of terms of conditions reduced.
+        condition_hits: The number of terms of conditions whose normal form
+            was found in the cache of the normalization in progress.
+    """
+
+    def __init__(self):
+        self.rules = {}
+        self.transitions = {}
+        self.reductions = 0
+        self.passes = 0
+        self.conditions = 0
+        self.condition_reductions = 0
+        self.condition_hits = 0
+        self._previous = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    def enable(self):
+        """
+        Start collecting statistics with the profiler.
+        """
+        global _profiler
+        self._previous = _profiler
+        _profiler = self
+
+    def disable(self):
+        """
+        Stop collecting statistics with the profiler (the profiler that was
+        active before it was enabled, if any, is restored).
+        """
+        global _profiler
+        _profiler = self._previous
+        self._previous = None
+
+    def reset(self):
+        """
+        Clear the statistics collected by the profiler.
+        """
+        self.rules = {}
+        self.transitions = {}
+        self.reductions = 0
+        self.passes = 0
+        self.conditions = 0
+        self.condition_reductions = 0
+        self.condition_hits = 0
+
+    def rule(self, rule):
+        """
+        Get the statistics on a rewrite rule.
+        """
+        stats = self.rules.get(rule)
+        if stats is None:
+            stats = self.rules[rule] = RuleStats()
+        return stats
+
+    def transition(self, transition):
+        """
+        Get the statistics on a transition.
+        """
+        stats = self.transitions.get(transition)
+        if stats is None:
+            stats = self.transitions[transition] = TransitionStats()
+        return stats
+
+    def hot_rules(self, limit=None):
+        """
+        Get the rules that were fired the most.
+
+        Args:
+            limit: The maximum number of rules to return (all by default).
+
+        Returns:
+            A list of (rule, statistics) tuples sorted by decreasing number
+            of fires, matches and attempts.
+        """
+        rules = sorted(self.rules.items(),
+                       key=lambda item: (item[1].fires, item[1].matches,
+                                         item[1].attempts),
+                       reverse=True)
+        return rules[:limit]
+
+    def report(self, limit=10):
+        """
+        Build a textual report of the statistics collected.
+
+        Args:
+            limit: The maximum number of rules and transitions to list.
+
+        Returns:
+            A string with the report.
+        """
+        lines = ["{} reductions, {} passes over the rewrite rules"
+                 .format(self.reductions, self.passes),
+                 "{} conditions evaluated, {} terms of conditions reduced, "
+                 "{} found in cache".format(self.conditions,
+                                            self.condition_reductions,
+                                            self.condition_hits),
+                 "{:>10} {:>10} {:>10} {:>12}  {}"
+                 .format("attempts", "matches", "fires", "cond. time",
+                         "rule")]
+        for rule, stats in self.hot_rules(limit):
+            lines.append("{:>10} {:>10} {:>10} {:>11.6f}s  {}"
+                         .format(stats.attempts, stats.matches, stats.fires,
+                                 stats.condition_time, rule))
+
+        lines.append("{:>10} {:>10} {:>12} {:>10} {:>12}  {}"
+                     .format("checks", "fireable", "check time", "bindings",
+                             "fire time", "transition"))
+        transitions = sorted(self.transitions.items(),
+                             key=lambda item: (item[1].check_time
+                                               + item[1].fire_time),
+                             reverse=True)
+        for transition, stats in transitions[:limit]:
+            lines.append("{:>10} {:>10} {:>11.6f}s {:>10} {:>11.6f}s  {}"
+                         .format(stats.checks, stats.fireable,
+                                 stats.check_time, stats.bindings,
+                                 stats.fire_time, transition.name))
+        return "\n".join(lines)
+
+
+def timer():
+    """
+    Get the current value of the clock used by the profilers.
+    """
+    return time.perf_counter()
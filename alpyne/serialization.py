@@ -0,0 +1,658 @@
+"""
+Compact binary serialization of ADTs, rewrite rules, APNs and markings.
+
+The format interns all the names it contains in a symbol table, and encodes
+terms as a DAG where structurally equal subterms are stored only once. All
+integers are stored as variable-length unsigned integers (LEB128). A file
+contains the following sections, in order:
+
+    header:      b'APYN' and the version of the format.
+    symbols:     the names and string values used in the file.
+    sorts:       the sorts used in the file.
+    operations:  the operations used in the file.
+    variables:   the variables used in the file.
+    terms:       the terms used in the file, each term only referencing terms
+                 defined before it.
+    rules:       the rewrite rules stored in the file.
+    contents:    the sorts, rules, APN and marking that were saved.
+
+Sorts, operations and variables are bound by name to the sorts passed to the
+loading functions if they have the same name, so that the loaded terms can be
+used together with the ones of the existing ADTs. Since several ADTs can
+declare variables with the same name on the generic sort, generic variables
+are bound to the ones used in the rules of these sorts first. Sorts with
+native rewrite rules or literals (such as alpyne.adts.string or
+alpyne.adts.hashmap) should always be bound this way.
+"""
+
+import importlib
+import mmap
+import os
+from itertools import islice
+from alpyne.adt import Sort, GenericSort, Operation, Variable, Literal, Term,\
+    RewriteRule, NativeRule
+from alpyne.apn import AlgebraicPetriNet
+from alpyne.exceptions import SerializationException
+from alpyne.persistent import PersistentMap
+
+MAGIC = b'APYN'
+VERSION = 1
+
+# Kinds of terms.
+_OPERATION = 0
+_VARIABLE = 1
+_LITERAL = 2
+
+# Kinds of literal values.
+_STR = 0
+_INT = 1
+_MAP = 2
+
+
+def _function_path(function):
+    return "{}:{}".format(function.__module__, function.__qualname__)
+
+
+def _resolve_function(path):
+    module, _, name = path.partition(':')
+    try:
+        function = importlib.import_module(module)
+        for attr in name.split('.'):
+            function = getattr(function, attr)
+    except (ImportError, AttributeError):
+        raise SerializationException("Cannot find function {}".format(path))
+    return function
+
+
+class _Encoder(object):
+    """
+    Encoder collecting the tables of the objects to serialize.
+    """
+
+    def __init__(self):
+        self.symbols = {}
+        self.sorts = {}
+        self.operations = {}
+        self.variables = {}
+        self.terms = {}
+        self.rules = {}
+        # The sort in which each operation is defined.
+        self.owners = {}
+        # The number of entries of each table already encoded.
+        self.encoded = (0, 0, 0, 0, 0, 0)
+
+    def uint(self, value, out):
+        while value > 0x7f:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    def _intern(self, table, key):
+        index = table.get(key)
+        if index is None:
+            index = table[key] = len(table)
+        return index
+
+    def symbol(self, name):
+        return self._intern(self.symbols, name)
+
+    def sort(self, sort):
+        if sort in self.sorts:
+            return self.sorts[sort]
+        index = self._intern(self.sorts, sort)
+        self.symbol(sort.name)
+        if sort.expand is not None:
+            self.symbol(_function_path(sort.expand))
+        for attr in list(sort.__dict__.values()):
+            if type(attr) == Operation:
+                self.owners.setdefault(attr, sort)
+        return index
+
+    def operation(self, op):
+        if op in self.operations:
+            return self.operations[op]
+        for s in op.signature:
+            self.sort(s)
+        self.sort(op.sort)
+        self.symbol(op.name)
+        return self._intern(self.operations, op)
+
+    def variable(self, var):
+        if var in self.variables:
+            return self.variables[var]
+        self.sort(var.sort)
+        self.symbol(var.name)
+        return self._intern(self.variables, var)
+
+    def term(self, term):
+        """
+        Intern a term and all its subterms, children first.
+        """
+        if term in self.terms:
+            return self.terms[term]
+        stack = [(term, False)]
+        while stack:
+            t, visited = stack.pop()
+            if t in self.terms:
+                continue
+            if visited:
+                self._head(t.head)
+                self.terms[t] = len(self.terms)
+                continue
+            stack.append((t, True))
+            for child in reversed(self._children(t)):
+                if child not in self.terms:
+                    stack.append((child, False))
+        return self.terms[term]
+
+    def _children(self, term):
+        if type(term.head) == Literal and\
+           type(term.head.value) == PersistentMap:
+            children = []
+            for key, value in term.head.value.items():
+                children.append(key)
+                children.append(value)
+            return children
+        return term.args
+
+    def _head(self, head):
+        if type(head) == Operation:
+            self.operation(head)
+        elif type(head) == Variable:
+            self.variable(head)
+        else:
+            self.sort(head.sort)
+            if type(head.value) == str:
+                self.symbol(head.value)
+            elif type(head.value) not in (int, PersistentMap):
+                raise SerializationException(
+                    "Cannot serialize literal value {!r}".format(head.value))
+
+    def rule(self, rule):
+        if rule in self.rules:
+            return self.rules[rule]
+        self.term(rule.lhs)
+        if type(rule) == NativeRule:
+            self.symbol(_function_path(rule.function))
+        else:
+            self.term(rule.rhs)
+        for condition in rule.conditions:
+            self.term(condition[0])
+            self.term(condition[1])
+        return self._intern(self.rules, rule)
+
+    def tables(self):
+        """
+        Encode the tables of the encoder.
+
+        Returns:
+            A bytearray with the header and tables of the file.
+        """
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        self.encoded = (0, 0, 0, 0, 0, 0)
+        self.delta(out)
+        return out
+
+    def delta(self, out):
+        """
+        Encode the entries added to the tables since they were last encoded,
+        in the same format as the tables of a file.
+
+        Args:
+            out: The bytearray to which the entries are appended.
+        """
+        tables = (self.symbols, self.sorts, self.operations, self.variables,
+                  self.terms, self.rules)
+        symbols, sorts, operations, variables, terms, rules = (
+            list(islice(table, start, None))
+            for table, start in zip(tables, self.encoded))
+        self.encoded = tuple(len(table) for table in tables)
+
+        self.uint(len(symbols), out)
+        for name in symbols:
+            data = name.encode('utf-8')
+            self.uint(len(data), out)
+            out += data
+
+        self.uint(len(sorts), out)
+        for sort in sorts:
+            out.append(1 if type(sort) == GenericSort else 0)
+            self.uint(self.symbols[sort.name], out)
+            if sort.expand is None:
+                self.uint(0, out)
+            else:
+                self.uint(self.symbols[_function_path(sort.expand)] + 1, out)
+
+        self.uint(len(operations), out)
+        for op in operations:
+            self.uint(self.sorts[self.owners.get(op, op.sort)], out)
+            self.uint(self.symbols[op.name], out)
+            self.uint(len(op.signature), out)
+            for s in op.signature:
+                self.uint(self.sorts[s], out)
+            self.uint(self.sorts[op.sort], out)
+
+        self.uint(len(variables), out)
+        for var in variables:
+            self.uint(self.sorts[var.sort], out)
+            self.uint(self.symbols[var.name], out)
+
+        self.uint(len(terms), out)
+        for term in terms:
+            head = term.head
+            if type(head) == Operation:
+                out.append(_OPERATION)
+                self.uint(self.operations[head], out)
+                for arg in term.args:
+                    self.uint(self.terms[arg], out)
+            elif type(head) == Variable:
+                out.append(_VARIABLE)
+                self.uint(self.variables[head], out)
+            else:
+                out.append(_LITERAL)
+                self.uint(self.sorts[head.sort], out)
+                value = head.value
+                if type(value) == str:
+                    out.append(_STR)
+                    self.uint(self.symbols[value], out)
+                elif type(value) == int:
+                    out.append(_INT)
+                    self.uint((value << 1) if value >= 0
+                              else ((-value << 1) - 1), out)
+                else:
+                    out.append(_MAP)
+                    self.uint(len(value), out)
+                    for key, item in value.items():
+                        self.uint(self.terms[key], out)
+                        self.uint(self.terms[item], out)
+
+        self.uint(len(rules), out)
+        for rule in rules:
+            native = type(rule) == NativeRule
+            out.append(1 if native else 0)
+            self.uint(self.terms[rule.lhs], out)
+            if native:
+                self.uint(self.symbols[_function_path(rule.function)], out)
+            else:
+                self.uint(self.terms[rule.rhs], out)
+            self.uint(len(rule.conditions), out)
+            for condition in rule.conditions:
+                self.uint(self.terms[condition[0]], out)
+                self.uint(self.terms[condition[1]], out)
+
+
+class _Decoder(object):
+    """
+    Decoder reading the tables and contents of a serialized file.
+    """
+
+    def __init__(self, data, sorts=(), header=True):
+        if header:
+            # The header is checked before the data is exported to a view,
+            # so that a memory map can be closed after an invalid header.
+            with memoryview(data) as view:
+                start = bytes(view[:5])
+            if len(start) < 5 or start[:4] != MAGIC:
+                raise SerializationException("Not a serialized alpyne file")
+            if start[4] != VERSION:
+                raise SerializationException(
+                    "Unsupported format version {}".format(start[4]))
+        self.data = memoryview(data)
+        self.pos = 0
+        self.bound = {}
+        self.generic_variables = {}
+        for sort in sorts:
+            assert isinstance(sort, Sort), "Sorts must be instances of Sort"
+            self.bound[sort.name] = sort
+            for rule in sort.rewrite_rules:
+                for var in rule.lhs.variables():
+                    if type(var.sort) == GenericSort:
+                        self.generic_variables.setdefault(var.name, var)
+        self.symbols = []
+        self.sorts = []
+        self.created = []
+        self.operations = []
+        self.variables = []
+        self.terms = []
+        self.rules = []
+        if not header:
+            return
+
+        self.pos = 5
+        try:
+            self.tables()
+        except IndexError:
+            self.data.release()
+            raise SerializationException("Truncated file")
+        except Exception:
+            self.data.release()
+            raise
+
+    def uint(self):
+        data = self.data
+        result = 0
+        shift = 0
+        while True:
+            byte = data[self.pos]
+            self.pos += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def byte(self):
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def tables(self):
+        """
+        Read table entries, appending them to the tables of the decoder.
+        """
+        for _ in range(self.uint()):
+            size = self.uint()
+            self.symbols.append(str(self.data[self.pos:self.pos + size],
+                                    'utf-8'))
+            self.pos += size
+
+        for _ in range(self.uint()):
+            generic = self.byte()
+            name = self.symbols[self.uint()]
+            expand = self.uint()
+            if generic:
+                sort = GenericSort()
+            elif name in self.bound:
+                sort = self.bound[name]
+            else:
+                sort = Sort(name)
+                self.created.append(sort)
+                if expand:
+                    sort.literal_expansion(
+                        _resolve_function(self.symbols[expand - 1]))
+            self.sorts.append(sort)
+
+        for _ in range(self.uint()):
+            owner = self.sorts[self.uint()]
+            name = self.symbols[self.uint()]
+            signature = tuple(self.sorts[self.uint()]
+                              for _ in range(self.uint()))
+            sort = self.sorts[self.uint()]
+            op = Operation(name, signature, sort)
+            existing = owner.__dict__.get(name)
+            if existing == op:
+                op = existing
+            elif existing is None:
+                owner.__dict__[name] = op
+            self.operations.append(op)
+
+        for _ in range(self.uint()):
+            sort = self.sorts[self.uint()]
+            name = self.symbols[self.uint()]
+            existing = sort.__dict__.get(name)
+            if type(sort) == GenericSort:
+                existing = self.generic_variables.get(name, existing)
+            if type(existing) == Variable and existing.sort == sort:
+                var = existing
+            else:
+                var = Variable(name, sort)
+                if existing is None:
+                    sort.__dict__[name] = var
+            self.variables.append(var)
+
+        terms = self.terms
+        for _ in range(self.uint()):
+            kind = self.byte()
+            if kind == _OPERATION:
+                op = self.operations[self.uint()]
+                args = tuple(terms[self.uint()]
+                             for _ in range(len(op.signature)))
+                terms.append(Term(op, args))
+            elif kind == _VARIABLE:
+                terms.append(Term(self.variables[self.uint()]))
+            elif kind == _LITERAL:
+                sort = self.sorts[self.uint()]
+                value_kind = self.byte()
+                if value_kind == _STR:
+                    value = self.symbols[self.uint()]
+                elif value_kind == _INT:
+                    value = self.uint()
+                    value = -((value + 1) >> 1) if value & 1 else value >> 1
+                elif value_kind == _MAP:
+                    value = PersistentMap((terms[self.uint()],
+                                           terms[self.uint()])
+                                          for _ in range(self.uint()))
+                else:
+                    raise SerializationException("Invalid literal kind")
+                terms.append(Term(Literal(value, sort)))
+            else:
+                raise SerializationException("Invalid term kind")
+
+        for _ in range(self.uint()):
+            native = self.byte()
+            lhs = terms[self.uint()]
+            if native:
+                function = _resolve_function(self.symbols[self.uint()])
+            else:
+                rhs = terms[self.uint()]
+            conditions = [(terms[self.uint()], terms[self.uint()])
+                          for _ in range(self.uint())]
+            if native:
+                self.rules.append(NativeRule(lhs, function, conditions))
+            else:
+                self.rules.append(RewriteRule(lhs, rhs, conditions))
+
+    def term_list(self):
+        return [self.terms[self.uint()] for _ in range(self.uint())]
+
+
+class Bundle(object):
+    """
+    Objects loaded from a serialized file.
+
+    Attributes:
+        sorts: A dict with the sorts saved in the file, by name.
+        rules: The list of rewrite rules saved in the file.
+        net: The APN saved in the file, or None.
+    """
+
+    def __init__(self, sorts, rules, net):
+        self.sorts = sorts
+        self.rules = rules
+        self.net = net
+
+
+def _encode_net(encoder, net, out):
+    places = {}
+    encoder.uint(encoder.symbol(net.name), out)
+    encoder.uint(len(net.places), out)
+    for i, place in enumerate(net.places):
+        places[place] = i
+        encoder.uint(encoder.symbol(place.name), out)
+        encoder.uint(encoder.sort(place.sort), out)
+        _encode_terms(encoder, place.marking, out)
+    encoder.uint(len(net.transitions), out)
+    for transition in net.transitions:
+        encoder.uint(encoder.symbol(transition.name), out)
+        for arcs, attr in ((transition.inbound_arcs, 'source'),
+                           (transition.outbound_arcs, 'target')):
+            encoder.uint(len(arcs), out)
+            for arc in arcs:
+                encoder.uint(places[getattr(arc, attr)], out)
+                _encode_terms(encoder, arc.label, out)
+    _encode_rules(encoder, net.rewrite_rules, out)
+
+
+def _encode_terms(encoder, terms, out):
+    encoder.uint(len(terms), out)
+    for term in terms:
+        encoder.uint(encoder.term(term), out)
+
+
+def _encode_rules(encoder, rules, out):
+    encoder.uint(len(rules), out)
+    for rule in rules:
+        encoder.uint(encoder.rule(rule), out)
+
+
+def _decode_net(decoder):
+    name = decoder.symbols[decoder.uint()]
+    net = AlgebraicPetriNet(name, [], [])
+    places = []
+    for _ in range(decoder.uint()):
+        place_name = decoder.symbols[decoder.uint()]
+        sort = decoder.sorts[decoder.uint()]
+        places.append(net.add_place(place_name, sort, decoder.term_list()))
+    arcs = []
+    for _ in range(decoder.uint()):
+        transition = net.add_transition(decoder.symbols[decoder.uint()])
+        for _ in range(decoder.uint()):
+            place = places[decoder.uint()]
+            arcs.append((place, transition, decoder.term_list()))
+        for _ in range(decoder.uint()):
+            place = places[decoder.uint()]
+            arcs.append((transition, place, decoder.term_list()))
+    # The rules follow the arcs in the data, but must be set before adding
+    # them for their ground labels to be reduced with the rules of the net.
+    net.rewrite_rules = [decoder.rules[decoder.uint()]
+                         for _ in range(decoder.uint())]
+    for source, target, label in arcs:
+        net.add_arc(source, target, label)
+    return net
+
+
+def dumps(sorts=(), rules=(), net=None):
+    """
+    Serialize sorts (with their operations, variables and rewrite rules),
+    rewrite rules and an APN (with its marking).
+
+    Args:
+        sorts: A list of sorts to serialize.
+        rules: A list of rewrite rules to serialize.
+        net: An APN to serialize, or None.
+
+    Returns:
+        The serialized objects, as bytes.
+    """
+    encoder = _Encoder()
+    contents = bytearray()
+    encoder.uint(len(sorts), contents)
+    for sort in sorts:
+        assert isinstance(sort, Sort), "Sorts must be instances of Sort"
+        encoder.uint(encoder.sort(sort), contents)
+        for attr in list(sort.__dict__.values()):
+            if type(attr) == Operation:
+                encoder.operation(attr)
+            elif type(attr) == Variable:
+                encoder.variable(attr)
+        _encode_rules(encoder, sort.rewrite_rules, contents)
+    _encode_rules(encoder, rules, contents)
+    if net is None:
+        contents.append(0)
+    else:
+        contents.append(1)
+        _encode_net(encoder, net, contents)
+    return bytes(encoder.tables() + contents)
+
+
+def loads(data, sorts=()):
+    """
+    Load objects serialized with dumps.
+
+    Args:
+        data: The serialized objects (bytes or any object supporting the
+            buffer protocol, such as a memory map).
+        sorts: A list of existing sorts to which the sorts with the same
+            name in the data are bound. The rewrite rules of bound sorts
+            are left unchanged.
+
+    Returns:
+        A Bundle with the loaded objects.
+
+    Raises:
+        A SerializationException if the data is invalid.
+
+    Only trusted data should be loaded: the native rewrite rules of the data
+    are resolved by importing the modules and functions it names.
+    """
+    decoder = _Decoder(data, sorts)
+    try:
+        loaded = {}
+        for _ in range(decoder.uint()):
+            sort = decoder.sorts[decoder.uint()]
+            rules = [decoder.rules[decoder.uint()]
+                     for _ in range(decoder.uint())]
+            if sort in decoder.created:
+                sort.rewrite_rules = rules
+            loaded[sort.name] = sort
+        rules = [decoder.rules[decoder.uint()] for _ in range(decoder.uint())]
+        net = _decode_net(decoder) if decoder.byte() else None
+    except IndexError:
+        raise SerializationException("Truncated file")
+    finally:
+        decoder.data.release()
+    return Bundle(loaded, rules, net)
+
+
+def dump(filepath, sorts=(), rules=(), net=None):
+    """
+    Serialize objects to a file (see dumps).
+    """
+    with open(filepath, 'wb') as output:
+        output.write(dumps(sorts, rules, net))
+
+
+def load(filepath, sorts=()):
+    """
+    Load objects serialized to a file (see loads). The file is memory mapped
+    instead of being read. As with loads, only trusted files should be
+    loaded.
+    """
+    with open(filepath, 'rb') as source:
+        if os.fstat(source.fileno()).st_size == 0:
+            # Empty files cannot be memory mapped.
+            raise SerializationException("Not a serialized alpyne file")
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            bundle = loads(data, sorts)
+    return bundle
+
+
+def dumps_marking(net):
+    """
+    Serialize the marking of an APN.
+
+    Returns:
+        The serialized marking, as bytes.
+    """
+    encoder = _Encoder()
+    contents = bytearray()
+    encoder.uint(len(net.places), contents)
+    for place in net.places:
+        _encode_terms(encoder, place.marking, contents)
+    return bytes(encoder.tables() + contents)
+
+
+def loads_marking(net, data, sorts=()):
+    """
+    Restore the marking of an APN serialized with dumps_marking. The APN
+    must have the same places as the one whose marking was serialized.
+
+    Args:
+        net: The APN whose marking must be restored.
+        data: The serialized marking.
+        sorts: Additional sorts to bind the sorts of the serialized terms
+            to (the sorts of the places of the net are always bound).
+    """
+    decoder = _Decoder(data, [place.sort for place in net.places]
+                       + list(sorts))
+    try:
+        if decoder.uint() != len(net.places):
+            raise SerializationException(
+                "The marking doesn't match the places of the APN")
+        markings = [decoder.term_list() for _ in net.places]
+    except IndexError:
+        raise SerializationException("Truncated file")
+    finally:
+        decoder.data.release()
+    for place, marking in zip(net.places, markings):
+        place.marking = marking
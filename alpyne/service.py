@@ -0,0 +1,376 @@
+"""
+Asyncio service running the simulations of many APNs concurrently.
+
+Each APN started in the service has its own queue of step requests, served
+by a worker task. Steps are fired in slices, and workers yield to the event
+loop between slices, so that many nets make progress cooperatively without
+blocking the loop. The queues are bounded: when a net has too many pending
+requests, new requests wait until there is room for them (backpressure).
+Each net can also have a budget limiting the total number of steps fired.
+
+The steps of a net can be offloaded to an executor (typically a
+concurrent.futures.ProcessPoolExecutor): the net is serialized with
+alpyne.serialization, simulated in the executor, and its new marking is
+loaded back. This pays off for nets whose steps need heavy reductions.
+
+Requests are plain dicts, so that the service can be exposed through any
+transport. LocalClient sends them to a service in the same process:
+
+    service = SimulationService()
+    client = LocalClient(service)
+    await client.start('net', apn, budget=1000)
+    await client.step('net', 100)
+    marking = await client.marking('net')
+"""
+
+import asyncio
+import importlib
+import random
+from alpyne import serialization
+from alpyne.adt import NativeRule
+from alpyne.exceptions import ServiceException
+
+
+class _Simulation(object):
+    """
+    State of a simulation running in the service.
+    """
+
+    def __init__(self, net, budget, sorts, paths, queue):
+        self.net = net
+        self.budget = budget
+        self.sorts = sorts
+        # Paths of the sorts to bind in the executor for offloaded nets, or
+        # None if the net isn't offloaded.
+        self.paths = paths
+        self.queue = queue
+        self.steps = 0
+        self.deadlocked = False
+        self.worker = None
+
+
+def _step(net):
+    """
+    Fire a random fireable transition of an APN. The transitions are tried
+    in a random order, and the first fireable one is fired with the bindings
+    found when checking it, so that its fireability is only checked once.
+
+    Returns:
+        True if a transition was fired, False if the APN is deadlocked.
+    """
+    for transition in random.sample(net.transitions, len(net.transitions)):
+        fireable, bindings = transition.fireable()
+        if fireable:
+            transition._consume_inbound(bindings, net.rewrite_rules,
+                                        net.strategy)
+            transition._produce_outbound(bindings, net.rewrite_rules,
+                                         net.strategy)
+            if net.recorder is not None:
+                net.recorder.record(transition, bindings)
+            return True
+    return False
+
+
+def _sort_paths(sorts, rules):
+    """
+    Get the module:name paths of the sorts that must be bound when an APN
+    is loaded in another process (see alpyne.serialization). The sorts are
+    looked up in the modules defining the functions of the native rules of
+    the APN and of the sorts, since these functions use the sorts of their
+    modules. Other sorts are recreated from the serialized APN.
+
+    Raises:
+        A ValueError if a sort with native rules isn't defined in one of
+        these modules.
+    """
+    rules = list(rules)
+    for sort in sorts:
+        rules.extend(sort.rewrite_rules)
+    modules = sorted(set(rule.function.__module__ for rule in rules
+                         if type(rule) == NativeRule))
+    paths = []
+    for sort in sorts:
+        path = None
+        for name in modules:
+            module = importlib.import_module(name)
+            for attr, value in list(vars(module).items()):
+                if value is sort:
+                    path = "{}:{}".format(name, attr)
+                    break
+            if path is not None:
+                break
+        if path is not None:
+            paths.append(path)
+        elif any(type(rule) == NativeRule for rule in sort.rewrite_rules):
+            raise ValueError("Sort {} is not defined in the module of its "
+                             "native rules".format(sort))
+    return paths
+
+
+def _offloaded_steps(data, paths, steps):
+    """
+    Fire steps in a serialized APN (run in an executor).
+
+    Returns:
+        The number of steps fired and the serialized marking of the APN.
+    """
+    sorts = [serialization._resolve_function(path) for path in paths]
+    net = serialization.loads(data, sorts).net
+    fired = 0
+    while fired < steps and _step(net):
+        fired += 1
+    return fired, serialization.dumps_marking(net)
+
+
+class SimulationService(object):
+    """
+    Service running the simulations of APNs concurrently.
+
+    Args:
+        executor: The executor to which the steps of offloaded nets are
+            sent, or None if nets cannot be offloaded.
+        queue_size: The maximum number of pending requests per net.
+        slice_steps: The number of steps fired before yielding to the event
+            loop.
+    """
+
+    def __init__(self, executor=None, queue_size=16, slice_steps=10):
+        assert queue_size >= 1, "Queues must hold at least one request"
+        assert slice_steps >= 1, "Slices must contain at least one step"
+        self.executor = executor
+        self.queue_size = queue_size
+        self.slice_steps = slice_steps
+        self._simulations = {}
+
+    def _simulation(self, name):
+        simulation = self._simulations.get(name)
+        if simulation is None:
+            raise KeyError("No net named {} in the service".format(name))
+        return simulation
+
+    async def start(self, name, net, budget=None, offload=False, sorts=()):
+        """
+        Start the simulation of an APN.
+
+        Args:
+            name: The name identifying the simulation in the service.
+            net: The APN to simulate.
+            budget: The maximum number of steps that can be fired in the
+                APN, or None for no limit.
+            offload: Whether the steps must be fired in the executor of the
+                service.
+            sorts: The sorts of the terms in the marking of the APN other
+                than the sorts of its places (for offloaded nets, see
+                alpyne.serialization). The sorts with native rules must be
+                defined in the modules of their functions.
+        """
+        assert name not in self._simulations, "Name is already in use"
+        assert not offload or self.executor is not None,\
+            "Nets can only be offloaded to an executor"
+        sorts = list(sorts)
+        paths = None
+        if offload:
+            paths = _sort_paths(set(place.sort for place in net.places) |
+                                set(sorts), net.rewrite_rules)
+        simulation = _Simulation(net, budget, sorts, paths,
+                                 asyncio.Queue(self.queue_size))
+        simulation.worker = asyncio.ensure_future(self._work(simulation))
+        self._simulations[name] = simulation
+
+    async def step(self, name, steps=1):
+        """
+        Fire random transitions in a simulated APN. The request waits while
+        the queue of the net is full.
+
+        Args:
+            name: The name of the simulation.
+            steps: The number of steps to fire.
+
+        Returns:
+            The number of steps actually fired (less than steps if the budget
+            of the net is exhausted or if it is deadlocked).
+
+        Raises:
+            A ServiceException if an error was raised while firing the steps.
+        """
+        assert steps >= 0, "Number of steps must be positive"
+        simulation = self._simulation(name)
+        future = asyncio.get_running_loop().create_future()
+        await simulation.queue.put((steps, future))
+        if self._simulations.get(name) is not simulation:
+            # The simulation was stopped while the request waited for room
+            # in its queue.
+            future.cancel()
+        return await future
+
+    async def marking(self, name):
+        """
+        Get the current marking of a simulated APN.
+
+        Returns:
+            A dict with the names of the places as keys and their markings as
+            values.
+        """
+        net = self._simulation(name).net
+        return {place.name: list(place.marking) for place in net.places}
+
+    async def status(self, name):
+        """
+        Get the status of a simulation.
+
+        Returns:
+            A dict with the number of steps fired, the remaining budget (or
+            None), the number of pending requests and whether the APN is
+            deadlocked.
+        """
+        simulation = self._simulation(name)
+        remaining = None
+        if simulation.budget is not None:
+            remaining = simulation.budget - simulation.steps
+        return {'steps': simulation.steps, 'remaining': remaining,
+                'pending': simulation.queue.qsize(),
+                'deadlocked': simulation.deadlocked}
+
+    async def stop(self, name):
+        """
+        Stop a simulation, cancelling its pending requests (including the
+        request being served).
+
+        Returns:
+            The simulated APN.
+        """
+        simulation = self._simulations.pop(name, None)
+        if simulation is None:
+            raise KeyError("No net named {} in the service".format(name))
+        simulation.worker.cancel()
+        try:
+            await simulation.worker
+        except asyncio.CancelledError:
+            pass
+        while not simulation.queue.empty():
+            _, future = simulation.queue.get_nowait()
+            future.cancel()
+        return simulation.net
+
+    async def close(self):
+        """
+        Stop all the simulations of the service.
+        """
+        for name in list(self._simulations):
+            await self.stop(name)
+
+    async def handle(self, request):
+        """
+        Handle a request sent to the service as a dict, with an 'action' key
+        ('start', 'step', 'marking', 'status' or 'stop') and the arguments
+        of the corresponding method as other keys.
+
+        Returns:
+            A dict with an 'ok' key, and a 'result' key with the result of
+            the request (markings are converted to strings) if it succeeded
+            or an 'error' key with the error otherwise (including the errors
+            raised while firing the steps of a net).
+        """
+        request = dict(request)
+        action = request.pop('action', None)
+        if action not in ('start', 'step', 'marking', 'status', 'stop'):
+            return {'ok': False, 'error': "Unknown action {}".format(action)}
+        try:
+            result = await getattr(self, action)(**request)
+        except (KeyError, AssertionError, TypeError, ValueError,
+                ServiceException) as error:
+            return {'ok': False, 'error': str(error)}
+        if action == 'marking':
+            result = {place: [str(token) for token in tokens]
+                      for place, tokens in result.items()}
+        elif action in ('start', 'stop'):
+            result = None
+        return {'ok': True, 'result': result}
+
+    async def _work(self, simulation):
+        """
+        Serve the step requests of a simulation. Errors raised while firing
+        the steps are reported to the request as a ServiceException, and
+        the worker goes on serving the next requests.
+        """
+        while True:
+            steps, future = await simulation.queue.get()
+            if future.cancelled():
+                continue
+            try:
+                fired = await self._run(simulation, steps)
+            except asyncio.CancelledError:
+                # The simulation is stopped while the request is served.
+                future.cancel()
+                raise
+            except Exception as error:
+                if not future.cancelled():
+                    exception = ServiceException(
+                        "Steps failed: {!r}".format(error))
+                    exception.__cause__ = error
+                    future.set_exception(exception)
+            else:
+                if not future.cancelled():
+                    future.set_result(fired)
+
+    async def _run(self, simulation, steps):
+        """
+        Fire steps in a simulation, within its budget.
+        """
+        if simulation.budget is not None:
+            steps = min(steps, simulation.budget - simulation.steps)
+        if steps <= 0:
+            return 0
+
+        net = simulation.net
+        if simulation.paths is not None:
+            data = serialization.dumps(net=net)
+            fired, marking = await asyncio.get_running_loop()\
+                .run_in_executor(self.executor, _offloaded_steps, data,
+                                 simulation.paths, steps)
+            serialization.loads_marking(net, marking, simulation.sorts)
+        else:
+            fired = 0
+            while fired < steps:
+                if fired and fired % self.slice_steps == 0:
+                    await asyncio.sleep(0)
+                if not _step(net):
+                    break
+                fired += 1
+        simulation.steps += fired
+        simulation.deadlocked = fired < steps
+        return fired
+
+
+class LocalClient(object):
+    """
+    Client sending requests to a service in the same process. The methods
+    of the client raise a ServiceException when a request fails.
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    async def _request(self, action, **arguments):
+        arguments['action'] = action
+        response = await self.service.handle(arguments)
+        if not response['ok']:
+            raise ServiceException(response['error'])
+        return response['result']
+
+    async def start(self, name, net, budget=None, offload=False, sorts=()):
+        return await self._request('start', name=name, net=net,
+                                   budget=budget, offload=offload,
+                                   sorts=sorts)
+
+    async def step(self, name, steps=1):
+        return await self._request('step', name=name, steps=steps)
+
+    async def marking(self, name):
+        return await self._request('marking', name=name)
+
+    async def status(self, name):
+        return await self._request('status', name=name)
+
+    async def stop(self, name):
+        return await self._request('stop', name=name)
@@ -0,0 +1,173 @@
+"""
+Stochastic simulation of APNs.
+
+Transitions are given firing rates (their firing delays then follow
+exponential distributions) or arbitrary delay distributions, and are fired
+in continuous time. The simulator implements the next-reaction method of
+Gibson and Bruck: the next firing time of each fireable transition is kept
+in a priority queue, and after each firing only the transitions depending on
+the places it modified are checked again, so that the cost of a step doesn't
+grow with the size of the net. A transition that stays fireable keeps its
+firing time (race semantics with enabling memory, which is exact for rates
+because of the memorylessness of exponential distributions).
+"""
+
+import heapq
+import random
+from itertools import count
+
+
+class StochasticSimulator(object):
+    """
+    Simulator firing the transitions of an APN at random times.
+
+    The structure of the APN must not change while it is simulated (its
+    marking can change outside of the simulator if reset is called after).
+
+    Args:
+        net: The APN to simulate.
+        rates: A dict with transitions as keys and their firing rates as
+            values. Transitions with a rate of 0 are never fired.
+        delays: A dict with transitions as keys and functions returning
+            random firing delays as values (the functions take a
+            random.Random instance as argument). Delays take precedence
+            over rates.
+        default_rate: The rate of the transitions without rate or delay.
+        seed: The seed of the random number generator of the simulator.
+
+    Attributes:
+        time: The current time of the simulation.
+        steps: The number of transitions fired by the simulator.
+    """
+
+    def __init__(self, net, rates=None, delays=None, default_rate=1.0,
+                 seed=None):
+        self.net = net
+        self.rates = rates if rates is not None else {}
+        self.delays = delays if delays is not None else {}
+        for rate in self.rates.values():
+            assert rate >= 0, "Rates must be positive"
+        assert default_rate >= 0, "Rates must be positive"
+        self.default_rate = default_rate
+        self.random = random.Random(seed)
+        self.time = 0.0
+        self.steps = 0
+
+        # Transitions whose fireability depends on the places modified when
+        # each transition is fired.
+        readers = {}
+        for transition in net.transitions:
+            for arc in transition.inbound_arcs:
+                readers.setdefault(arc.source, []).append(transition)
+        self._dependents = {}
+        for transition in net.transitions:
+            dependents = {transition}
+            for arc in transition.inbound_arcs:
+                dependents.update(readers[arc.source])
+            for arc in transition.outbound_arcs:
+                dependents.update(readers.get(arc.target, ()))
+            self._dependents[transition] = [t for t in net.transitions
+                                            if t in dependents]
+        self.reset()
+
+    def reset(self):
+        """
+        Reschedule all the transitions from the current marking of the APN.
+        """
+        # Heap of (time, id, transition) entries, and ids of the valid entry
+        # of each scheduled transition (the others are skipped when popped).
+        self._queue = []
+        self._scheduled = {}
+        self._ids = count()
+        for transition in self.net.transitions:
+            self._update(transition)
+
+    def _delay(self, transition):
+        """
+        Draw a firing delay for a transition, or return None if it can never
+        be fired.
+        """
+        delay = self.delays.get(transition)
+        if delay is not None:
+            return delay(self.random)
+        rate = self.rates.get(transition, self.default_rate)
+        if rate == 0:
+            return None
+        return self.random.expovariate(rate)
+
+    def _update(self, transition):
+        """
+        Schedule or unschedule a transition according to its fireability.
+        """
+        fireable, _ = transition.fireable()
+        if not fireable:
+            self._scheduled.pop(transition, None)
+            return
+        if transition in self._scheduled:
+            return
+        delay = self._delay(transition)
+        if delay is None:
+            return
+        assert delay >= 0, "Delays must be positive"
+        entry_id = next(self._ids)
+        self._scheduled[transition] = entry_id
+        heapq.heappush(self._queue, (self.time + delay, entry_id,
+                                     transition))
+
+    def step(self):
+        """
+        Fire the transition with the earliest firing time.
+
+        Returns:
+            A (time, transition, bindings) tuple with the time at which the
+            transition was fired and the bindings with which it was fired,
+            or None if no transition can be fired.
+        """
+        queue = self._queue
+        while queue:
+            time, entry_id, transition = heapq.heappop(queue)
+            if self._scheduled.get(transition) != entry_id:
+                continue
+            del self._scheduled[transition]
+            self.time = time
+            bindings = self.net.fire(transition)
+            self.steps += 1
+            for dependent in self._dependents[transition]:
+                self._update(dependent)
+            return (time, transition, bindings)
+        return None
+
+    def run(self, until=None, steps=None):
+        """
+        Run the simulation until a given time, for a number of steps, or
+        until no transition can be fired.
+
+        Args:
+            until: The time at which the simulation stops (transitions
+                scheduled later are not fired), or None.
+            steps: The maximum number of transitions to fire, or None.
+
+        Returns:
+            The number of transitions fired.
+        """
+        fired = 0
+        while steps is None or fired < steps:
+            if until is not None:
+                next_time = self.next_time()
+                if next_time is None or next_time > until:
+                    self.time = max(self.time, until)
+                    break
+            if self.step() is None:
+                break
+            fired += 1
+        return fired
+
+    def next_time(self):
+        """
+        Get the time of the next firing, or None if no transition can be
+        fired.
+        """
+        queue = self._queue
+        while queue and self._scheduled.get(queue[0][2]) != queue[0][1]:
+            heapq.heappop(queue)
+        return queue[0][0] if queue else None
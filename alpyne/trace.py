@@ -0,0 +1,210 @@
+"""
+Recording and replay of the transitions fired in APNs.
+
+A trace is an append-only binary log with one record per transition fired:
+the index of the transition in the APN and the variable bindings with which
+it was fired, as indices in tables of variables and terms. The tables use
+the format of alpyne.serialization, and the entries a record needs that
+weren't used by previous records are written just before it, so that terms
+bound several times are only stored once.
+
+    with TraceRecorder(apn, 'run.trace'):
+        for _ in range(1000):
+            apn.fire_random()
+
+A trace is replayed on an APN in the state where it was recorded, by
+consuming and producing the recorded tokens directly, without searching for
+fireable transitions and bindings.
+"""
+
+import mmap
+from alpyne.exceptions import SerializationException
+from alpyne.serialization import _Encoder, _Decoder
+
+MAGIC = b'APYT'
+VERSION = 1
+
+
+class TraceRecorder(object):
+    """
+    Recorder writing the transitions fired in an APN (with the fire and
+    fire_random methods of the APN) to a trace file.
+
+    Attributes:
+        net: The APN recorded.
+        filepath: The path of the trace file.
+        steps: The number of transitions recorded.
+    """
+
+    def __init__(self, net, filepath):
+        self.net = net
+        self.filepath = filepath
+        self.steps = 0
+        self._file = None
+        self._encoder = None
+        self._indices = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """
+        Start recording the APN, creating the trace file.
+        """
+        assert self.net.recorder is None, "The APN is already being recorded"
+        self._encoder = _Encoder()
+        self._file = open(self.filepath, 'wb')
+        header = bytearray(MAGIC)
+        header.append(VERSION)
+        self._encoder.uint(len(self.net.transitions), header)
+        self._file.write(header)
+        self.steps = 0
+        self.net.recorder = self
+
+    def stop(self):
+        """
+        Stop recording the APN and close the trace file.
+        """
+        if self.net.recorder is self:
+            self.net.recorder = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def record(self, transition, bindings):
+        """
+        Append a transition fired in the APN to the trace.
+
+        Args:
+            transition: The transition fired.
+            bindings: The variable bindings with which it was fired.
+        """
+        index = self._indices.get(transition)
+        if index is None:
+            self._indices = {t: i for i, t in enumerate(self.net.transitions)}
+            index = self._indices[transition]
+
+        encoder = self._encoder
+        ids = [(encoder.variable(var), encoder.term(term))
+               for var, term in bindings.items()]
+        out = bytearray()
+        encoder.delta(out)
+        encoder.uint(index, out)
+        encoder.uint(len(ids), out)
+        for var, term in ids:
+            encoder.uint(var, out)
+            encoder.uint(term, out)
+        self._file.write(out)
+        self.steps += 1
+
+
+def read(net, filepath, sorts=()):
+    """
+    Read the steps of a trace recorded on an APN.
+
+    Args:
+        net: The APN on which the trace was recorded (or one with the same
+            transitions).
+        filepath: The path of the trace file.
+        sorts: Additional sorts to bind the sorts of the recorded terms to
+            (the sorts of the places of the net are always bound, see
+            alpyne.serialization).
+
+    Yields:
+        A (transition, bindings) tuple for each step of the trace.
+
+    Raises:
+        A SerializationException if the trace is invalid or doesn't match
+        the APN.
+    """
+    with open(filepath, 'rb') as source:
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            decoder = _Decoder(data, [place.sort for place in net.places]
+                               + list(sorts), header=False)
+            try:
+                if bytes(decoder.data[:4]) != MAGIC:
+                    raise SerializationException("Not a trace file")
+                if decoder.data[4] != VERSION:
+                    raise SerializationException(
+                        "Unsupported trace version {}"
+                        .format(decoder.data[4]))
+                decoder.pos = 5
+                if decoder.uint() != len(net.transitions):
+                    raise SerializationException(
+                        "The trace doesn't match the transitions of the APN")
+                size = len(decoder.data)
+                labels = {}
+                while decoder.pos < size:
+                    decoder.tables()
+                    transition = net.transitions[decoder.uint()]
+                    variables = labels.get(transition)
+                    if variables is None:
+                        variables = labels[transition] =\
+                            _label_variables(transition)
+                    bindings = {}
+                    for _ in range(decoder.uint()):
+                        var = decoder.variables[decoder.uint()]
+                        var = variables.get((var.sort, var.name), var)
+                        bindings[var] = decoder.terms[decoder.uint()]
+                    yield (transition, bindings)
+            except IndexError:
+                raise SerializationException("Truncated trace")
+            finally:
+                decoder.data.release()
+
+
+def _label_variables(transition):
+    """
+    Get the variables of the labels of the arcs of a transition, by sort and
+    name. The recorded variables are bound to them, since the variables of
+    the labels aren't necessarily attributes of their sorts.
+    """
+    variables = {}
+    for arc in transition.inbound_arcs + transition.outbound_arcs:
+        for term in arc.label:
+            for var in term.variables():
+                variables[(var.sort, var.name)] = var
+    return variables
+
+
+def replay(net, filepath, sorts=(), steps=None):
+    """
+    Replay a trace on an APN, which must be in the state where the trace
+    started being recorded. The recorded tokens are consumed and produced
+    without checking whether the transitions are fireable.
+
+    Args:
+        net: The APN on which the trace was recorded.
+        filepath: The path of the trace file.
+        sorts: Additional sorts to bind the sorts of the recorded terms to.
+        steps: The maximum number of steps to replay, or None to replay the
+            whole trace.
+
+    Returns:
+        The number of steps replayed.
+
+    Raises:
+        A ConsumeException if a recorded token cannot be consumed (when the
+        APN isn't in the state where the trace was recorded), or a
+        SerializationException if the trace is invalid.
+    """
+    count = 0
+    if steps == 0:
+        return count
+    trace = read(net, filepath, sorts)
+    try:
+        for transition, bindings in trace:
+            transition._consume_inbound(bindings, net.rewrite_rules,
+                                        net.strategy)
+            transition._produce_outbound(bindings, net.rewrite_rules,
+                                         net.strategy)
+            count += 1
+            if count == steps:
+                break
+    finally:
+        trace.close()
+    return count
@@ -0,0 +1,342 @@
+"""
+Unfolding of APNs with finite token domains into place/transition nets.
+
+When the tokens of every place, and the values of every variable of the
+labels, are taken from finite domains (booleans, chars, naturals up to some
+bound...), an APN can be unfolded into a low-level place/transition net:
+there is one place per place of the APN and term of its domain, holding the
+number of copies of that term, and one transition per transition of the APN
+and binding of its variables. Markings are then vectors of integers, and
+firing a transition adds a row of the incidence matrix to the marking, so
+that the state space can be explored without matching or reducing terms:
+
+    ptnet = unfold(apn, {nat: naturals(3), boolean: constants(boolean)})
+    markings, complete = ptnet.reachable()
+
+Markings and matrices are NumPy arrays.
+"""
+
+from collections import deque
+from itertools import product
+import numpy as np
+from alpyne.adt import Operation, Variable
+from alpyne.adts.natural import nat
+from alpyne.exceptions import UnfoldingException
+
+
+def constants(sort, rewrite_rules=()):
+    """
+    Get the constants of a sort that are in normal form, such as the
+    booleans or the chars, to be used as the domain of the sort.
+
+    Args:
+        sort: The sort of the constants.
+        rewrite_rules: The rewrite rules used to reduce the constants.
+
+    Returns:
+        A list with the terms of the constants.
+    """
+    terms = []
+    for attr in list(sort.__dict__.values()):
+        if type(attr) == Operation and attr.sort is sort and\
+           not attr.signature:
+            term = attr()
+            if term.reduce(rewrite_rules) == term:
+                terms.append(term)
+    return terms
+
+
+def naturals(bound):
+    """
+    Get the naturals from 0 to a bound (included), as terms of the natural
+    sort, to be used as the domain of bounded naturals.
+    """
+    terms = [nat.zero()]
+    for _ in range(bound):
+        terms.append(nat.succ(terms[-1]))
+    return terms
+
+
+def _variables(terms):
+    """
+    Get the variables of a list of terms, in the order of their first
+    occurrence.
+    """
+    variables = []
+    for term in terms:
+        stack = [term]
+        while stack:
+            t = stack.pop()
+            if type(t.head) == Variable and t.head not in variables:
+                variables.append(t.head)
+            stack.extend(reversed(t.args))
+    return variables
+
+
+class PTNet(object):
+    """
+    Place/transition net obtained by unfolding an APN (see unfold).
+
+    Attributes:
+        places: A list of (place, token) tuples, with the place of the APN
+            and the term counted by each place of the net.
+        transitions: A list of (transition, bindings) tuples, with the
+            transition of the APN and the bindings of its variables for
+            each transition of the net.
+        pre: The matrix of the tokens consumed by the transitions, with one
+            row per transition and one column per place.
+        post: The matrix of the tokens produced by the transitions.
+        incidence: The incidence matrix of the net (post - pre).
+        marking: The current marking of the net, as a vector of token
+            counts.
+    """
+
+    def __init__(self, places, transitions, pre, post, marking):
+        self.places = places
+        self.transitions = transitions
+        self.pre = pre
+        self.post = post
+        self.incidence = post - pre
+        self.marking = marking
+
+    def __str__(self):
+        return "place/transition net with {} places and {} transitions"\
+            .format(len(self.places), len(self.transitions))
+
+    def fireables(self, marking=None):
+        """
+        Get the transitions that are fireable in a marking.
+
+        Args:
+            marking: The marking, or None for the current marking.
+
+        Returns:
+            An array with the indices of the fireable transitions.
+        """
+        if marking is None:
+            marking = self.marking
+        return np.flatnonzero(np.all(marking >= self.pre, axis=1))
+
+    def fire(self, transition):
+        """
+        Fire a transition in the current marking of the net.
+
+        Args:
+            transition: The index of the transition.
+
+        Returns:
+            The new marking of the net.
+        """
+        assert np.all(self.marking >= self.pre[transition]),\
+            "Transition must be fireable"
+        self.marking = self.marking + self.incidence[transition]
+        return self.marking
+
+    def reachable(self, max_states=None):
+        """
+        Explore the markings reachable from the current marking of the net,
+        breadth first.
+
+        Args:
+            max_states: The maximum number of markings to explore, or None
+                for no limit.
+
+        Returns:
+            A matrix with the markings found, one per row (starting with the
+            current marking), and a boolean indicating whether all the
+            reachable markings were found.
+        """
+        pre = self.pre
+        incidence = self.incidence
+        states = [self.marking]
+        seen = {self.marking.tobytes()}
+        queue = deque(states)
+        while queue:
+            marking = queue.popleft()
+            enabled = np.all(marking >= pre, axis=1)
+            for successor in marking + incidence[enabled]:
+                key = successor.tobytes()
+                if key in seen:
+                    continue
+                if max_states is not None and len(states) >= max_states:
+                    return (np.array(states), False)
+                seen.add(key)
+                states.append(successor)
+                queue.append(successor)
+        return (np.array(states), True)
+
+    def to_marking(self, marking=None):
+        """
+        Convert a marking of the net into a marking of the unfolded APN.
+
+        Args:
+            marking: The marking, or None for the current marking.
+
+        Returns:
+            A dict with the places of the APN as keys and the lists of their
+            tokens as values.
+        """
+        if marking is None:
+            marking = self.marking
+        markings = {}
+        for (place, token), count in zip(self.places, marking):
+            tokens = markings.setdefault(place, [])
+            tokens.extend([token] * int(count))
+        return markings
+
+
+def unfold(net, domains, strict=True):
+    """
+    Unfold an APN into a place/transition net.
+
+    A transition of the net is created for each binding of the variables of
+    the inbound arcs of a transition of the APN to terms of their domains,
+    if the APN could fire the transition with these bindings: the labels of
+    the inbound arcs must be reduced to terms of the domains of their places
+    that match them. Transitions with the same effect for several bindings
+    are only created once.
+
+    Args:
+        net: The APN to unfold.
+        domains: A dict with sorts as keys and lists of terms as values. The
+            domains of the sorts of the places must contain all the tokens
+            the places can hold, and the domains of the sorts of the
+            variables all the terms they can be bound to. The terms are
+            reduced with the rewrite rules of the APN.
+        strict: Whether a transition producing a token outside the domain
+            of its place for some bindings is an error. Otherwise, the
+            bindings are dropped: the domains are assumed to hold all the
+            reachable tokens (for example, a counter bounded by the
+            transitions incrementing it).
+
+    Returns:
+        The unfolded PTNet, with the current marking of the APN.
+
+    Raises:
+        An UnfoldingException if a place, or a variable of a label, has no
+        domain, if a token of the APN or a token produced by a transition
+        isn't in the domain of its place (in strict mode), or if the
+        outbound arcs of a transition have variables that its inbound arcs
+        don't have.
+    """
+    rules = net.rewrite_rules
+    strategy = net.strategy
+    reduced = {}
+    for sort, terms in domains.items():
+        reduced[sort] = []
+        for term in terms:
+            term = term.reduce(rules, strategy=strategy)
+            if term not in reduced[sort]:
+                reduced[sort].append(term)
+
+    places = []
+    indexes = {}
+    for place in net.places:
+        if place.sort not in reduced:
+            raise UnfoldingException("No domain for the sort {} of {}"
+                                     .format(place.sort, place))
+        for token in reduced[place.sort]:
+            indexes[(place, token)] = len(places)
+            places.append((place, token))
+
+    marking = np.zeros(len(places), dtype=np.int64)
+    for place in net.places:
+        for token in place.marking:
+            index = indexes.get((place, token))
+            if index is None:
+                raise UnfoldingException("Token {} of {} isn't in its domain"
+                                         .format(token, place))
+            marking[index] += 1
+
+    transitions = []
+    pre_rows = []
+    post_rows = []
+    for transition in net.transitions:
+        inbound = [(arc.source, term) for arc in transition.inbound_arcs
+                   for term in arc.label]
+        outbound = [(arc.target, term) for arc in transition.outbound_arcs
+                    for term in arc.label]
+        variables = _variables([term for _, term in inbound])
+        for variable in _variables([term for _, term in outbound]):
+            if variable not in variables:
+                raise UnfoldingException(
+                    "Variable {} of {} isn't bound by its inbound arcs"
+                    .format(variable, transition))
+        for variable in variables:
+            if variable.sort not in reduced:
+                raise UnfoldingException("No domain for the sort {} of {}"
+                                         .format(variable.sort, variable))
+
+        effects = set()
+        for values in product(*(reduced[v.sort] for v in variables)):
+            bindings = dict(zip(variables, values))
+            pre = _tokens(inbound, bindings, indexes, rules, strategy, True)
+            if pre is None:
+                continue
+            post = _tokens(outbound, bindings, indexes, rules, strategy,
+                           False, transition if strict else None)
+            if post is None:
+                continue
+            effect = (tuple(sorted(pre.items())), tuple(sorted(post.items())))
+            if effect in effects:
+                continue
+            effects.add(effect)
+            transitions.append((transition, bindings))
+            pre_rows.append(pre)
+            post_rows.append(post)
+
+    pre = np.zeros((len(transitions), len(places)), dtype=np.int64)
+    post = np.zeros((len(transitions), len(places)), dtype=np.int64)
+    for i, (consumed, produced) in enumerate(zip(pre_rows, post_rows)):
+        for index, count in consumed.items():
+            pre[i, index] = count
+        for index, count in produced.items():
+            post[i, index] = count
+    return PTNet(places, transitions, pre, post, marking)
+
+
+def _tokens(labels, bindings, indexes, rules, strategy, consumed,
+            producer=None):
+    """
+    Count the tokens consumed or produced by the terms of the labels of a
+    transition for some bindings.
+
+    Args:
+        labels: A list of (place, term) tuples.
+        bindings: The bindings of the variables of the terms.
+        indexes: The indexes of the places of the unfolded net, by place of
+            the APN and token.
+        rules: The rewrite rules used to reduce the terms.
+        strategy: The strategy used to reduce the terms.
+        consumed: Whether the tokens are consumed (the terms must then match
+            them) or produced.
+        producer: The transition producing the tokens, if the tokens outside
+            the domains of their places must raise an exception.
+
+    Returns:
+        A dict with the indexes of the places of the unfolded net as keys
+        and the number of tokens as values, or None if the tokens aren't in
+        the domains of their places, or if the transition cannot consume
+        them with the bindings.
+    """
+    counts = {}
+    for place, term in labels:
+        token = term.apply_binding(bindings).reduce(rules, strategy=strategy)
+        index = indexes.get((place, token))
+        if index is None:
+            if producer is not None:
+                raise UnfoldingException("Token {} produced by {} in {} "
+                                         "isn't in its domain"
+                                         .format(token, producer, place))
+            return None
+        if consumed:
+            # The term must match the token for the APN to consume it with
+            # the same bindings.
+            matching, binding = term.match(token)
+            if not matching:
+                return None
+            for variable, value in binding.items():
+                if bindings.get(variable, value) != value:
+                    return None
+        counts[index] = counts.get(index, 0) + 1
+    return counts
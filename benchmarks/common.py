@@ -0,0 +1,61 @@
+"""
+Helpers to define and run benchmarks.
+"""
+
+import time
+import tracemalloc
+
+
+class Benchmark(object):
+    """
+    A benchmark measuring the time and memory needed to run some operations.
+
+    Args:
+        name: The name of the benchmark.
+        setup: A function without arguments building the state on which the
+            benchmark is run (not measured).
+        run: A function taking the state built by setup as argument and
+            running the operations that are measured.
+        operations: The number of operations performed by run, used to
+            compute the throughput of the benchmark.
+    """
+
+    def __init__(self, name, setup, run, operations=1):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.operations = operations
+
+    def measure(self, repeat=3):
+        """
+        Run the benchmark.
+
+        Args:
+            repeat: The number of times the benchmark is timed (the best
+                time is kept).
+
+        Returns:
+            A dict with the best time taken to run the operations (in
+            seconds), the throughput (in operations per second) and the
+            peak memory allocated while running them (in bytes).
+        """
+        best = None
+        for _ in range(repeat):
+            state = self.setup()
+            start = time.perf_counter()
+            self.run(state)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+
+        # Memory is measured in a separate run, since tracing allocations
+        # slows the execution down.
+        state = self.setup()
+        tracemalloc.start()
+        self.run(state)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {'time': best,
+                'throughput': self.operations / best if best else 0.0,
+                'memory': peak}
@@ -0,0 +1,72 @@
+"""
+Memory benchmark for terms and markings.
+
+Reports the number of bytes used per term node for deep terms of the natural
+sort and the total memory footprint of APNs with large markings.
+
+Usage: python3 benchmarks/memory.py [depth] [tokens]
+"""
+
+import sys
+import tracemalloc
+from alpyne.adt import Term
+from alpyne.adts.natural import nat
+from alpyne.apn import AlgebraicPetriNet
+
+
+def measure(build):
+    """
+    Measure the memory allocated by a function building some object.
+
+    Args:
+        build: A function without arguments building the object to measure.
+
+    Returns:
+        A tuple containing the object built and the number of bytes that
+        were allocated to build it (and still are in use).
+    """
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    result = build()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, end - start
+
+
+def deep_nat(depth):
+    """
+    Build the natural number of a given depth as a chain of succ terms.
+    """
+    term = nat.zero()
+    for _ in range(depth):
+        term = Term(nat.succ, (term,))
+    return term
+
+
+def large_marking(tokens):
+    """
+    Build an APN with a single place containing a large number of small
+    natural numbers as tokens.
+    """
+    net = AlgebraicPetriNet('memory', [], [], nat.rewrite_rules)
+    marking = [deep_nat(i % 10) for i in range(tokens)]
+    net.add_place('p', nat, marking)
+    return net
+
+
+def main(depth=10000, tokens=10000):
+    _, size = measure(lambda: deep_nat(depth))
+    print("Deep term with {} nodes: {} bytes ({:.1f} bytes per node)"
+          .format(depth + 1, size, size / (depth + 1)))
+
+    nodes = sum(i % 10 + 1 for i in range(tokens))
+    _, size = measure(lambda: large_marking(tokens))
+    print("Marking with {} tokens ({} nodes): {} bytes ({:.1f} bytes per node)"
+          .format(tokens, nodes, size, size / nodes))
+
+    print("Size of a single term object: {} bytes"
+          .format(sys.getsizeof(nat.zero())))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,122 @@
+"""
+Benchmarks for the execution of Algebraic Petri Nets.
+"""
+
+import random
+from alpyne.adt import Variable
+from alpyne.adts.natural import nat
+from alpyne.apn import AlgebraicPetriNet
+from alpyne.generators import dining_philosophers, producer_consumer,\
+    token_ring, database
+from common import Benchmark
+
+try:
+    from alpyne.unfolding import unfold, naturals
+except ImportError:
+    unfold = None
+
+
+def fibonacci():
+    """
+    Build the APN computing the Fibonacci sequence of examples/fibonacci.py.
+    """
+    a = Variable('a', nat)
+    b = Variable('b', nat)
+    fib = AlgebraicPetriNet('fibonacci', [], [], nat.rewrite_rules)
+    fn_1 = fib.add_place('f_n-1', nat, [nat.zero()])
+    fn = fib.add_place('f_n', nat, [nat.succ(nat.zero())])
+    t = fib.add_transition('t')
+    fib.add_arc(fn_1, t, [a()])
+    fib.add_arc(t, fn_1, [b()])
+    fib.add_arc(fn, t, [b()])
+    fib.add_arc(t, fn, [nat.add(a(), b())])
+    return fib
+
+
+def fireable(tokens):
+    x = Variable('x', nat)
+    net = AlgebraicPetriNet('fireable', [], [], nat.rewrite_rules)
+    # Only the last token of the place matches the label of the arc.
+    p = net.add_place('p', nat, [nat.zero()] * tokens
+                      + [nat.succ(nat.zero())])
+    t = net.add_transition('t')
+    net.add_arc(p, t, [nat.succ(x())])
+    return Benchmark("fireable, {} tokens".format(tokens), lambda: t,
+                     lambda t: t.fireable())
+
+
+def fire_random(name, build, steps):
+    def run(net):
+        random.seed(0)
+        for _ in range(steps):
+            net.fire_random()
+
+    return Benchmark("fire_random, {} ({} steps)".format(name, steps), build,
+                     run, steps)
+
+
+def step(name, build, steps):
+    def run(net):
+        random.seed(0)
+        fired = 0
+        while fired < steps:
+            fired += len(net.step()) or steps
+
+    return Benchmark("step, {} ({} firings)".format(name, steps), build, run,
+                     steps)
+
+
+def reachable(net):
+    """
+    Explore the markings reachable in an APN, breadth first.
+    """
+    initial = net.snapshot()
+    seen = {initial}
+    queue = [initial]
+    while queue:
+        state = queue.pop(0)
+        net.restore(state)
+        for transition in net.fireables():
+            net.fire(transition)
+            successor = net.snapshot()
+            if successor not in seen:
+                seen.add(successor)
+                queue.append(successor)
+            net.restore(state)
+    net.restore(initial)
+    return len(seen)
+
+
+def reachability(n):
+    """
+    Compare the exploration of the reachable markings of n philosophers in
+    the APN and in its unfolding.
+    """
+    name = "reachable markings, {} philosophers".format(n)
+    benchmarks = [Benchmark(name + " (APN)", lambda: dining_philosophers(n),
+                            reachable)]
+    if unfold is not None:
+        benchmarks.append(Benchmark(
+            name + " (unfolded)",
+            lambda: unfold(dining_philosophers(n), {nat: naturals(0)}),
+            lambda ptnet: ptnet.reachable()))
+    return benchmarks
+
+
+def benchmarks(scale=1):
+    """
+    Get the net execution benchmarks for a given scale factor.
+    """
+    return [fireable(1000 * scale),
+            fire_random("fibonacci", fibonacci, 8),
+            fire_random("{} philosophers".format(50 * scale),
+                        lambda: dining_philosophers(50 * scale), 100),
+            step("{} philosophers".format(50 * scale),
+                 lambda: dining_philosophers(50 * scale), 100),
+            fire_random("{} producers/consumers".format(50 * scale),
+                        lambda: producer_consumer(50 * scale), 100),
+            fire_random("token ring of {}".format(100 * scale),
+                        lambda: token_ring(100 * scale), 100),
+            fire_random("database with {} clients".format(20 * scale),
+                        lambda: database(20 * scale), 100)]\
+        + reachability(10 * scale)
@@ -0,0 +1,153 @@
+"""
+Benchmarks for the reduction of terms of the ADTs shipped with alpyne.
+"""
+
+from alpyne.adt import Signature
+from alpyne.adts.boolean import boolean
+from alpyne.adts.hashmap import hash_map
+from alpyne.adts.map import kv_map
+from alpyne.adts.natural import nat
+from alpyne.adts.string import string, char, chars, from_str
+from common import Benchmark
+
+
+def natural(n):
+    """
+    Build the natural number n as a chain of succ terms.
+    """
+    term = nat.zero()
+    for _ in range(n):
+        term = nat.succ(term)
+    return term
+
+
+def nat_addition(n):
+    rules = nat.rewrite_rules
+    term = nat.add(natural(n), natural(n))
+    return Benchmark("nat add({0}, {0})".format(n), lambda: term,
+                     lambda t: t.reduce(rules))
+
+
+def nat_equality(n):
+    rules = nat.rewrite_rules + boolean.rewrite_rules
+    term = nat.equal(natural(n), natural(n))
+    return Benchmark("nat equal({0}, {0})".format(n), lambda: term,
+                     lambda t: t.reduce(rules))
+
+
+def large_map(size):
+    rules = hash_map.rewrite_rules
+    keys = [from_str("key{}".format(i)) for i in range(size)]
+    term = hash_map.empty()
+    for key in keys:
+        term = hash_map.add(term, key, boolean.true())
+    return term.reduce(rules), keys, rules
+
+
+def map_get(size, lookups=100):
+    m, keys, rules = large_map(size)
+    terms = [hash_map.get(m, keys[i * size // lookups])
+             for i in range(lookups)]
+
+    def run(terms):
+        for term in terms:
+            term.reduce(rules)
+
+    return Benchmark("hashmap get, {} entries".format(size), lambda: terms,
+                     run, lookups)
+
+
+def map_delete(size, deletions=100):
+    m, keys, rules = large_map(size)
+
+    def run(m):
+        for i in range(deletions):
+            m = hash_map.delete(m, keys[i * size // deletions]).reduce(rules)
+
+    return Benchmark("hashmap delete, {} entries".format(size), lambda: m,
+                     run, deletions)
+
+
+def term_map_get(size):
+    rules = kv_map.rewrite_rules + nat.rewrite_rules + boolean.rewrite_rules
+    m = kv_map.empty()
+    for i in range(size):
+        m = kv_map.add(m, natural(i), boolean.true())
+    term = kv_map.get(m, natural(0))
+    return Benchmark("map get, {} entries".format(size), lambda: term,
+                     lambda t: t.reduce(rules))
+
+
+def string_equality(length):
+    rules = string.rewrite_rules
+    value = "".join(chars[i % len(chars)] for i in range(length))
+    chain = string.empty()
+    for c in value:
+        chain = string.append(chain, char.__dict__[c]())
+    term = string.equal(chain, from_str(value))
+    return Benchmark("str equal, length {}".format(length), lambda: term,
+                     lambda t: t.reduce(rules))
+
+
+def combined_adts(n):
+    """
+    Compare the reduction of a natural with the rules of several ADTs given
+    as a single list and as a signature.
+    """
+    sorts = [nat, boolean, kv_map, hash_map]
+    rules = [rule for sort in sorts for rule in sort.rewrite_rules]
+    signature = Signature(*sorts)
+    term = nat.add(natural(n), natural(n))
+    return [Benchmark("nat add({0}, {0}), rules of 4 ADTs".format(n),
+                      lambda: term, lambda t: t.reduce(rules)),
+            Benchmark("nat add({0}, {0}), signature of 4 ADTs".format(n),
+                      lambda: term, lambda t: t.reduce(signature))]
+
+
+def strategies(scale=1):
+    """
+    Compare the reduction strategies on terms of the shipped ADTs.
+    """
+    nat_rules = nat.rewrite_rules + boolean.rewrite_rules
+    map_rules = kv_map.rewrite_rules + nat_rules
+    m = kv_map.empty()
+    for i in range(8 * scale):
+        m = kv_map.add(m, natural(i), boolean.true())
+    chain = string.empty()
+    for i in range(20 * scale):
+        chain = string.append(chain, char.__dict__[chars[i % len(chars)]]())
+    cases = [("nat add({0}, {0})".format(20 * scale),
+              nat.add(natural(20 * scale), natural(20 * scale)), nat_rules),
+             ("nat equal({0}, {0})".format(50 * scale),
+              nat.equal(natural(50 * scale), natural(50 * scale)),
+              nat_rules),
+             ("and(equal({0}, {0}), false)".format(50 * scale),
+              boolean.and_(nat.equal(natural(50 * scale),
+                                     natural(50 * scale)),
+                           boolean.false()), nat_rules),
+             ("map get, {} entries".format(8 * scale),
+              kv_map.get(m, natural(0)), map_rules),
+             ("str equal, length {}".format(20 * scale),
+              string.equal(chain, chain), string.rewrite_rules)]
+
+    def reduce(rules, strategy):
+        return lambda t: t.reduce(rules, strategy=strategy)
+
+    return [Benchmark("{} ({})".format(name, strategy),
+                      lambda term=term: term, reduce(rules, strategy))
+            for name, term, rules in cases
+            for strategy in ('innermost', 'outermost', 'lazy')]
+
+
+def benchmarks(scale=1):
+    """
+    Get the rewriting benchmarks for a given scale factor.
+    """
+    return [nat_addition(20 * scale),
+            nat_addition(2000 * scale),
+            nat_equality(50 * scale),
+            map_get(1000 * scale),
+            map_delete(1000 * scale),
+            term_map_get(8 * scale),
+            string_equality(20 * scale)] + combined_adts(20 * scale) +\
+        strategies(scale)
@@ -0,0 +1,77 @@
+"""
+Run the benchmark suite of alpyne.
+
+The throughput and peak memory of each benchmark are reported, and can be
+saved to a JSON file to serve as a baseline for later runs: when a baseline
+is given, the benchmarks whose throughput dropped (or whose memory grew) by
+more than the tolerance are reported as regressions, and the script exits
+with a non-zero status.
+
+Usage: python3 benchmarks/run.py [--scale N] [--repeat N] [--filter TEXT]
+                                 [--save FILE] [--compare FILE]
+                                 [--tolerance RATIO]
+"""
+
+import argparse
+import json
+import sys
+import nets
+import rewriting
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run alpyne's benchmarks.")
+    parser.add_argument('--scale', type=int, default=1,
+                        help="scale factor for the size of the benchmarks")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="number of timed runs for each benchmark")
+    parser.add_argument('--filter', default='',
+                        help="only run benchmarks whose name contains TEXT")
+    parser.add_argument('--save', help="save the results to a JSON file")
+    parser.add_argument('--compare',
+                        help="compare the results with a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="relative change tolerated before a result is "
+                             "considered a regression")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = {}
+    regressions = []
+    print("{:<50} {:>12} {:>14} {:>12}".format("benchmark", "time (s)",
+                                               "ops/s", "memory (B)"))
+    for benchmark in rewriting.benchmarks(args.scale)\
+            + nets.benchmarks(args.scale):
+        if args.filter not in benchmark.name:
+            continue
+        result = benchmark.measure(args.repeat)
+        results[benchmark.name] = result
+
+        line = "{:<50} {:>12.6f} {:>14.1f} {:>12}"\
+            .format(benchmark.name, result['time'], result['throughput'],
+                    result['memory'])
+        reference = baseline.get(benchmark.name)
+        if reference is not None:
+            speedup = result['throughput'] / reference['throughput']
+            line += "  x{:.2f}".format(speedup)
+            if speedup < 1 - args.tolerance or\
+               result['memory'] > reference['memory'] * (1 + args.tolerance):
+                regressions.append(benchmark.name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(results, results_file, indent=2, sort_keys=True)
+
+    if regressions:
+        print("\n{} regression(s) detected.".format(len(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,5 +16,8 @@ setup(
   test_suite='tests',
   install_requires=[
     'graphviz'
-  ]
+  ],
+  extras_require={
+    'unfolding': ['numpy']
+  }
 )
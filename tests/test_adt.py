@@ -1,5 +1,9 @@
+import time
 import unittest
-from alpyne.adt import Sort, GenericSort, Operation, Variable, Term, RewriteRule
+from alpyne.adt import Sort, GenericSort, Operation, Variable, Literal, Term,\
+    RewriteRule, NativeRule, Signature, budget
+from alpyne.exceptions import ReductionException
+from alpyne.profiling import Profiler
 
 
 class TestSort(unittest.TestCase):
@@ -96,6 +100,38 @@ class TestVariable(unittest.TestCase):
         self.assertEqual(type(term), Term)
 
 
+class TestLiteral(unittest.TestCase):
+
+    def test_instanciation(self):
+        sort = Sort('sort')
+        with self.assertRaises(AssertionError):
+            Literal('a', 3)  # Sort must be a sort.
+        lit = Literal('a', sort)
+        self.assertEqual(lit.value, 'a')
+        self.assertEqual(lit.sort, sort)
+
+    def test_equality(self):
+        sort = Sort('sort')
+        sort2 = Sort('sort2')
+        self.assertEqual(sort.literal('a'), sort.literal('a'))
+        self.assertNotEqual(sort.literal('a'), sort.literal('b'))
+        self.assertNotEqual(sort.literal('a'), sort2.literal('a'))
+
+    def test_str_representation(self):
+        sort = Sort('sort')
+        self.assertEqual(str(sort.literal('a')), "sort.'a'")
+
+    def test_match(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort,))
+        sort.variable('x')
+        matching, binding = sort.op(sort.x()).match(sort.op(sort.literal(1)))
+        self.assertTrue(matching)
+        self.assertEqual(binding[sort.x], sort.literal(1))
+        matching, _ = sort.literal(1).match(sort.literal(2))
+        self.assertFalse(matching)
+
+
 class TestTerm(unittest.TestCase):
 
     def test_instanciation(self):
@@ -165,6 +201,88 @@ class TestTerm(unittest.TestCase):
         self.assertEqual(type(t), Term)
         self.assertEqual(t.args[0].sort, sort2)
 
+    def test_compact_representation(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort,))
+        sort.variable('x')
+        term = sort.op(sort.x())
+        self.assertFalse(hasattr(term, '__dict__'))
+        self.assertFalse(hasattr(sort.op, '__dict__'))
+        self.assertFalse(hasattr(sort.x, '__dict__'))
+        self.assertEqual(term.sort, sort)
+
+    def test_hash(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort,))
+        sort.operation('const', ())
+        self.assertEqual(hash(sort.op(sort.const())),
+                         hash(sort.op(sort.const())))
+        self.assertEqual(len({sort.op(sort.const()), sort.op(sort.const()),
+                              sort.const()}), 2)
+
+    def test_deep_terms(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort,))
+        sort.operation('const', ())
+        sort.variable('x')
+        t1 = sort.const()
+        t2 = sort.const()
+        for _ in range(5000):
+            t1 = sort.op(t1)
+            t2 = sort.op(t2)
+        self.assertEqual(t1, t2)
+        self.assertTrue(str(t1).startswith('sort.op(sort.op('))
+        matching, binding = sort.op(sort.x()).match(t1)
+        self.assertTrue(matching)
+        self.assertEqual(binding[sort.x], t1.args[0])
+        self.assertEqual(sort.op(sort.x()).apply_binding(binding), t1)
+        sort.rewrite_rule(sort.op(sort.op(sort.x())), sort.op(sort.x()))
+        self.assertEqual(t1.reduce(sort.rewrite_rules), sort.op(sort.const()))
+
+        # The redexes built by a rule below the root of the terms it
+        # rewrites to are rewritten in the same pass, and counted as steps.
+        sort.operation('add', (sort, sort))
+        sort.variable('y')
+        rules = [RewriteRule(sort.add(sort.x(), sort.const()), sort.x()),
+                 RewriteRule(sort.add(sort.x(), sort.op(sort.y())),
+                             sort.op(sort.add(sort.x(), sort.y())))]
+        total = t1
+        for _ in range(5000):
+            total = sort.op(total)
+        with Profiler() as profiler:
+            self.assertEqual(sort.add(t1, t2).reduce(rules), total)
+        self.assertLessEqual(profiler.passes, 3)
+        with self.assertRaises(ReductionException):
+            sort.add(t1, t2).reduce(rules, max_steps=100)
+
+    def test_pretty(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort,))
+        sort.operation('pair', (sort, sort))
+        sort.operation('const', ())
+        term = sort.pair(sort.op(sort.op(sort.const())), sort.const())
+        self.assertEqual(term.pretty(),
+                         'sort.pair(sort.op^2(sort.const()), sort.const())')
+        self.assertEqual(term.pretty(abbreviate=False), str(term))
+        self.assertEqual(term.pretty(max_depth=1), 'sort.pair(..., ...)')
+        self.assertEqual(term.pretty(max_length=10), 'sort.pair(...')
+
+        sort.pretty_printer(lambda t: 'c' if t.head == sort.const else None)
+        self.assertEqual(term.pretty(), 'sort.pair(sort.op^2(c), c)')
+
+        deep = sort.const()
+        for _ in range(5000):
+            deep = sort.op(deep)
+        self.assertEqual(deep.pretty(max_length=20), 'sort.op^5000(c)')
+
+    def test_str_cache(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort,))
+        sort.operation('const', ())
+        term = sort.op(sort.const())
+        self.assertIs(str(term), str(term))
+        self.assertEqual(str(term), 'sort.op(sort.const())')
+
     def test_reduce(self):
         sort = Sort('sort')
         sort.operation('const', ())
@@ -178,6 +296,153 @@ class TestTerm(unittest.TestCase):
         t2 = t.reduce(sort.rewrite_rules)
         self.assertEqual(t2, sort.const())
 
+        for strategy in ('outermost', 'lazy'):
+            self.assertEqual(t.reduce(sort.rewrite_rules, strategy=strategy),
+                             sort.const())
+
+    def test_strategies(self):
+        sort = Sort('sort')
+        sort.operation('zero', ())
+        sort.operation('succ', (sort,))
+        sort.operation('loop', ())
+        sort.operation('first', (sort, sort))
+        sort.operation('double', (sort,))
+        sort.operation('count', (sort,))
+        sort.variable('x')
+        sort.variable('y')
+        calls = []
+
+        def count(binding, rewrite_rules):
+            calls.append(binding[sort.x])
+            return binding[sort.x]
+
+        sort.rewrite_rule(sort.first(sort.x(), sort.y()), sort.x())
+        sort.rewrite_rule(sort.loop(), sort.succ(sort.loop()))
+        sort.rewrite_rule(sort.double(sort.zero()), sort.zero())
+        sort.rewrite_rule(sort.double(sort.succ(sort.x())),
+                          sort.succ(sort.succ(sort.double(sort.x()))))
+        sort.native_rule(sort.count(sort.x()), count)
+        rules = sort.rewrite_rules
+        one = sort.succ(sort.zero())
+
+        # The discarded argument is never reduced.
+        term = sort.first(sort.double(one), sort.loop())
+        two = sort.succ(one)
+        self.assertEqual(term.reduce(rules, strategy='outermost'), two)
+        self.assertEqual(term.reduce(rules, strategy='lazy'), two)
+
+        # Equal subterms are only reduced once with the lazy strategy, and
+        # native rules get their arguments in normal form.
+        counted = sort.count(sort.double(one))
+        term = sort.first(sort.first(counted, counted), counted)
+        self.assertEqual(term.reduce(rules, strategy='lazy'), two)
+        self.assertEqual(calls, [two])
+
+        # Budgets apply to every strategy.
+        for strategy in ('outermost', 'lazy'):
+            with self.assertRaises(ReductionException):
+                sort.loop().reduce(rules, max_steps=10, strategy=strategy)
+
+        # The conditions of the rules are reduced with the same strategy.
+        sort.operation('g', (sort,))
+        conditional = [RewriteRule(sort.g(sort.x()), sort.zero(),
+                                   [(sort.first(sort.x(), sort.loop()),
+                                     sort.x())])] + rules
+        for strategy in ('outermost', 'lazy'):
+            self.assertEqual(sort.g(one).reduce(conditional, max_steps=100,
+                                                strategy=strategy),
+                             sort.zero())
+
+        # The rules indexed for a list are updated when it is modified in
+        # place.
+        first = sort.first(sort.zero(), one)
+        self.assertEqual(first.reduce(conditional, strategy='outermost'),
+                         sort.zero())
+        conditional[1] = RewriteRule(sort.first(sort.x(), sort.y()),
+                                     sort.y())
+        self.assertEqual(first.reduce(conditional, strategy='outermost'),
+                         one)
+
+    def test_custom_strategy(self):
+        sort = Sort('sort')
+        sort.operation('a', ())
+        sort.operation('b', ())
+        sort.operation('f', (sort,))
+        sort.variable('x')
+        sort.rewrite_rule(sort.a(), sort.b())
+        sort.rewrite_rule(sort.f(sort.x()), sort.x())
+        rules = sort.rewrite_rules
+
+        def root_only(term, rewrite_rules, rewrite):
+            for rule in rewrite_rules:
+                term = rewrite(rule, term)
+            return term
+
+        self.assertEqual(sort.f(sort.a()).reduce(rules, strategy=root_only),
+                         sort.a())
+        with self.assertRaises(AssertionError):
+            sort.a().reduce(rules, strategy='unknown')
+
+
+class TestSignature(unittest.TestCase):
+
+    def setUp(self):
+        self.num = num = Sort('num')
+        self.flag = flag = Sort('flag')
+        flag.operation('yes', ())
+        flag.operation('no', ())
+        flag.operation('not_', (flag,))
+        flag.variable('f')
+        flag.rewrite_rule(flag.not_(flag.yes()), flag.no())
+        flag.rewrite_rule(flag.not_(flag.no()), flag.yes())
+        num.operation('zero', ())
+        num.operation('succ', (num,))
+        num.operation('add', (num, num))
+        num.operation('is_zero', (num,), flag)
+        num.variable('x')
+        num.variable('y')
+        num.rewrite_rule(num.add(num.x(), num.zero()), num.x())
+        num.rewrite_rule(num.add(num.x(), num.succ(num.y())),
+                         num.succ(num.add(num.x(), num.y())))
+        num.rewrite_rule(num.is_zero(num.zero()), flag.yes())
+        num.rewrite_rule(num.is_zero(num.succ(num.x())),
+                         flag.not_(flag.yes()))
+        # The rules of flags are shared with nums.
+        num.rewrite_rules += flag.rewrite_rules
+
+    def test_instanciation(self):
+        with self.assertRaises(AssertionError):
+            Signature(self.num, 3)  # Signatures are composed of sorts.
+        signature = Signature(self.num, self.flag)
+        self.assertEqual(signature.sorts, [self.num, self.flag])
+        self.assertEqual(list(signature), self.num.rewrite_rules)
+        self.assertEqual(len(signature), 6)
+        self.assertIs(signature[4], self.flag.rewrite_rules[0])
+        self.assertEqual(str(signature), 'signature(num, flag)')
+
+    def test_reduce(self):
+        num, flag = self.num, self.flag
+        signature = Signature(num, flag)
+        two = num.succ(num.succ(num.zero()))
+        terms = [num.add(two, two), num.is_zero(num.add(two, num.zero())),
+                 flag.not_(num.is_zero(num.zero()))]
+        for term in terms:
+            for strategy in ('innermost', 'outermost', 'lazy'):
+                self.assertEqual(term.reduce(signature, strategy=strategy),
+                                 term.reduce(num.rewrite_rules))
+
+        # The rules on nums aren't tried on flags, and the rules on flags
+        # aren't tried on terms without flags.
+        with Profiler() as profiler:
+            num.add(two, two).reduce(signature)
+        self.assertEqual(set(profiler.rules), set(num.rewrite_rules[:2]))
+        with Profiler() as profiler:
+            flag.not_(flag.yes()).reduce(signature)
+        self.assertEqual(set(profiler.rules), set(flag.rewrite_rules))
+
+        with self.assertRaises(ReductionException):
+            num.add(two, two).reduce(signature, max_steps=1)
+
 
 class TestRewriteRule(unittest.TestCase):
 
@@ -228,6 +493,135 @@ class TestRewriteRule(unittest.TestCase):
         term2 = rule.apply(term)
         self.assertEqual(term2, sort.op2(sort.const()))
 
+    def test_native_rule(self):
+        sort = Sort('sort')
+        sort.operation('inc', (sort,))
+        sort.variable('x')
+
+        def inc(binding, rewrite_rules):
+            arg = binding[sort.x]
+            if arg.variables():
+                return None
+            return sort.literal(arg.head.value + 1)
+
+        rule = NativeRule(sort.inc(sort.x()), inc)
+        self.assertEqual(rule.apply(sort.inc(sort.inc(sort.literal(1)))),
+                         sort.literal(3))
+        self.assertEqual(rule.apply(sort.inc(sort.x())), sort.inc(sort.x()))
+        self.assertEqual(str(rule), 'sort.inc(sort.x) -> inc(...)')
+
+    def test_condition_cache(self):
+        sort = Sort('sort')
+        sort.operation('f', (sort,))
+        sort.operation('check', (sort,))
+        sort.operation('wrap', (sort,))
+        sort.operation('const', ())
+        sort.operation('yes', ())
+        sort.operation('no', ())
+        sort.variable('x')
+        calls = []
+
+        def check(binding, rewrite_rules):
+            calls.append(binding[sort.x])
+            return sort.yes()
+
+        # Both rules evaluate check(x) on the same binding.
+        sort.rewrite_rule(sort.f(sort.x()), sort.no(),
+                          [(sort.check(sort.x()), sort.no())])
+        sort.rewrite_rule(sort.f(sort.x()), sort.yes(),
+                          [(sort.check(sort.x()), sort.yes())])
+        sort.native_rule(sort.check(sort.x()), check)
+        rules = sort.rewrite_rules
+        self.assertEqual(sort.f(sort.const()).reduce(rules), sort.yes())
+        self.assertEqual(calls, [sort.const()])
+
+        # The cache only lasts for one normalization.
+        self.assertEqual(sort.wrap(sort.f(sort.const())).reduce(rules),
+                         sort.wrap(sort.yes()))
+        self.assertEqual(calls, [sort.const()] * 2)
+
+        with Profiler() as profiler:
+            sort.f(sort.const()).reduce(rules)
+        self.assertEqual(profiler.conditions, 2)
+        # check(const), no and yes are reduced once each.
+        self.assertEqual(profiler.condition_reductions, 3)
+        self.assertEqual(profiler.condition_hits, 1)
+
+    def test_max_steps(self):
+        sort = Sort('sort')
+        sort.operation('swap', (sort, sort))
+        sort.operation('a', ())
+        sort.operation('b', ())
+        sort.variable('x')
+        sort.variable('y')
+        sort.rewrite_rule(sort.swap(sort.x(), sort.y()),
+                          sort.swap(sort.y(), sort.x()))
+        term = sort.swap(sort.a(), sort.b())
+        with self.assertRaises(ReductionException) as context:
+            term.reduce(sort.rewrite_rules, max_steps=10)
+        self.assertEqual(context.exception.term, term)
+        self.assertEqual(context.exception.steps, 10)
+        self.assertEqual(context.exception.rules[-1], sort.rewrite_rules[0])
+        self.assertIn(str(term), str(context.exception))
+
+        sort.operation('f', (sort,))
+        sort.rewrite_rule(sort.f(sort.a()), sort.b())
+        self.assertEqual(sort.f(sort.a()).reduce(sort.rewrite_rules[1:],
+                                                 max_steps=1), sort.b())
+
+    def test_budget(self):
+        sort = Sort('sort')
+        sort.operation('swap', (sort, sort))
+        sort.operation('f', (sort,))
+        sort.operation('a', ())
+        sort.operation('b', ())
+        sort.variable('x')
+        sort.variable('y')
+        sort.rewrite_rule(sort.f(sort.a()), sort.b())
+        sort.rewrite_rule(sort.swap(sort.x(), sort.y()),
+                          sort.swap(sort.y(), sort.x()))
+        rules = sort.rewrite_rules
+
+        with self.assertRaises(ReductionException) as context:
+            sort.swap(sort.a(), sort.b()).reduce(rules, timeout=0.01)
+        self.assertGreaterEqual(context.exception.elapsed, 0.01)
+        self.assertGreater(context.exception.steps, 0)
+
+        # The time is checked even if no rule applies.
+        for rewrite_rules in (rules, Signature(sort)):
+            for strategy in ('innermost', 'outermost', 'lazy'):
+                with budget(timeout=0.01):
+                    time.sleep(0.02)
+                    with self.assertRaises(ReductionException) as context:
+                        sort.f(sort.b()).reduce(rewrite_rules,
+                                                strategy=strategy)
+                self.assertEqual(context.exception.steps, 0)
+
+        # Budgets are shared by the reductions of a context.
+        with budget(max_steps=2):
+            sort.f(sort.a()).reduce(rules)
+            sort.f(sort.a()).reduce(rules)
+            with self.assertRaises(ReductionException):
+                sort.f(sort.a()).reduce(rules)
+        # The budget of an enclosing context applies to limited reductions.
+        with budget(max_steps=1):
+            with self.assertRaises(ReductionException):
+                sort.swap(sort.a(), sort.b()).reduce(rules, max_steps=10)
+        self.assertEqual(sort.f(sort.a()).reduce(rules), sort.b())
+
+    def test_condition_order(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort, sort))
+        sort.operation('const', ())
+        sort.variable('x')
+        expensive = (sort.op(sort.op(sort.x(), sort.x()), sort.x()),
+                     sort.const())
+        cheap = (sort.x(), sort.const())
+        rule = RewriteRule(sort.op(sort.x(), sort.x()), sort.x(),
+                           [expensive, cheap])
+        self.assertEqual(rule.conditions, [expensive, cheap])
+        self.assertEqual(rule._ordered_conditions, [cheap, expensive])
+
     def test_generic_sort(self):
         generic = GenericSort()
         generic.variable('x')
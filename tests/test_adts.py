@@ -0,0 +1,122 @@
+import unittest
+from alpyne.adt import GenericSort
+from alpyne.adts.boolean import boolean
+from alpyne.adts.natural import nat
+from alpyne.adts.hashmap import hash_map
+from alpyne.adts.string import string, char, from_str
+from alpyne.apn import AlgebraicPetriNet
+
+
+class TestHashMap(unittest.TestCase):
+
+    rules = hash_map.rewrite_rules + nat.rewrite_rules
+
+    def test_normal_forms(self):
+        m = hash_map.add(hash_map.add(hash_map.empty(), nat.zero(),
+                                      boolean.true()),
+                         nat.add(nat.zero(), nat.zero()), boolean.false())
+        m = m.reduce(self.rules)
+        self.assertEqual(len(m.head.value), 1)
+        self.assertEqual(m.head.value[nat.zero()], boolean.false())
+        m2 = hash_map.delete(m, nat.zero()).reduce(self.rules)
+        self.assertEqual(m2, hash_map.empty())
+
+    def test_observers(self):
+        m = hash_map.add(hash_map.empty(), nat.succ(nat.zero()),
+                         nat.zero()).reduce(self.rules)
+        self.assertEqual(hash_map.get(m, nat.succ(nat.zero()))
+                         .reduce(self.rules), nat.zero())
+        self.assertEqual(hash_map.isempty(m).reduce(self.rules),
+                         boolean.false())
+        self.assertEqual(hash_map.isempty(hash_map.empty())
+                         .reduce(self.rules), boolean.true())
+        self.assertEqual(hash_map.equal(m, hash_map.empty())
+                         .reduce(self.rules), boolean.false())
+
+    def test_generic_variables(self):
+        # Other ADTs (like alpyne.adts.map) can declare generic variables
+        # with the same names after the hash maps.
+        generic = GenericSort()
+        previous = generic.k, generic.v
+        try:
+            generic.variable('k')
+            generic.variable('v')
+            m = hash_map.add(hash_map.empty(), nat.zero(), nat.zero())
+            self.assertEqual(hash_map.get(m, nat.zero()).reduce(self.rules),
+                             nat.zero())
+        finally:
+            generic.k, generic.v = previous
+
+    def test_tokens(self):
+        net = AlgebraicPetriNet('db', [], [], self.rules)
+        p = net.add_place('p', hash_map, [hash_map.empty()])
+        t = net.add_transition('t')
+        net.add_arc(p, t, [hash_map.m()])
+        net.add_arc(t, p, [hash_map.add(hash_map.m(), nat.zero(),
+                                        boolean.true())])
+        net.fire(t)
+        net.fire(t)
+        self.assertEqual(len(p.marking), 1)
+        self.assertEqual(p.marking[0].head.value[nat.zero()], boolean.true())
+
+
+class TestString(unittest.TestCase):
+
+    rules = string.rewrite_rules
+
+    def test_normal_forms(self):
+        s = string.append(string.append(string.empty(), char.a()), char.B())
+        self.assertEqual(s.reduce(self.rules), from_str('aB'))
+        self.assertEqual(from_str(''), string.empty())
+        self.assertEqual(string.concat(from_str('ab'), from_str('c_1'))
+                         .reduce(self.rules), from_str('abc_1'))
+        self.assertEqual(string.concat(from_str('ab'), string.empty())
+                         .reduce(self.rules), from_str('ab'))
+
+    def test_pretty(self):
+        s = string.append(string.append(string.empty(), char.a()), char.B())
+        self.assertEqual(s.pretty(), "'aB'")
+        self.assertEqual(string.append(from_str('ab'), char.c()).pretty(),
+                         "'abc'")
+        self.assertEqual(string.append(string.s(), char.a()).pretty(),
+                         "str.append(str.s, char.a())")
+        self.assertEqual(nat.succ(nat.succ(nat.zero())).pretty(), '2')
+        self.assertEqual(nat.add(nat.succ(nat.x()), nat.zero()).pretty(),
+                         'nat.add(nat.succ(nat.x), 0)')
+
+    def test_equal(self):
+        s = string.append(from_str('a'), char.b())
+        self.assertEqual(string.equal(s, from_str('ab')).reduce(self.rules),
+                         boolean.true())
+        self.assertEqual(string.equal(s, from_str('aB')).reduce(self.rules),
+                         boolean.false())
+        self.assertEqual(string.equal(string.empty(), string.empty())
+                         .reduce(self.rules), boolean.true())
+
+    def test_append_patterns(self):
+        matching, binding = string.append(string.s(), char.c1())\
+                                  .match(from_str('xyz'))
+        self.assertTrue(matching)
+        self.assertEqual(binding[string.s], from_str('xy'))
+        self.assertEqual(binding[char.c1], char.z())
+        matching, binding = string.append(string.s(), char.c1())\
+                                  .match(from_str('x'))
+        self.assertTrue(matching)
+        self.assertEqual(binding[string.s], string.empty())
+        matching, _ = string.append(string.s(), char.c1())\
+                            .match(from_str('x!'))
+        self.assertFalse(matching)
+
+    def test_tokens(self):
+        net = AlgebraicPetriNet('ids', [], [], self.rules)
+        p1 = net.add_place('p1', string, [from_str('id_1')])
+        p2 = net.add_place('p2', string, [])
+        t = net.add_transition('t')
+        net.add_arc(p1, t, [string.append(string.s(), char.c1())])
+        net.add_arc(t, p2, [string.concat(string.s(), from_str('_x'))])
+        net.fire(t)
+        self.assertEqual(p2.marking, [from_str('id__x')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from alpyne.adt import Sort, GenericSort, RewriteRule
+from alpyne.adts.map import kv_map
+from alpyne.analysis import unify, critical_pairs, non_left_linear,\
+    non_terminating, Analysis
+
+
+class TestAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        sort = Sort('sort')
+        sort.operation('zero', ())
+        sort.operation('one', ())
+        sort.operation('f', (sort,))
+        sort.operation('g', (sort, sort))
+        sort.variable('x')
+        sort.variable('y')
+        sort.variable('z')
+        self.sort = sort
+
+    def test_unify(self):
+        sort = self.sort
+        bindings = unify(sort.g(sort.x(), sort.f(sort.zero())),
+                         sort.g(sort.f(sort.y()), sort.y()))
+        self.assertEqual(bindings[sort.x], sort.f(sort.f(sort.zero())))
+        self.assertEqual(bindings[sort.y], sort.f(sort.zero()))
+        self.assertEqual(unify(sort.zero(), sort.zero()), {})
+        self.assertIsNone(unify(sort.f(sort.x()), sort.g(sort.x(),
+                                                         sort.y())))
+        # Occurs check.
+        self.assertIsNone(unify(sort.x(), sort.f(sort.x())))
+
+        # Variables only unify with terms of their sort.
+        other = Sort('other')
+        other.operation('const', ())
+        self.assertIsNone(unify(sort.x(), other.const()))
+        GenericSort().variable('any')
+        self.assertEqual(unify(GenericSort().any(), other.const()),
+                         {GenericSort().any: other.const()})
+        # Sorts that are only named like the generic sort aren't generic.
+        named = Sort('anysort')
+        named.variable('any')
+        self.assertIsNone(unify(named.any(), other.const()))
+
+    def test_critical_pairs(self):
+        sort = self.sort
+        rules = [RewriteRule(sort.f(sort.f(sort.x())), sort.x()),
+                 RewriteRule(sort.f(sort.zero()), sort.one())]
+        pairs = critical_pairs(rules)
+        # f(f(x)) overlaps with itself at position 0, and with f(zero).
+        self.assertEqual(len(pairs), 2)
+        pair = [p for p in pairs if p.rule2 is rules[1]][0]
+        self.assertEqual(pair.position, (0,))
+        self.assertEqual(pair.overlap, sort.f(sort.f(sort.zero())))
+        self.assertEqual(pair.left, sort.zero())
+        self.assertEqual(pair.right, sort.f(sort.one()))
+
+        analysis = Analysis(rules)
+        self.assertEqual([p.overlap for p in analysis.unjoinable()],
+                         [pair.overlap])
+        self.assertIn("1 not joinable", analysis.report())
+
+        # Joinable overlaps aren't reported.
+        rules.append(RewriteRule(sort.f(sort.one()), sort.zero()))
+        self.assertEqual(Analysis(rules).unjoinable(), [])
+
+    def test_non_left_linear(self):
+        sort = self.sort
+        rules = [RewriteRule(sort.g(sort.x(), sort.x()), sort.x()),
+                 RewriteRule(sort.g(sort.x(), sort.y()), sort.x())]
+        self.assertEqual(non_left_linear(rules), rules[:1])
+
+    def test_non_terminating(self):
+        sort = self.sort
+        rules = [RewriteRule(sort.g(sort.x(), sort.y()),
+                             sort.g(sort.y(), sort.x())),
+                 RewriteRule(sort.f(sort.x()), sort.f(sort.f(sort.x()))),
+                 RewriteRule(sort.f(sort.zero()), sort.y()),
+                 RewriteRule(sort.f(sort.one()), sort.zero())]
+        flagged = non_terminating(rules)
+        self.assertEqual([rule for rule, _ in flagged], rules[:3])
+
+    def test_map(self):
+        analysis = Analysis(kv_map.rewrite_rules)
+        # The rule making keys commute is flagged.
+        self.assertEqual(len(analysis.non_terminating), 1)
+        self.assertEqual(len(analysis.non_left_linear), 3)
+        self.assertTrue(analysis.critical_pairs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,10 @@
+import os
+import tempfile
 import unittest
-from alpyne.adt import Sort
+from alpyne.adt import Sort, RewriteRule
 from alpyne.apn import Place, Transition, Arc, AlgebraicPetriNet
-from alpyne.exceptions import ConsumeException, FiringException
+from alpyne.exceptions import ConsumeException, FiringException,\
+    FiringBudgetException
 
 
 class TestPlace(unittest.TestCase):
@@ -58,6 +61,123 @@ class TestPlace(unittest.TestCase):
         place.produce([sort.const()])
         self.assertEqual(place.marking, [sort.const()])
 
+    def test_occurrences(self):
+        sort = Sort('sort')
+        sort.operation('a', ())
+        sort.operation('b', ())
+        place = Place('place', sort, [sort.a(), sort.b(), sort.a()])
+        self.assertEqual(list(place.occurrences(sort.a())), [0, 2])
+        place.produce([sort.a()])
+        self.assertEqual(list(place.occurrences(sort.a())), [0, 2, 3])
+
+        # Duplicated tokens must all be in the marking to be consumed.
+        place.consume([sort.a(), sort.a()])
+        self.assertEqual(place.marking, [sort.b(), sort.a()])
+        with self.assertRaises(ConsumeException):
+            place.consume([sort.a(), sort.a()])
+        self.assertEqual(place.marking, [sort.b(), sort.a()])
+
+    def test_candidates(self):
+        sort = Sort('sort')
+        sort.operation('const', ())
+        sort.operation('op', (sort,))
+        sort.variable('x')
+        place = Place('place', sort, [sort.const(), sort.op(sort.const()),
+                                      sort.x(), sort.literal(1)])
+        self.assertEqual(list(place.candidates(sort.op(sort.x()))), [1, 2])
+        self.assertEqual(list(place.candidates(sort.x())), [0, 1, 2, 3])
+        self.assertEqual(list(place.candidates(sort.literal(2))), [2, 3])
+
+        # The indexes are updated when the marking changes.
+        place.produce([sort.op(sort.x()), sort.const()])
+        self.assertEqual(list(place.candidates(sort.op(sort.x()))),
+                         [1, 2, 4])
+        place.consume([sort.op(sort.const())])
+        self.assertEqual(list(place.candidates(sort.const())), [0, 1, 4])
+        place.marking = [sort.const()]
+        self.assertEqual(list(place.candidates(sort.op(sort.x()))), [])
+
+    def test_position_index(self):
+        sort = Sort('sort')
+        sort.operation('const', ())
+        sort.operation('op', (sort,))
+        sort.operation('pair', (sort, sort))
+        sort.variable('x')
+        tokens = [sort.pair(sort.literal(i), sort.const()) for i in range(5)]
+        place = Place('place', sort, tokens + [sort.pair(sort.x(),
+                                                         sort.const())])
+        place.index((0,))
+        self.assertEqual(list(place.candidates(
+            sort.pair(sort.literal(3), sort.x()))), [3, 5])
+        # Terms without a ground subterm at the position use the head index.
+        self.assertEqual(len(list(place.candidates(
+            sort.pair(sort.x(), sort.x())))), 6)
+        place.produce([sort.pair(sort.literal(3), sort.const())])
+        self.assertEqual(list(place.candidates(
+            sort.pair(sort.literal(3), sort.x()))), [3, 5, 6])
+
+
+    def test_consume_indexes(self):
+        sort = Sort('sort')
+        sort.operation('const', ())
+        sort.operation('op', (sort,))
+        sort.operation('pair', (sort, sort))
+        sort.variable('x')
+        tokens = [sort.pair(sort.literal(i % 3), sort.const())
+                  for i in range(6)] + [sort.op(sort.const()), sort.x()]
+        place = Place('place', sort, list(tokens))
+        place.index((0,))
+        patterns = [sort.pair(sort.literal(1), sort.x()), sort.op(sort.x()),
+                    sort.const(), sort.x()]
+        for pattern in patterns:
+            list(place.candidates(pattern))
+        place.occurrences(sort.const())
+
+        # The indexes are updated when tokens are consumed, and give the
+        # same candidates as indexes built from the new marking.
+        place.consume([sort.pair(sort.literal(1), sort.const()),
+                       sort.pair(sort.literal(0), sort.const())])
+        place.consume([sort.op(sort.const())])
+        self.assertIsNotNone(place._heads)
+        self.assertIsNotNone(place._values)
+        self.assertIsNotNone(place._positions[(0,)])
+        rebuilt = Place('rebuilt', sort, list(place.marking))
+        rebuilt.index((0,))
+        for pattern in patterns:
+            self.assertEqual(list(place.candidates(pattern)),
+                             list(rebuilt.candidates(pattern)))
+        for token in tokens:
+            self.assertEqual(list(place.occurrences(token)),
+                             list(rebuilt.occurrences(token)))
+
+    def test_marking_indexes(self):
+        sort = Sort('sort')
+        sort.operation('a', ())
+        sort.operation('b', ())
+        marking = [sort.a()]
+        p = Place('p', sort, marking)
+        t = Transition('t')
+        t.inbound_arc(p, [sort.b()])
+        self.assertFalse(t.fireable()[0])
+
+        # The indexes are rebuilt when the marking is assigned or modified
+        # in place, and assigned lists are copied.
+        p.marking = [sort.b()]
+        self.assertTrue(t.fireable()[0])
+        marking.append(sort.b())
+        self.assertEqual(p.marking, [sort.b()])
+        p.marking[0] = sort.a()
+        self.assertFalse(t.fireable()[0])
+        p.marking.append(sort.b())
+        self.assertTrue(t.fireable()[0])
+        p.marking.remove(sort.b())
+        self.assertFalse(t.fireable()[0])
+        p.marking += [sort.b()]
+        self.assertTrue(t.fireable()[0])
+        del p.marking[1]
+        self.assertFalse(t.fireable()[0])
+        self.assertEqual(p.marking, [sort.a()])
+
 
 class TestTransition(unittest.TestCase):
 
@@ -117,6 +237,24 @@ class TestTransition(unittest.TestCase):
         fireable, _ = t2.fireable()
         self.assertEqual(fireable, False)
 
+    def test_fireable_multiple_tokens(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort,))
+        sort.operation('const', ())
+        sort.variable('x')
+        sort.variable('y')
+        p = Place('p', sort, [sort.const(), sort.const()])
+        t1 = Transition('t1')
+        t2 = Transition('t2')
+        t3 = Transition('t3')
+        t1.inbound_arc(p, [sort.const(), sort.const()])
+        t2.inbound_arc(p, [sort.x(), sort.x(), sort.x()])
+        t3.inbound_arc(p, [sort.x(), sort.op(sort.y())])
+
+        self.assertTrue(t1.fireable()[0])
+        self.assertFalse(t2.fireable()[0])  # Tokens can't be matched twice.
+        self.assertFalse(t3.fireable()[0])
+
     def test_fire(self):
         sort = Sort('sort')
         sort.operation('op', (sort,))
@@ -171,6 +309,73 @@ class TestArc(unittest.TestCase):
  [sort.const(), ]')
 
 
+    def test_normal_forms(self):
+        sort = Sort('sort')
+        sort.operation('a', ())
+        sort.operation('b', ())
+        sort.variable('x')
+        p = Place('p', sort)
+        t = Transition('t')
+        self.assertIsNone(Arc(p, t, [sort.x()]).normal_forms([]))
+
+        arc = Arc(p, t, [sort.a(), sort.a()])
+        rules = [RewriteRule(sort.a(), sort.b())]
+        self.assertEqual(arc.normal_forms([]), [sort.a(), sort.a()])
+        self.assertEqual(arc.normal_forms(rules), [sort.b(), sort.b()])
+        # The normal forms are recomputed when rules are added.
+        sort.operation('c', ())
+        rules.append(RewriteRule(sort.b(), sort.c()))
+        self.assertEqual(arc.normal_forms(rules), [sort.c(), sort.c()])
+
+    def test_ground_label_fireable(self):
+        sort = Sort('sort')
+        sort.operation('a', ())
+        sort.operation('b', ())
+        p = Place('p', sort, [sort.b()])
+        t = Transition('t')
+        apn = AlgebraicPetriNet('apn', [p], [t])
+        apn.add_arc(p, t, [sort.a(), sort.a()])
+        self.assertFalse(t.fireable()[0])
+        p.produce([sort.b()])
+        self.assertFalse(t.fireable()[0])
+
+        # Rules added to the APN after its arcs are taken into account.
+        apn.rewrite_rules.append(RewriteRule(sort.a(), sort.b()))
+        self.assertTrue(t.fireable()[0])
+        apn.fire(t)
+        self.assertEqual(p.marking, [])
+
+    def test_ground_label_reassigned_rules(self):
+        sort = Sort('sort')
+        sort.operation('a', ())
+        sort.operation('b', ())
+        p = Place('p', sort, [sort.b()])
+        t = Transition('t')
+        apn = AlgebraicPetriNet('apn', [p], [t])
+        apn.add_arc(p, t, [sort.a()])
+        self.assertEqual(apn.fireables(), [])
+
+        # Rules assigned to the APN after its arcs are taken into account.
+        apn.rewrite_rules = [RewriteRule(sort.a(), sort.b())]
+        self.assertEqual(apn.fireables(), [t])
+        apn.rewrite_rules = []
+        self.assertEqual(apn.fireables(), [])
+
+        # Rules added to the list of the APN, or to the list of a sort used
+        # by the APN, are taken into account.
+        apn.rewrite_rules.append(RewriteRule(sort.a(), sort.b()))
+        self.assertEqual(apn.fireables(), [t])
+        apn.rewrite_rules = sort.rewrite_rules
+        self.assertEqual(apn.fireables(), [])
+        sort.rewrite_rules += [RewriteRule(sort.a(), sort.b())]
+        self.assertEqual(apn.fireables(), [t])
+
+        # Rules replaced in place require the list to be reassigned.
+        apn.rewrite_rules[0] = RewriteRule(sort.b(), sort.a())
+        apn.rewrite_rules = apn.rewrite_rules
+        self.assertEqual(apn.fireables(), [])
+
+
 class TestAlgebraicPetriNet(unittest.TestCase):
 
     def test_instanciation(self):
@@ -209,6 +414,8 @@ class TestAlgebraicPetriNet(unittest.TestCase):
         self.assertEqual(len(apn.places), 1)
         self.assertEqual(type(apn.places[0]), Place)
         self.assertEqual(apn.places[0], p)
+        # APNs don't share their default lists of places.
+        self.assertEqual(AlgebraicPetriNet('other').places, [])
 
     def test_add_transition(self):
         apn = AlgebraicPetriNet('apn', [], [])
@@ -284,6 +491,15 @@ class TestAlgebraicPetriNet(unittest.TestCase):
         apn.fire(t1)
         self.assertEqual(p.marking, [])
 
+        # Transitions appended directly to the APN can be fired.
+        t3 = Transition('t3')
+        t3.outbound_arc(p, [sort.const()])
+        apn.transitions.append(t3)
+        apn.fire(t3)
+        self.assertEqual(p.marking, [sort.const()])
+        with self.assertRaises(AssertionError):
+            apn.fire(Transition('t4'))
+
     def test_fire_random(self):
         sort = Sort('sort')
         sort.operation('op', (sort,))
@@ -299,6 +515,159 @@ class TestAlgebraicPetriNet(unittest.TestCase):
         apn.fire_random()
         self.assertEqual(p.marking, [])
 
+    def test_fire_budget(self):
+        sort = Sort('sort')
+        sort.operation('swap', (sort, sort))
+        sort.operation('const', ())
+        sort.operation('other', ())
+        sort.variable('x')
+        sort.variable('y')
+        sort.rewrite_rule(sort.swap(sort.x(), sort.y()),
+                          sort.swap(sort.y(), sort.x()))
+        apn = AlgebraicPetriNet('apn', [], [], sort.rewrite_rules)
+        p = apn.add_place('p', sort, [sort.const()])
+        q = apn.add_place('q', sort, [])
+        t = apn.add_transition('t')
+        apn.add_arc(p, t, [sort.x()])
+        apn.add_arc(t, q, [sort.swap(sort.x(), sort.other())])
+
+        with self.assertRaises(FiringBudgetException) as context:
+            apn.fire(t, max_steps=100)
+        self.assertIs(context.exception.transition, t)
+        self.assertEqual(context.exception.steps, 100)
+        self.assertEqual(context.exception.reduction.term,
+                         sort.swap(sort.const(), sort.other()))
+        # The tokens consumed before the firing was aborted are restored.
+        self.assertEqual(p.marking, [sort.const()])
+        self.assertEqual(q.marking, [])
+
+        with self.assertRaises(FiringBudgetException):
+            apn.fire_random(timeout=0.01)
+        self.assertEqual(p.marking, [sort.const()])
+
+    def test_strategy(self):
+        sort = Sort('sort')
+        sort.operation('const', ())
+        sort.operation('loop', ())
+        sort.operation('first', (sort, sort))
+        sort.variable('x')
+        sort.variable('y')
+        sort.rewrite_rule(sort.loop(), sort.first(sort.loop(), sort.loop()))
+        sort.rewrite_rule(sort.first(sort.x(), sort.y()), sort.x())
+        apn = AlgebraicPetriNet('apn', [], [], sort.rewrite_rules)
+        p = apn.add_place('p', sort, [sort.const()])
+        q = apn.add_place('q', sort, [])
+        t = apn.add_transition('t')
+        apn.add_arc(p, t, [sort.x()])
+        apn.add_arc(t, q, [sort.first(sort.x(), sort.loop())])
+
+        apn.strategy = 'lazy'
+        apn.fire(t, max_steps=100)
+        self.assertEqual(q.marking, [sort.const()])
+
+    def test_step(self):
+        sort = Sort('sort')
+        sort.operation('const', ())
+        apn = AlgebraicPetriNet('apn', [], [])
+        p1 = apn.add_place('p1', sort, [sort.const()] * 3)
+        p2 = apn.add_place('p2', sort, [])
+        transitions = [apn.add_transition('t{}'.format(i)) for i in range(4)]
+        for t in transitions:
+            apn.add_arc(p1, t, [sort.const()])
+            apn.add_arc(t, p2, [sort.const()])
+        # p2 is only filled at the end of the step.
+        apn.add_arc(p2, transitions[3], [sort.const()])
+
+        fired = apn.step('ordered')
+        self.assertEqual([t for t, _ in fired], transitions[:3])
+        self.assertEqual(p1.marking, [])
+        self.assertEqual(p2.marking, [sort.const()] * 3)
+
+        p1.marking = [sort.const()]
+        fired = apn.step(lambda ts: list(reversed(ts)))
+        self.assertEqual([t for t, _ in fired], [transitions[3]])
+        self.assertEqual(len(apn.step()), 0)
+
+    def test_fireable_claimed(self):
+        sort = Sort('sort')
+        sort.operation('const', ())
+        apn = AlgebraicPetriNet('apn', [], [])
+        p = apn.add_place('p', sort, [sort.const()] * 2)
+        t = apn.add_transition('t')
+        apn.add_arc(p, t, [sort.const()])
+        claimed = {}
+        self.assertTrue(t.fireable(claimed)[0])
+        self.assertEqual(claimed, {p: {0}})
+        self.assertTrue(t.fireable(claimed)[0])
+        self.assertFalse(t.fireable(claimed)[0])
+        self.assertEqual(claimed, {p: {0, 1}})
+
+    def test_snapshot(self):
+        sort = Sort('sort')
+        sort.operation('const', ())
+        apn = AlgebraicPetriNet('apn', [], [])
+        p1 = apn.add_place('p1', sort, [sort.const()])
+        p2 = apn.add_place('p2', sort, [])
+        p3 = apn.add_place('p3', sort, [sort.const()])
+        t = apn.add_transition('t')
+        apn.add_arc(p1, t, [sort.const()])
+        apn.add_arc(t, p2, [sort.const()])
+
+        initial = apn.snapshot()
+        self.assertEqual(initial[p1], (sort.const(),))
+        self.assertIs(apn.snapshot(), initial)
+        apn.fire(t)
+        fired = apn.snapshot()
+        self.assertEqual(len(list(initial.diff(fired))), 2)
+
+        marking = p3.marking
+        apn.restore(initial)
+        self.assertEqual(p1.marking, [sort.const()])
+        self.assertEqual(p2.marking, [])
+        self.assertIs(p3.marking, marking)
+        apn.fire(t)
+        p3.marking = []
+        apn.restore(fired)
+        self.assertEqual(p2.marking, [sort.const()])
+        self.assertEqual(p3.marking, [sort.const()])
+
+    def test_visualise_stream(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort,))
+        sort.operation('const', ())
+        apn = AlgebraicPetriNet('apn', [], [])
+        deep = sort.const()
+        for i in range(100):
+            deep = sort.op(deep)
+        p1 = apn.add_place('p1', sort, [sort.const()] * 3 + [deep])
+        p2 = apn.add_place('p2', sort, [])
+        p3 = apn.add_place('p3', sort, [])
+        t1 = apn.add_transition('t1')
+        t2 = apn.add_transition('t2')
+        apn.add_arc(p1, t1, [sort.const()])
+        apn.add_arc(t1, p2, [sort.const()])
+        apn.add_arc(p2, t2, [sort.const()])
+        apn.add_arc(t2, p3, [sort.const()])
+
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'apn.dot')
+            apn.visualise(filepath, stream=True, transitions=[t1])
+            with open(filepath) as dot:
+                text = dot.read()
+            self.assertTrue(text.startswith('digraph "apn" {'))
+            self.assertIn('3 x sort.const()', text)
+            self.assertIn('sort.op^100(sort.const())', text)
+            self.assertIn('"p2"', text)
+            self.assertNotIn('"p3"', text)
+            self.assertNotIn('"t2"', text)
+
+            apn.visualise(filepath, stream=True, transitions=[t1], radius=2,
+                          max_tokens=1)
+            with open(filepath) as dot:
+                text = dot.read()
+            self.assertIn('"p3"', text)
+            self.assertIn('... (1 more)', text)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,55 @@
+import random
+import unittest
+from alpyne import generators
+from alpyne.adts.natural import nat
+
+
+class TestGenerators(unittest.TestCase):
+
+    def test_dining_philosophers(self):
+        net = generators.dining_philosophers(5)
+        self.assertEqual(len(net.places), 15)
+        self.assertEqual(len(net.transitions), 10)
+        self.assertEqual(len(net.fireables()), 5)
+
+    def test_token_ring(self):
+        net = generators.token_ring(4)
+        for _ in range(4):
+            net.fire_random()
+        self.assertEqual(net.places[0].marking,
+                         [nat.succ(nat.succ(nat.succ(nat.succ(nat.zero()))))])
+
+    def test_readers_writers(self):
+        net = generators.readers_writers(3, 1)
+        writer = [t for t in net.transitions if t.name == 'writer_start_0'][0]
+        net.fire(writer)
+        self.assertEqual(net.places[0].marking, [])
+        self.assertEqual([t.name for t in net.fireables()], ['writer_end_0'])
+
+    def test_pipeline(self):
+        net = generators.pipeline(3, 2)
+        self.assertEqual(len(net.places), 4)
+        for _ in range(6):
+            net.fire_random()
+        self.assertEqual(len(net.places[-1].marking), 2)
+
+    def test_producer_consumer(self):
+        net = generators.producer_consumer(2, 3)
+        self.assertEqual(len(net.transitions), 5)
+        self.assertEqual(len(net.fireables()), 2)
+
+    def test_database(self):
+        random.seed(0)
+        net = generators.database(3)
+        for _ in range(20):
+            net.fire_random()
+        db = net.places[0].marking[0]
+        self.assertEqual(len(db.head.value), 3)
+
+    def test_large_nets(self):
+        net = generators.dining_philosophers(2000)
+        self.assertEqual(len(net.places), 6000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from alpyne.persistent import PersistentMap
+
+
+class Collision(object):
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return type(other) == Collision and self.value == other.value
+
+    def __hash__(self):
+        return 42
+
+
+class TestPersistentMap(unittest.TestCase):
+
+    def test_instanciation(self):
+        m = PersistentMap({'a': 1, 'b': 2})
+        self.assertEqual(len(m), 2)
+        self.assertEqual(m['a'], 1)
+        self.assertEqual(m.get('c'), None)
+        self.assertFalse(PersistentMap())
+
+    def test_set(self):
+        m1 = PersistentMap()
+        m2 = m1.set('a', 1)
+        m3 = m2.set('a', 2)
+        self.assertEqual(len(m1), 0)
+        self.assertEqual(m2['a'], 1)
+        self.assertEqual(m3['a'], 2)
+        self.assertEqual(len(m3), 1)
+        self.assertIs(m3.set('a', 2), m3)
+
+    def test_delete(self):
+        m1 = PersistentMap((i, i) for i in range(1000))
+        m2 = m1
+        for i in range(0, 1000, 2):
+            m2 = m2.delete(i)
+        self.assertEqual(len(m1), 1000)
+        self.assertEqual(len(m2), 500)
+        self.assertNotIn(2, m2)
+        self.assertIn(3, m2)
+        self.assertEqual(sorted(m2), list(range(1, 1000, 2)))
+        self.assertIs(m2.delete(2), m2)
+
+    def test_collisions(self):
+        m = PersistentMap([(Collision(1), 'a'), (Collision(2), 'b')])
+        self.assertEqual(m[Collision(1)], 'a')
+        self.assertEqual(m[Collision(2)], 'b')
+        m = m.delete(Collision(1))
+        self.assertEqual(len(m), 1)
+        self.assertNotIn(Collision(1), m)
+        self.assertEqual(m[Collision(2)], 'b')
+
+    def test_diff(self):
+        m1 = PersistentMap((i, i) for i in range(1000))
+        m2 = m1.set(3, 'a').delete(5).set(1000, 1000)
+        self.assertEqual(sorted(m1.diff(m2), key=lambda d: d[0]),
+                         [(3, 3, 'a'), (5, 5, None), (1000, None, 1000)])
+        self.assertEqual(list(m1.diff(m1)), [])
+        self.assertEqual(list(m1.diff(PersistentMap(m1.items()))), [])
+
+        m3 = PersistentMap([(Collision(1), 'a'), (Collision(2), 'b')])
+        m4 = m3.set(Collision(2), 'c')
+        self.assertEqual(list(m3.diff(m4)), [(Collision(2), 'b', 'c')])
+
+    def test_equality(self):
+        m1 = PersistentMap((i, str(i)) for i in range(100))
+        m2 = PersistentMap((i, str(i)) for i in reversed(range(100)))
+        self.assertEqual(m1, m2)
+        self.assertEqual(hash(m1), hash(m2))
+        self.assertNotEqual(m1, m2.set(0, 'zero'))
+        self.assertEqual(m1.delete(5).set(5, '5'), m1)
+
+
+if __name__ == "__main__":
+    unittest.main()
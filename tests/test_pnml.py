@@ -0,0 +1,145 @@
+import io
+import os
+import tempfile
+import unittest
+from alpyne.adt import Sort, Variable
+from alpyne.adts.hashmap import hash_map
+from alpyne.adts.natural import nat
+from alpyne.adts.string import string, from_str
+from alpyne.exceptions import PNMLException
+from alpyne.generators import database, token_ring
+from alpyne import pnml
+
+PT_NET = b"""<?xml version="1.0"?>
+<pnml xmlns="http://www.pnml.org/version-2009/grammar/pnml">
+  <net id="n" type="http://www.pnml.org/version-2009/grammar/ptnet">
+    <name><text>ptnet</text></name>
+    <page id="page">
+      <arc id="a0" source="p0" target="t0">
+        <inscription><text>2</text></inscription>
+      </arc>
+      <arc id="a1" source="t0" target="p1"/>
+      <place id="p0">
+        <name><text>in</text></name>
+        <initialMarking><text>3</text></initialMarking>
+      </place>
+      <place id="p1"><name><text>out</text></name></place>
+      <transition id="t0"><name><text>move</text></name></transition>
+    </page>
+  </net>
+</pnml>
+"""
+
+
+class TestPNML(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.directory.name, 'net.pnml')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_parse_term(self):
+        signature = pnml.PNMLSignature([nat, hash_map, string])
+        terms = [nat.add(nat.succ(nat.zero()), nat.x()),
+                 nat.equal(nat.zero(), nat.zero()),
+                 from_str("it's"),
+                 hash_map.literal(hash_map.add(hash_map.empty(),
+                                               from_str('a'), nat.zero())
+                                  .reduce(hash_map.rewrite_rules)
+                                  .head.value)]
+        for term in terms:
+            self.assertEqual(pnml.parse_term(str(term), signature), term)
+
+        deep = nat.zero()
+        for i in range(5000):
+            deep = nat.succ(deep)
+        self.assertEqual(pnml.parse_term(str(deep), signature), deep)
+
+        with self.assertRaises(PNMLException):
+            pnml.parse_term('nat.unknown()', signature)
+        with self.assertRaises(PNMLException):
+            pnml.parse_term('nat.succ(nat.zero()', signature)
+
+    def test_round_trip(self):
+        net = token_ring(3, tokens=2)
+        net.fire_random()
+        pnml.dump(self.filepath, net)
+        loaded = pnml.load(self.filepath, [nat], nat.rewrite_rules)
+
+        self.assertEqual(loaded.name, net.name)
+        self.assertEqual([p.name for p in loaded.places],
+                         [p.name for p in net.places])
+        self.assertEqual([p.marking for p in loaded.places],
+                         [p.marking for p in net.places])
+        self.assertEqual([str(a.label) for t in loaded.transitions
+                          for a in t.inbound_arcs + t.outbound_arcs],
+                         [str(a.label) for t in net.transitions
+                          for a in t.inbound_arcs + t.outbound_arcs])
+        loaded.fire_random()
+
+    def test_label_variables(self):
+        net = token_ring(2)
+        z = Variable('z', nat)
+        place = net.add_place('counter', nat, [nat.zero()])
+        t = net.add_transition('count')
+        net.add_arc(place, t, [z()])
+        net.add_arc(t, place, [nat.succ(z())])
+        pnml.dump(self.filepath, net)
+
+        loaded = pnml.load(self.filepath, [nat], nat.rewrite_rules)
+        arc = loaded.transitions[-1].inbound_arcs[0]
+        self.assertEqual(str(arc.label[0]), 'nat.z')
+        self.assertIsNot(arc.label[0].head, z)
+        self.assertNotIn('z', nat.__dict__)  # Bound sorts are unchanged.
+        loaded.fire(loaded.transitions[-1])
+        self.assertEqual(loaded.places[-1].marking, [nat.succ(nat.zero())])
+
+    def test_literals(self):
+        net = database(2)
+        pnml.dump(self.filepath, net)
+        loaded = pnml.load(self.filepath, [hash_map, nat, string],
+                          net.rewrite_rules)
+        self.assertEqual(loaded.places[0].marking, net.places[0].marking)
+        loaded.fire(loaded.transitions[0])
+
+    def test_declarations(self):
+        sort = Sort('colour')
+        sort.operation('red', ())
+        sort.operation('mix', (sort, sort))
+        sort.variable('c')
+        net = token_ring(1)
+        place = net.add_place('colours', sort, [sort.mix(sort.red(),
+                                                         sort.red())])
+        t = net.add_transition('t')
+        net.add_arc(place, t, [sort.c()])
+        pnml.dump(self.filepath, net)
+
+        loaded = pnml.load(self.filepath, [nat])
+        colours = loaded.places[1]
+        self.assertIsNot(colours.sort, sort)
+        self.assertEqual(colours.sort.name, 'colour')
+        self.assertEqual(str(colours.marking[0]),
+                         'colour.mix(colour.red(), colour.red())')
+        self.assertEqual(colours.marking[0].head, colours.sort.mix)
+        self.assertEqual(loaded.transitions[1].inbound_arcs[0].label,
+                         [colours.sort.c()])
+
+    def test_pt_net(self):
+        net = pnml.load(io.BytesIO(PT_NET))
+        self.assertEqual(net.name, 'ptnet')
+        self.assertEqual(net.places[0].marking, [nat.zero()] * 3)
+        net.fire(net.transitions[0])
+        self.assertEqual(net.places[0].marking, [nat.zero()])
+        self.assertEqual(net.places[1].marking, [nat.zero()])
+
+    def test_invalid(self):
+        with self.assertRaises(PNMLException):
+            pnml.load(io.BytesIO(b'<pnml><net id="n">'))
+        with self.assertRaises(PNMLException):
+            pnml.load(io.BytesIO(b'<pnml></pnml>'))
+
+
+if __name__ == '__main__':
+    unittest.main()
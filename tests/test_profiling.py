@@ -0,0 +1,62 @@
+import unittest
+from alpyne.adt import Sort
+from alpyne.apn import AlgebraicPetriNet
+from alpyne.profiling import Profiler, active
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_enable(self):
+        self.assertIsNone(active())
+        with Profiler() as profiler:
+            self.assertIs(active(), profiler)
+            with Profiler() as nested:
+                self.assertIs(active(), nested)
+            self.assertIs(active(), profiler)
+        self.assertIsNone(active())
+
+    def test_rules(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort,))
+        sort.operation('eq', (sort, sort))
+        sort.operation('const', ())
+        sort.variable('x')
+        sort.rewrite_rule(sort.op(sort.x()), sort.x(),
+                          [(sort.x(), sort.const())])
+        rule = sort.rewrite_rules[0]
+
+        with Profiler() as profiler:
+            sort.op(sort.op(sort.const())).reduce(sort.rewrite_rules)
+        stats = profiler.rule(rule)
+        self.assertEqual(stats.fires, 2)
+        self.assertEqual(stats.matches, 2)
+        self.assertGreater(stats.attempts, 2)
+        self.assertGreaterEqual(profiler.reductions, 1)
+        self.assertEqual(profiler.hot_rules(1)[0][0], rule)
+
+        sort.op(sort.const()).reduce(sort.rewrite_rules)
+        self.assertEqual(stats.fires, 2)  # Disabled outside of the context.
+
+    def test_transitions(self):
+        sort = Sort('sort')
+        sort.operation('const', ())
+        sort.variable('x')
+        apn = AlgebraicPetriNet('apn', [], [])
+        p = apn.add_place('p', sort, [sort.const()])
+        t = apn.add_transition('t')
+        apn.add_arc(p, t, [sort.x()])
+        apn.add_arc(t, p, [sort.x()])
+
+        with Profiler() as profiler:
+            apn.fire_random()
+            apn.fire(t)
+        stats = profiler.transition(t)
+        self.assertEqual(stats.fires, 2)
+        self.assertEqual(stats.checks, 3)
+        self.assertEqual(stats.fireable, 3)
+        self.assertEqual(stats.bindings, 3)
+        self.assertIn(' t', profiler.report())
+
+
+if __name__ == "__main__":
+    unittest.main()
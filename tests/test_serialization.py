@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from alpyne.adt import Sort, Term
+from alpyne.adts.boolean import boolean
+from alpyne.adts.hashmap import hash_map
+from alpyne.adts.natural import nat
+from alpyne.adts.string import string, char, from_str
+from alpyne.apn import AlgebraicPetriNet
+from alpyne.exceptions import SerializationException
+from alpyne import serialization
+
+
+class TestSerialization(unittest.TestCase):
+
+    def test_sorts(self):
+        sort = Sort('sort')
+        sort.operation('op', (sort,))
+        sort.operation('const', ())
+        sort.variable('x')
+        sort.rewrite_rule(sort.op(sort.x()), sort.x(),
+                          [(sort.x(), sort.const())])
+        bundle = serialization.loads(serialization.dumps(sorts=[sort]))
+
+        loaded = bundle.sorts['sort']
+        self.assertIsNot(loaded, sort)
+        self.assertEqual(str(loaded.op(loaded.x())), 'sort.op(sort.x)')
+        self.assertEqual(len(loaded.rewrite_rules), 1)
+        self.assertEqual(str(loaded.rewrite_rules[0]),
+                         str(sort.rewrite_rules[0]))
+        self.assertEqual(loaded.op(loaded.const())
+                         .reduce(loaded.rewrite_rules), loaded.const())
+
+    def test_bound_sorts(self):
+        data = serialization.dumps(rules=string.rewrite_rules[:3])
+        bundle = serialization.loads(data, [string, char, boolean])
+        self.assertEqual(bundle.rules[0].function,
+                         string.rewrite_rules[0].function)
+        self.assertEqual(bundle.rules[0].lhs, string.rewrite_rules[0].lhs)
+
+    def test_net(self):
+        net = AlgebraicPetriNet('net', [], [],
+                                hash_map.rewrite_rules + nat.rewrite_rules)
+        token = hash_map.add(hash_map.empty(), from_str('key'),
+                             nat.zero()).reduce(net.rewrite_rules)
+        p = net.add_place('p', hash_map, [token, hash_map.empty()])
+        t = net.add_transition('t')
+        net.add_arc(p, t, [hash_map.m()])
+        net.add_arc(t, p, [hash_map.delete(hash_map.m(), from_str('key'))])
+
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'net.apyn')
+            serialization.dump(filepath, net=net)
+            bundle = serialization.load(filepath, [hash_map, nat, string])
+
+        loaded = bundle.net
+        self.assertEqual(loaded.name, 'net')
+        self.assertEqual(loaded.places[0].marking, p.marking)
+        self.assertEqual(len(loaded.rewrite_rules), len(net.rewrite_rules))
+        loaded.fire(loaded.transitions[0])
+        self.assertEqual(loaded.places[0].marking,
+                         [hash_map.empty(), hash_map.empty()])
+
+    def test_net_ground_labels(self):
+        rules = nat.rewrite_rules + boolean.rewrite_rules
+        net = AlgebraicPetriNet('net', [], [], rules)
+        p = net.add_place('p', boolean, [boolean.true()])
+        t = net.add_transition('t')
+        net.add_arc(p, t, [nat.equal(nat.zero(), nat.zero())])
+        net.add_arc(t, p, [boolean.false()])
+        self.assertEqual(net.fireables(), [t])
+
+        loaded = serialization.loads(serialization.dumps(net=net),
+                                     [nat, boolean]).net
+        self.assertEqual(loaded.fireables(), [loaded.transitions[0]])
+        loaded.fire(loaded.transitions[0])
+        self.assertEqual(loaded.places[0].marking, [boolean.false()])
+
+    def test_marking(self):
+        net = AlgebraicPetriNet('net', [], [])
+        deep = nat.zero()
+        for _ in range(5000):
+            deep = Term(nat.succ, (deep,))
+        p = net.add_place('p', nat, [deep, deep])
+        data = serialization.dumps_marking(net)
+        self.assertLess(len(data), 5000 * 4)  # Subterms are shared.
+        p.marking = []
+        serialization.loads_marking(net, data)
+        self.assertEqual(p.marking, [deep, deep])
+
+    def test_invalid_data(self):
+        with self.assertRaises(SerializationException):
+            serialization.loads(b'not a file')
+        data = serialization.dumps(sorts=[nat])
+        invalid = [b'', b'APYN', b'not a file', data[:4] + b'\x00',
+                   data[:len(data) // 2]]
+        for content in invalid:
+            with self.assertRaises(SerializationException):
+                serialization.loads(content)
+
+        # Memory mapped files are closed after invalid data.
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'invalid.apyn')
+            for content in invalid:
+                with open(filepath, 'wb') as output:
+                    output.write(content)
+                with self.assertRaises(SerializationException):
+                    serialization.load(filepath)
+
+
+if __name__ == "__main__":
+    unittest.main()
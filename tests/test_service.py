@@ -0,0 +1,172 @@
+import asyncio
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from alpyne.adt import Sort
+from alpyne.adts.hashmap import hash_map
+from alpyne.adts.natural import nat
+from alpyne.adts.string import string
+from alpyne.apn import AlgebraicPetriNet
+from alpyne.exceptions import ServiceException
+from alpyne.generators import database, pipeline, token_ring
+from alpyne.service import SimulationService, LocalClient, _sort_paths
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestSimulationService(unittest.TestCase):
+
+    def test_steps(self):
+        async def scenario():
+            service = SimulationService(slice_steps=3)
+            await service.start('ring', token_ring(5))
+            await service.start('pipeline', pipeline(3))
+            fired = await asyncio.gather(service.step('ring', 10),
+                                         service.step('pipeline', 10))
+            marking = await service.marking('pipeline')
+            status = await service.status('ring')
+            await service.close()
+            return fired, marking, status
+
+        fired, marking, status = run(scenario())
+        # The pipeline is deadlocked once its item reached the last buffer.
+        self.assertEqual(fired, [10, 3])
+        self.assertEqual(len(marking['buffer_3']), 1)
+        self.assertEqual(status, {'steps': 10, 'remaining': None,
+                                  'pending': 0, 'deadlocked': False})
+
+    def test_budget(self):
+        async def scenario():
+            service = SimulationService()
+            await service.start('ring', token_ring(3), budget=15)
+            fired = [await service.step('ring', 10) for _ in range(3)]
+            return fired, await service.status('ring')
+
+        fired, status = run(scenario())
+        self.assertEqual(fired, [10, 5, 0])
+        self.assertEqual(status['remaining'], 0)
+
+    def test_backpressure(self):
+        async def scenario():
+            service = SimulationService(queue_size=1, slice_steps=1)
+            await service.start('ring', token_ring(3))
+            requests = [asyncio.ensure_future(service.step('ring', 5))
+                        for _ in range(4)]
+            await asyncio.sleep(0)
+            # One request is served, one is queued and the others wait.
+            pending = (await service.status('ring'))['pending']
+            fired = await asyncio.gather(*requests)
+            await service.stop('ring')
+            return pending, fired
+
+        pending, fired = run(scenario())
+        self.assertEqual(pending, 1)
+        self.assertEqual(fired, [5] * 4)
+
+    def test_stop(self):
+        async def scenario():
+            service = SimulationService(queue_size=1, slice_steps=1)
+            await service.start('ring', token_ring(3))
+            requests = [asyncio.ensure_future(service.step('ring', 1000))
+                        for _ in range(3)]
+            for _ in range(3):
+                await asyncio.sleep(0)
+            # The first request is served, the second is queued and the
+            # third waits for room in the queue.
+            pending = (await service.status('ring'))['pending']
+            await service.stop('ring')
+            return pending, await asyncio.wait_for(
+                asyncio.gather(*requests, return_exceptions=True), 1)
+
+        pending, results = run(scenario())
+        self.assertEqual(pending, 1)
+        self.assertEqual([type(result) for result in results],
+                         [asyncio.CancelledError] * 3)
+
+    def test_offload(self):
+        async def scenario(executor):
+            service = SimulationService(executor)
+            await service.start('db', database(2), offload=True,
+                                sorts=[string])
+            fired = await service.step('db', 6)
+            marking = await service.marking('db')
+            await service.close()
+            return fired, marking
+
+        with ProcessPoolExecutor(1) as executor:
+            fired, marking = run(scenario(executor))
+        self.assertEqual(fired, 6)
+        self.assertEqual(len(marking['db']), 1)
+        self.assertIs(marking['db'][0].sort, hash_map)
+        for i in range(2):
+            self.assertEqual(len(marking['idle_{}'.format(i)]) +
+                             len(marking['written_{}'.format(i)]), 1)
+
+    def test_sort_paths(self):
+        # Sorts are found in the modules of their native rules, and sorts
+        # without native rules are recreated in the executor.
+        self.assertEqual(_sort_paths([hash_map, nat, string], []),
+                         ['alpyne.adts.hashmap:hash_map',
+                          'alpyne.adts.string:string'])
+        sort = Sort('sort')
+        sort.operation('const', ())
+        sort.native_rule(sort.const(), lambda binding, rules: None)
+        with self.assertRaises(ValueError):
+            _sort_paths([sort], [])
+
+    def test_errors(self):
+        sort = Sort('sort')
+        sort.operation('const', ())
+        sort.operation('fail', (sort,))
+        sort.variable('x')
+
+        def fail(binding, rewrite_rules):
+            raise ValueError("Cannot reduce")
+
+        sort.native_rule(sort.fail(sort.x()), fail)
+        net = AlgebraicPetriNet('net', [], [], sort.rewrite_rules)
+        p = net.add_place('p', sort, [sort.const(), sort.const()])
+        t = net.add_transition('t')
+        net.add_arc(p, t, [sort.x()])
+        net.add_arc(t, p, [sort.fail(sort.x())])
+
+        async def scenario():
+            service = SimulationService()
+            await service.start('net', net)
+            with self.assertRaises(ServiceException):
+                await service.step('net')
+            response = await service.handle({'action': 'step',
+                                             'name': 'net'})
+            # The worker keeps serving the requests of the net.
+            status = await service.status('net')
+            await service.close()
+            return response, status
+
+        response, status = run(scenario())
+        self.assertFalse(response['ok'])
+        self.assertIn("Cannot reduce", response['error'])
+        self.assertEqual(status['pending'], 0)
+
+    def test_local_client(self):
+        async def scenario():
+            client = LocalClient(SimulationService())
+            await client.start('ring', token_ring(2), budget=4)
+            fired = await client.step('ring', 3)
+            marking = await client.marking('ring')
+            with self.assertRaises(ServiceException):
+                await client.step('unknown')
+            with self.assertRaises(ServiceException):
+                await client.start('ring', token_ring(2))
+            await client.stop('ring')
+            return fired, marking
+
+        fired, marking = run(scenario())
+        self.assertEqual(fired, 3)
+        self.assertEqual(marking, {'node_0': [],
+                                   'node_1': ['nat.succ(nat.succ(nat.succ('
+                                              'nat.zero())))']})
+
+
+if __name__ == '__main__':
+    unittest.main()
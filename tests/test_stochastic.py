@@ -0,0 +1,58 @@
+import unittest
+from alpyne.adts.natural import nat
+from alpyne.apn import AlgebraicPetriNet
+from alpyne.generators import pipeline, token_ring
+from alpyne.profiling import Profiler
+from alpyne.stochastic import StochasticSimulator
+
+
+class TestStochasticSimulator(unittest.TestCase):
+
+    def race(self):
+        net = AlgebraicPetriNet('race', [], [], nat.rewrite_rules)
+        p = net.add_place('p', nat, [nat.zero()])
+        fast = net.add_transition('fast')
+        slow = net.add_transition('slow')
+        for t in (fast, slow):
+            net.add_arc(p, t, [nat.zero()])
+            net.add_arc(t, p, [nat.zero()])
+        return net, fast, slow
+
+    def test_rates(self):
+        net, fast, slow = self.race()
+        simulator = StochasticSimulator(net, rates={fast: 9.0, slow: 1.0},
+                                        seed=0)
+        fired = [simulator.step()[1] for _ in range(2000)]
+        self.assertTrue(0.85 < fired.count(fast) / 2000 < 0.95)
+        # The mean time between firings is 1 / (9 + 1).
+        self.assertTrue(150 < simulator.time < 250)
+
+    def test_delays(self):
+        net, fast, slow = self.race()
+        simulator = StochasticSimulator(net, rates={slow: 0},
+                                        delays={fast: lambda rng: 2.0})
+        self.assertEqual(simulator.run(until=7.0), 3)
+        self.assertEqual(simulator.time, 7.0)
+        self.assertEqual(simulator.next_time(), 8.0)
+        self.assertEqual(simulator.step()[:2], (8.0, fast))
+
+    def test_deadlock(self):
+        simulator = StochasticSimulator(pipeline(4), seed=1)
+        self.assertEqual(simulator.run(), 4)
+        self.assertIsNone(simulator.step())
+        self.assertIsNone(simulator.next_time())
+
+    def test_dependent_updates(self):
+        net = token_ring(200)
+        with Profiler() as profiler:
+            simulator = StochasticSimulator(net, seed=2)
+            simulator.run(steps=100)
+        checks = sum(s.checks for s in profiler.transitions.values())
+        # One check per transition initially, then the fired transition
+        # (when fired and rescheduled) and its successor at each step.
+        self.assertEqual(checks, 200 + 3 * 100)
+        self.assertEqual(len(net.places[100].marking), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import random
+import tempfile
+import unittest
+from alpyne.adts.string import string
+from alpyne.exceptions import ConsumeException, SerializationException
+from alpyne.generators import database, producer_consumer
+from alpyne.trace import TraceRecorder, read, replay
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.directory.name, 'run.trace')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def markings(self, net):
+        return [place.marking for place in net.places]
+
+    def test_record_and_replay(self):
+        random.seed(0)
+        net = producer_consumer(3, 2)
+        with TraceRecorder(net, self.filepath) as recorder:
+            fired = [net.fire_random() for _ in range(50)]
+        self.assertEqual(recorder.steps, 50)
+        self.assertIsNone(net.recorder)
+        net.fire_random()  # Not recorded.
+
+        steps = list(read(producer_consumer(3, 2), self.filepath))
+        self.assertEqual([(t.name, list(b.values())) for t, b in steps],
+                         [(t.name, list(b.values())) for t, b in fired])
+        # The recorded variables are bound to the ones of the labels of the
+        # net the trace is read on.
+        for transition, bindings in steps:
+            label = transition.inbound_arcs[0].label[0]
+            self.assertEqual(list(bindings), [label.head])
+
+        copy = producer_consumer(3, 2)
+        self.assertEqual(replay(copy, self.filepath), 50)
+        net = producer_consumer(3, 2)
+        for transition, bindings in fired:
+            net.fire(net.transitions[[t.name for t in net.transitions]
+                                     .index(transition.name)])
+        self.assertEqual(self.markings(copy), self.markings(net))
+
+    def test_literals(self):
+        random.seed(1)
+        net = database(3)
+        with TraceRecorder(net, self.filepath):
+            for _ in range(20):
+                net.fire_random()
+        copy = database(3)
+        replay(copy, self.filepath, [string])
+        self.assertEqual(self.markings(copy), self.markings(net))
+
+    def test_partial_replay(self):
+        net = producer_consumer(1)
+        with TraceRecorder(net, self.filepath):
+            for _ in range(5):
+                net.fire(net.transitions[0])
+        copy = producer_consumer(1)
+        self.assertEqual(replay(copy, self.filepath, steps=2), 2)
+        self.assertEqual(len(copy.places[0].marking), 2)
+        self.assertEqual(replay(copy, self.filepath, steps=0), 0)
+
+    def test_invalid_traces(self):
+        net = producer_consumer(1)
+        with TraceRecorder(net, self.filepath):
+            net.fire(net.transitions[0])
+            net.fire(net.transitions[1])
+        # The net isn't in the state where the trace was recorded anymore.
+        with self.assertRaises(ConsumeException):
+            replay(net, self.filepath)
+        with self.assertRaises(SerializationException):
+            replay(producer_consumer(2), self.filepath)
+
+        with open(self.filepath, 'r+b') as trace:
+            data = trace.read()
+            trace.seek(0)
+            trace.write(data[:-1])
+            trace.truncate()
+        with self.assertRaises(SerializationException):
+            replay(producer_consumer(1), self.filepath)
+
+
+if __name__ == '__main__':
+    unittest.main()
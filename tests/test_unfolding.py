@@ -0,0 +1,109 @@
+import unittest
+from alpyne import generators
+from alpyne.adt import Variable
+from alpyne.adts.boolean import boolean
+from alpyne.adts.natural import nat
+from alpyne.apn import AlgebraicPetriNet
+from alpyne.exceptions import UnfoldingException
+
+try:
+    import numpy as np
+    from alpyne.unfolding import unfold, constants, naturals
+except ImportError:
+    np = None
+
+
+def _counter(bound):
+    """
+    Build an APN counting up to a bound, and raising a flag at the bound.
+    """
+    rules = nat.rewrite_rules + boolean.rewrite_rules
+    net = AlgebraicPetriNet('counter', [], [], rules)
+    x = Variable('x', nat)
+    count = net.add_place('count', nat, [nat.zero()])
+    flag = net.add_place('flag', boolean, [boolean.false()])
+    increment = net.add_transition('increment')
+    net.add_arc(count, increment, [x()])
+    net.add_arc(flag, increment, [boolean.false()])
+    net.add_arc(increment, count, [nat.succ(x())])
+    bound = naturals(bound)[-1]
+    net.add_arc(increment, flag, [nat.equal(nat.succ(x()), bound)])
+    return net
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestUnfolding(unittest.TestCase):
+
+    def test_domains(self):
+        self.assertEqual(constants(boolean, boolean.rewrite_rules),
+                         [boolean.true(), boolean.false()])
+        self.assertEqual(naturals(2), [nat.zero(), nat.succ(nat.zero()),
+                                       nat.succ(nat.succ(nat.zero()))])
+
+    def test_unfold(self):
+        net = generators.dining_philosophers(3)
+        ptnet = unfold(net, {nat: naturals(0)})
+        self.assertEqual(len(ptnet.places), 9)
+        self.assertEqual(len(ptnet.transitions), 6)
+        self.assertEqual(ptnet.pre.shape, (6, 9))
+        self.assertEqual(ptnet.marking.tolist(), [1, 1, 1, 1, 0, 1, 0, 1, 0])
+        self.assertEqual(ptnet.fireables().tolist(), [0, 2, 4])
+
+        # Firing a transition of the unfolded net has the same effect as
+        # firing it in the APN.
+        transition, bindings = ptnet.transitions[2]
+        ptnet.fire(2)
+        net.fire(transition)
+        self.assertEqual(ptnet.to_marking(), net.marking())
+        self.assertEqual(ptnet.fireables().tolist(), [3])
+        with self.assertRaises(AssertionError):
+            ptnet.fire(0)
+
+        markings, complete = unfold(net, {nat: naturals(0)}).reachable()
+        self.assertTrue(complete)
+        self.assertEqual(markings.shape, (4, 9))
+        markings, complete = ptnet.reachable(max_states=2)
+        self.assertFalse(complete)
+        self.assertEqual(len(markings), 2)
+
+    def test_bindings(self):
+        net = _counter(3)
+        domains = {nat: naturals(3), boolean: constants(boolean)}
+        with self.assertRaises(UnfoldingException):
+            # succ(3) is produced from the marking (3, false).
+            unfold(net, domains)
+
+        ptnet = unfold(net, domains, strict=False)
+        self.assertEqual(len(ptnet.places), 6)
+        self.assertEqual([list(bindings.values()) for _, bindings
+                          in ptnet.transitions],
+                         [[value] for value in naturals(2)])
+        markings, complete = ptnet.reachable()
+        self.assertTrue(complete)
+        self.assertEqual(len(markings), 4)
+        final = ptnet.to_marking(markings[-1])
+        self.assertEqual(final[net.places[0]], [naturals(3)[-1]])
+        self.assertEqual(final[net.places[1]], [boolean.true()])
+
+    def test_errors(self):
+        net = _counter(3)
+        with self.assertRaises(UnfoldingException):
+            unfold(net, {nat: naturals(3)})  # No domain for booleans.
+        with self.assertRaises(UnfoldingException):
+            # The token of count isn't in the domain.
+            net.places[0].marking = [nat.succ(nat.zero())]
+            unfold(net, {nat: naturals(0), boolean: constants(boolean)},
+                   strict=False)
+
+        net = AlgebraicPetriNet('free', [], [], nat.rewrite_rules)
+        x = Variable('x', nat)
+        place = net.add_place('place', nat, [nat.zero()])
+        transition = net.add_transition('transition')
+        net.add_arc(place, transition, [nat.zero()])
+        net.add_arc(transition, place, [x()])
+        with self.assertRaises(UnfoldingException):
+            unfold(net, {nat: naturals(1)})
+
+
+if __name__ == "__main__":
+    unittest.main()